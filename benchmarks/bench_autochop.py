@@ -0,0 +1,70 @@
+"""
+.. module:: bench_autochop
+    :synopsis: Compares vectorized autochop window detection against the original per-element loop
+.. moduleauthor:: Duy Nguyen <dnguyen@nrao.edu>
+
+Usage (with gGui installed): python benchmarks/bench_autochop.py [--rows 5000000] [--interval 3600]
+"""
+
+import argparse
+import timeit
+
+import numpy
+
+from ggui.autochop import findObsWindows
+
+
+def legacy_chop_list(times, timeInterval):
+    """Original autochop loop, operating on a plain array rather than a Glue Data object"""
+    timeDifferences = numpy.diff(times)
+    obsWindows = []
+    obsStart = times[0]
+    for index, difference in enumerate(timeDifferences):
+        if difference > timeInterval:
+            obsWindows.append((index, obsStart, times[index]))
+            obsStart = times[index + 1]
+    obsWindows.append((len(times), obsStart, times[-1]))
+    return obsWindows
+
+
+def synthetic_times(rows: int, visit_length: float = 1600.0, bin_width: float = 10.0,
+                    visit_gap: float = 5400.0) -> numpy.ndarray:
+    """Builds a gPhoton-like t_mean column: evenly binned visits separated by orbital gaps
+
+    :param rows: Number of lightcurve rows to generate
+    :param visit_length: Duration of every visit, in seconds
+    :param bin_width: Lightcurve bin width, in seconds
+    :param visit_gap: Gap between consecutive visits, in seconds
+    :returns: Monotonically increasing array of mean times
+    """
+    bins_per_visit = int(visit_length // bin_width)
+    row_index = numpy.arange(rows)
+    visit_index = row_index // bins_per_visit
+    return 741111254.5 + row_index * bin_width + visit_index * visit_gap
+
+
+def main(user_arguments: list = None):
+    parser = argparse.ArgumentParser(description="Benchmark gGui autochop window detection")
+    parser.add_argument("--rows", type=int, default=5000000, help="Number of lightcurve rows")
+    parser.add_argument("--interval", type=float, default=3600.0, help="Gap threshold in seconds")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timing repetitions")
+    args = parser.parse_args(user_arguments)
+
+    times = synthetic_times(args.rows)
+
+    # Both implementations must agree before their timings mean anything
+    startIndices, endIndices, startTimes, endTimes = findObsWindows(times, args.interval)
+    legacy = legacy_chop_list(times, args.interval)
+    assert [window[1] for window in legacy] == startTimes.tolist()
+    assert [window[2] for window in legacy] == endTimes.tolist()
+
+    vectorized = min(timeit.repeat(lambda: findObsWindows(times, args.interval), number=1, repeat=args.repeat))
+    loop = min(timeit.repeat(lambda: legacy_chop_list(times, args.interval), number=1, repeat=args.repeat))
+    print("rows: {0:d}, windows: {1:d}".format(args.rows, len(startIndices)))
+    print("legacy loop:  {0:10.2f} ms".format(loop * 1e3))
+    print("vectorized:   {0:10.2f} ms".format(vectorized * 1e3))
+    print("speedup:      {0:10.1f}x".format(loop / vectorized))
+
+
+if __name__ == "__main__":
+    main()
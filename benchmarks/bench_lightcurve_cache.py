@@ -0,0 +1,94 @@
+"""
+.. module:: bench_lightcurve_cache
+    :synopsis: Compares loading a lightcurve CSV through Glue's data factories against the columnar lightcurve cache
+.. moduleauthor:: Duy Nguyen <dnguyen@nrao.edu>
+
+Usage (with gGui installed): python benchmarks/bench_lightcurve_cache.py [--rows 5000000] [--csv existing.csv] [--check_tutorial]
+The projected loads only read the lightcurve fields gGui uses, as TargetManager does. Every benchmarked CSV, and with
+--check_tutorial every lightcurve of the tutorial data, is first checked to load from the cache exactly as Glue loads it
+"""
+
+import argparse
+import glob
+import os
+import tempfile
+import time
+import zipfile
+
+import numpy
+
+from ggui.config import ggui_config
+from ggui.lightcurve_cache import LightcurveCache
+from synthetic_gphoton import write_lightcurve_csv
+
+# Tutorial data shipped with the docs, whose lightcurves are real gPhoton output
+TUTORIAL_ZIP = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'docs', 'ggui_tutorial_data2019-11-11.zip')
+
+
+def time_call(function, *args) -> float:
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def assert_matches_glue(cache: LightcurveCache, csv_path: str):
+    """Checks that a CSV loaded from the cache has the shape, columns, dtypes and values Glue's load_data gives it
+
+    :param cache: LightcurveCache to load the CSV from
+    :param csv_path: Path of the lightcurve CSV
+    :raises AssertionError: if the loaded data differ
+    """
+    from glue.core.data_factories import load_data
+
+    expected = load_data(csv_path)
+    cached = cache.load_data(csv_path)
+    assert cached.shape == expected.shape, '{0}: shape {1} != {2}'.format(csv_path, cached.shape, expected.shape)
+    expected_names = [component.label for component in expected.main_components]
+    cached_names = [component.label for component in cached.main_components]
+    assert cached_names == expected_names, '{0}: columns {1} != {2}'.format(csv_path, cached_names, expected_names)
+    for name in expected_names:
+        expected_values, cached_values = expected[name], cached[name]
+        assert cached_values.dtype == expected_values.dtype, '{0}: {1} dtype {2} != {3}'.format(
+            csv_path, name, cached_values.dtype, expected_values.dtype)
+        assert numpy.array_equal(cached_values, expected_values, equal_nan=expected_values.dtype.kind == 'f'), \
+            '{0}: {1} values differ'.format(csv_path, name)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000, help='Rows of the synthetic lightcurve')
+    parser.add_argument('--csv', help='Benchmark an existing lightcurve CSV instead of a synthetic one')
+    parser.add_argument('--check_tutorial', action='store_true', help='Also check every lightcurve of the tutorial data')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        if args.check_tutorial:
+            with zipfile.ZipFile(TUTORIAL_ZIP) as tutorial_zip:
+                tutorial_zip.extractall(os.path.join(scratch, 'tutorial'))
+            check_cache = LightcurveCache(os.path.join(scratch, 'check_cache'))
+            os.makedirs(check_cache.cache_path)
+            tutorial_csvs = sorted(glob.glob(os.path.join(scratch, 'tutorial', '**', '*.csv'), recursive=True))
+            for tutorial_csv in tutorial_csvs:
+                assert_matches_glue(check_cache, tutorial_csv)
+            print('{0:d} tutorial lightcurves match Glue'.format(len(tutorial_csvs)))
+        csv_path = args.csv
+        if not csv_path:
+            csv_path = os.path.join(scratch, 'synthetic_lightcurve.csv')
+            print('Writing {0:d} row lightcurve...'.format(args.rows))
+            write_lightcurve_csv(csv_path, args.rows)
+        print('CSV size: {0:.1f} MB'.format(os.path.getsize(csv_path) / 2 ** 20))
+        check_cache = LightcurveCache(os.path.join(scratch, 'benchmark_check_cache'))
+        os.makedirs(check_cache.cache_path)
+        assert_matches_glue(check_cache, csv_path)
+        cache = LightcurveCache(os.path.join(scratch, 'cache'))
+        os.makedirs(cache.cache_path)
+        projected_cache = LightcurveCache(os.path.join(scratch, 'projected_cache'))
+        os.makedirs(projected_cache.cache_path)
+        required_fields = list(ggui_config().required_fields('lightcurve'))
+
+        from glue.core.data_factories import load_data
+        print('Glue load_data:          {0:8.3f} s'.format(time_call(load_data, csv_path)))
+        print('First load (convert):    {0:8.3f} s'.format(time_call(cache.load_data, csv_path)))
+        print('Cached load:             {0:8.3f} s'.format(time_call(cache.load_data, csv_path)))
+        print('First projected load:    {0:8.3f} s'.format(time_call(projected_cache.load_data, csv_path, None, required_fields)))
+        print('Cached projected load:   {0:8.3f} s'.format(time_call(projected_cache.load_data, csv_path, None, required_fields)))
@@ -0,0 +1,116 @@
+"""
+.. module:: bench_startup
+    :synopsis: Measures gGui cold start: module import time and time until the window is shown and the first target is displayed
+.. moduleauthor:: Duy Nguyen <dnguyen@nrao.edu>
+
+Usage (with gGui and glue's Qt application installed):
+    python benchmarks/bench_startup.py [--runs 5] [--target_list tutorial.yaml] [--tree /path/to/other/checkout]
+Every run starts a fresh interpreter, so every import is a cold import. Pass --tree to measure another checkout of
+gGui (e.g. a 'git worktree' of an older revision) for comparison. Qt runs offscreen unless QT_QPA_PLATFORM is set
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Runs in the child interpreter: imports gGui, builds its window, and reports when each startup milestone is reached
+STARTUP_PROBE = r"""
+import inspect, json, sys, time
+start = time.perf_counter()
+import ggui.main
+imported = time.perf_counter()
+from PyQt5 import QtCore, QtWidgets
+
+marks = {}
+class StartupProbe(ggui.main.gGuiGlueApplication):
+    def showEvent(self, event):
+        marks.setdefault('window', time.perf_counter())
+        super().showEvent(event)
+
+def ready():
+    marks['ready'] = time.perf_counter()
+    QtWidgets.QApplication.instance().quit()
+
+catalog_paths = sys.argv[1:]
+if 'target_catalog_paths' in inspect.signature(ggui.main.gGuiGlueApplication.__init__).parameters:
+    ggui_app = StartupProbe(target_catalog_paths=catalog_paths)
+else:
+    # Older gGui validates catalogs before building its window
+    from ggui.catalog import validate_target_catalog_file
+    ggui_app = StartupProbe(imported_target_catalogs={path: validate_target_catalog_file(path) for path in catalog_paths})
+# Deferred startup work is queued ahead of this, so 'ready' marks the point gGui is fully usable
+QtCore.QTimer.singleShot(0, ready)
+ggui_app.start()
+print(json.dumps({'import': imported - start, 'window': marks['window'] - start, 'ready': marks['ready'] - start}))
+"""
+
+
+def child_environment(tree: str = None) -> dict:
+    """Builds the environment of a measured interpreter
+
+    :param tree: Checkout of gGui to import instead of the installed one
+    :returns: environment variables
+    """
+    environment = dict(os.environ)
+    environment.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    if tree:
+        environment['PYTHONPATH'] = os.pathsep.join(filter(None, [os.path.abspath(tree), environment.get('PYTHONPATH')]))
+    return environment
+
+
+def import_profile(module: str, tree: str = None) -> list:
+    """Imports a module in a fresh interpreter with -X importtime
+
+    :param module: Module to import
+    :param tree: Checkout of gGui to import instead of the installed one
+    :returns: list of (cumulative seconds, self seconds, module name) of every module imported, slowest first
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module], env=child_environment(tree),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    profile = []
+    for line in result.stderr.splitlines():
+        # Lines read: 'import time: self [us] | cumulative | imported package'
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        profile.append((int(cumulative_us) / 1e6, int(self_us) / 1e6, name.rstrip()))
+    return sorted(profile, reverse=True)
+
+
+def startup_times(catalog_paths: list, runs: int, tree: str = None) -> dict:
+    """Starts gGui in fresh interpreters and times its startup milestones
+
+    :param catalog_paths: gGui Target Catalogs to load on startup
+    :param runs: Number of cold starts
+    :param tree: Checkout of gGui to start instead of the installed one
+    :returns: dict of milestone to list of seconds since the start of the import, one per run
+    """
+    times = {'import': [], 'window': [], 'ready': []}
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-c', STARTUP_PROBE] + catalog_paths, env=child_environment(tree),
+                                stdout=subprocess.PIPE, universal_newlines=True, check=True, timeout=600)
+        for milestone, seconds in json.loads(result.stdout.strip().splitlines()[-1]).items():
+            times[milestone].append(seconds)
+    return times
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='Number of cold starts to time')
+    parser.add_argument('--target_list', nargs='*', default=[], help='gGui Target Catalogs to load on startup')
+    parser.add_argument('--tree', help='Checkout of gGui to measure instead of the installed one')
+    parser.add_argument('--top', type=int, default=15, help='Number of slowest imports to list')
+    args = parser.parse_args()
+
+    profile = import_profile('ggui.main', args.tree)
+    print('Slowest imports of ggui.main (cumulative / self seconds):')
+    for cumulative, own, name in profile[:args.top]:
+        print('  {0:7.3f} {1:7.3f} {2}'.format(cumulative, own, name))
+
+    times = startup_times([os.path.abspath(path) for path in args.target_list], args.runs, args.tree)
+    print('Cold start over {0:d} runs (median / min seconds):'.format(args.runs))
+    for milestone, label in (('import', 'import ggui.main'), ('window', 'window shown'), ('ready', 'first target displayed')):
+        print('  {0:24s} {1:7.3f} {2:7.3f}'.format(label, statistics.median(times[milestone]), min(times[milestone])))
@@ -0,0 +1,447 @@
+"""
+.. module:: bench_suite
+    :synopsis: Times catalog validation, catalog loading, target switching, overview viewer construction, autochop and
+        note saving on synthetic gPhoton data, and saves the results so versions can be compared
+.. moduleauthor:: Duy Nguyen <dnguyen@nrao.edu>
+
+Usage (with gGui and glue's Qt application installed):
+    python benchmarks/bench_suite.py [--catalog_sizes 10 1000 100000 1000000] [--repeat 3] [--output results.json]
+        [--compare baseline.json] [--data_dir synthetic_data]
+    python benchmarks/bench_suite.py --compare baseline.json --results other.json
+The first form runs the suite, saves its results, and compares them against a baseline if given. The second only
+compares two saved runs. To benchmark an older version, put its checkout first on PYTHONPATH.
+Synthetic data is written to --data_dir, and reused by later runs pointed at the same directory. gGui's caches start
+empty on every run, so the first visit to every product set is a cold load. Qt runs offscreen unless QT_QPA_PLATFORM is
+set. Benchmarks that need glue's Qt application are skipped, with the reason saved in the results, where it is missing.
+Autochop runs on a bare Glue DataCollection, so it is timed either way
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from synthetic_gphoton import product_set_files, write_catalog
+
+# Benchmarks slower than their baseline by more than this fraction count as regressions
+REGRESSION_TOLERANCE = 0.1
+
+# Gap threshold autochop is timed with, in seconds
+AUTOCHOP_INTERVAL = 3600.0
+
+# Seconds to wait for the viewers of a target switch to be drawn
+SWITCH_TIMEOUT = 120.0
+
+
+def time_runs(function, repeat: int, setup=None, teardown=None) -> list:
+    """Times a function
+
+    :param function: Function to time, taking the result of setup if given
+    :param repeat: Number of runs
+    :param setup: Untimed function run before every run. Its result is passed to function and teardown
+    :param teardown: Untimed function run after every run
+    :returns: list of seconds, one per run
+    """
+    seconds = []
+    for _ in range(repeat):
+        state = setup() if setup else None
+        start = time.perf_counter()
+        if setup:
+            function(state)
+        else:
+            function()
+        seconds.append(time.perf_counter() - start)
+        if teardown:
+            teardown(state)
+    return seconds
+
+
+def record(results: dict, name: str, seconds: list, **parameters):
+    """Adds the timings of a benchmark to the results, and prints them
+
+    :param results: Results of the run, see run_suite
+    :param name: Name of the benchmark, e.g. 'catalog_validation.yaml.1000'
+    :param seconds: Seconds of every run
+    :param parameters: Further facts to save with the timings, e.g. the number of targets
+    """
+    results['benchmarks'][name] = dict(parameters, seconds=[round(run, 6) for run in seconds],
+                                       median=round(statistics.median(seconds), 6), min=round(min(seconds), 6))
+    print('  {0:48s} {1:10.4f} {2:10.4f}'.format(name, statistics.median(seconds), min(seconds)))
+
+
+def skip(results: dict, name: str, reason: str):
+    """Records that a benchmark could not run, and prints why"""
+    results['skipped'][name] = reason
+    print('  {0:48s} skipped: {1}'.format(name, reason))
+
+
+def environment() -> dict:
+    """Describes what the suite runs on and which gGui it measures, so saved results can be told apart"""
+    import ggui
+    from ggui.version import __version__
+    import numpy
+
+    tree = os.path.dirname(os.path.dirname(os.path.abspath(ggui.__file__)))
+    try:
+        revision = subprocess.run(['git', '-C', tree, 'describe', '--always', '--dirty'], stdout=subprocess.PIPE,
+                                  stderr=subprocess.DEVNULL, universal_newlines=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    try:
+        from glue import __version__ as glue_version
+    except ImportError:
+        glue_version = None
+    return {'ggui_version': __version__, 'revision': revision, 'tree': tree, 'time': time.time(),
+            'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+            'numpy': numpy.__version__, 'glue': glue_version}
+
+
+def bench_catalog_validation(results: dict, catalogs: dict, repeat: int):
+    """Times validating YAML and opening SQLite catalogs of every size, and loading YAML catalogs from the parsed
+    catalog cache, as restoring a session does
+
+    :param results: Results of the run
+    :param catalogs: dict of (catalog format, number of targets) to catalog path
+    :param repeat: Number of runs of every benchmark
+    """
+    from ggui.catalog import validate_target_catalog_file
+    from ggui.session import ParsedCatalogCache
+
+    catalog_cache = ParsedCatalogCache()
+    for (catalog_format, targets), catalog_path in sorted(catalogs.items()):
+        def validate():
+            catalog = validate_target_catalog_file(catalog_path)
+            if hasattr(catalog, 'close'):
+                catalog.close()
+        record(results, 'catalog_validation.{0}.{1:d}'.format(catalog_format, targets), time_runs(validate, repeat), targets=targets)
+        if catalog_format == 'yaml':
+            catalog_cache.load(catalog_path)
+            record(results, 'catalog_cache_load.yaml.{0:d}'.format(targets), time_runs(lambda: catalog_cache.load(catalog_path), repeat),
+                   targets=targets)
+
+
+def bench_catalog_loading(results: dict, ggui_app, catalogs: dict, repeat: int):
+    """Times loadTargetDict, which also loads the catalog's first target, and saving notes, for catalogs of every size
+    Every run gets a new Target Manager and its own copy of the catalog, since saving notes rewrites YAML catalogs
+
+    :param results: Results of the run
+    :param ggui_app: gGui application whose data collection the Target Managers load into
+    :param catalogs: dict of (catalog format, number of targets) to catalog path
+    :param repeat: Number of runs of every benchmark
+    """
+    from PyQt5 import QtWidgets
+    from ggui.catalog import validate_target_catalog_file
+    from ggui.targetManager import TargetManager
+
+    for (catalog_format, targets), catalog_path in sorted(catalogs.items()):
+        load_seconds = []
+        note_seconds = []
+        for run in range(repeat):
+            # Product paths are relative, so the copy sits next to the products
+            copy_path = os.path.join(os.path.dirname(catalog_path), 'bench_copy_{0:d}.'.format(run) + catalog_format)
+            shutil.copyfile(catalog_path, copy_path)
+            try:
+                target_catalog = validate_target_catalog_file(copy_path)
+                target_manager = TargetManager(ggui_app)
+                start = time.perf_counter()
+                target_manager.loadTargetDict(copy_path, target_catalog)
+                load_seconds.append(time.perf_counter() - start)
+
+                # As the note display saves notes
+                start = time.perf_counter()
+                target_manager.setPrimaryNotes("Benchmark note {0:d}".format(run))
+                target_manager.flushSourceFile(target_manager.getPrimaryTargetCatalog())
+                note_seconds.append(time.perf_counter() - start)
+
+                target_manager.close()
+                target_manager.deleteLater()
+                if hasattr(target_catalog, 'close'):
+                    target_catalog.close()
+                ggui_app.data_collection.clear()
+                QtWidgets.QApplication.processEvents()
+            finally:
+                os.remove(copy_path)
+        record(results, 'load_target_dict.{0}.{1:d}'.format(catalog_format, targets), load_seconds, targets=targets)
+        record(results, 'note_saving.{0}.{1:d}'.format(catalog_format, targets), note_seconds, targets=targets)
+
+
+def bench_target_switching(results: dict, ggui_app, catalog_path: str, switches: int, product_sets: int):
+    """Switches through the targets of a catalog as a user would, and times every switch up to the first draw of its
+    viewers. Switches to a product set not visited before count as cold, others as warm.
+    The phases of every switch are timed too, where the gGui measured has switch timing
+
+    :param results: Results of the run
+    :param ggui_app: gGui application, with its overview tab
+    :param catalog_path: Catalog to switch through
+    :param switches: Number of switches
+    :param product_sets: Number of product sets the catalog's targets take turns pointing at
+    """
+    from PyQt5 import QtWidgets
+    from ggui.catalog import validate_target_catalog_file
+
+    try:
+        from ggui.timing import switch_timer
+    except ImportError:
+        switch_timer = None
+    finished = []
+    if switch_timer:
+        switch_timer().enable()
+        switch_timer().add_listener(finished.append)
+
+    def wait_for_switch():
+        deadline = time.perf_counter() + SWITCH_TIMEOUT
+        while switch_timer and not finished and time.perf_counter() < deadline:
+            QtWidgets.QApplication.processEvents()
+            time.sleep(0.001)
+        # Without switch timing, let any pending draws happen
+        QtWidgets.QApplication.processEvents()
+
+    target_manager = ggui_app.target_manager
+    start = time.perf_counter()
+    ggui_app.load_targets({catalog_path: validate_target_catalog_file(catalog_path)})
+    wait_for_switch()
+    record(results, 'load_first_target', [time.perf_counter() - start])
+
+    visited_sets = {0}
+    timings = {'cold': [], 'warm': []}
+    phases = {}
+    for switch in range(1, switches + 1):
+        row = switch % target_manager.QComboBox.count()
+        finished.clear()
+        start = time.perf_counter()
+        target_manager.QComboBox.setCurrentIndex(row)
+        wait_for_switch()
+        timings['warm' if row % product_sets in visited_sets else 'cold'].append(time.perf_counter() - start)
+        visited_sets.add(row % product_sets)
+        for target_switch in finished:
+            for phase, seconds in target_switch.phase_totals().items():
+                phases.setdefault(phase, []).append(seconds)
+    for temperature, seconds in timings.items():
+        if seconds:
+            record(results, 'target_switch.' + temperature, seconds)
+    for phase, seconds in phases.items():
+        record(results, 'target_switch.phase.' + phase, seconds)
+    if switch_timer:
+        switch_timer().disable()
+
+
+def bench_autochop(results: dict, lightcurve_paths: dict, repeat: int):
+    """Times autochopping a target's lightcurves, every band on its own and all bands at once, as
+    TargetManager.autochopPrimaryLightcurves does. Runs on a bare Glue DataCollection, so it needs no Qt
+
+    :param results: Results of the run
+    :param lightcurve_paths: Dict of band to lightcurve CSV path of the target
+    :param repeat: Number of runs of every benchmark
+    """
+    from glue.core import DataCollection
+    from glue.core.link_helpers import LinkSame
+    from ggui.autochop import lightcurveChopSubsets, lightcurveChopSubsetsMultiband
+    from ggui.config import ggui_config
+    from ggui.lightcurve_cache import LightcurveCache
+
+    fields = ggui_config().fields('lightcurve')
+    time_att = fields.x or 't_mean'
+    lightcurve_cache = LightcurveCache()
+    band_lightcurves = {band: lightcurve_cache.load_data(path, band) for band, path in lightcurve_paths.items()}
+    data_collection = DataCollection(list(band_lightcurves.values()))
+    # Bands are linked along the fields ggui.conf glues, as TargetManager links them on load
+    for glue_attribute in fields.glue:
+        for first_data, second_data in itertools.combinations(band_lightcurves.values(), 2):
+            data_collection.add_link(LinkSame(first_data.id[glue_attribute], second_data.id[glue_attribute]))
+
+    chops = []
+
+    def release(_=None):
+        for subset_group in chops:
+            data_collection.remove_subset_group(subset_group)
+        chops.clear()
+
+    rows = {band: int(band_data.size) for band, band_data in band_lightcurves.items()}
+    for band_mode in (None, 'union'):
+        def autochop():
+            if band_mode:
+                chops.extend(lightcurveChopSubsetsMultiband(data_collection, list(band_lightcurves.values()), time_att, AUTOCHOP_INTERVAL,
+                                                            band_mode, "AutoChop " + "+".join(band_lightcurves)))
+            else:
+                for band, band_data in band_lightcurves.items():
+                    chops.extend(lightcurveChopSubsets(data_collection, band_data, time_att, AUTOCHOP_INTERVAL, "AutoChop " + band))
+        seconds = time_runs(autochop, repeat, teardown=release)
+        autochop()
+        windows = len(chops)
+        release()
+        record(results, 'autochop.' + (band_mode or 'per_band'), seconds, rows=rows, windows=windows)
+
+
+def bench_overview(results: dict, ggui_app, repeat: int):
+    """Times rebuilding and drawing the overview viewers of the primary target
+
+    :param results: Results of the run
+    :param ggui_app: gGui application with a primary target loaded
+    :param repeat: Number of runs of every benchmark
+    """
+    from PyQt5 import QtWidgets
+
+    target_manager = ggui_app.target_manager
+    overview = ggui_app.overview_widget
+
+    def build_viewers():
+        overview.load_data(ggui_app.session, target_manager.getPrimaryName(), target_manager.getPrimaryData())
+
+    def draw_viewers():
+        for viewer in overview._initialized_viewers.values():
+            viewer.figure.canvas.draw()
+
+    def settle(_=None):
+        # Let the replaced viewers be deleted between runs
+        QtWidgets.QApplication.processEvents()
+
+    record(results, 'overview.construction', time_runs(build_viewers, repeat, teardown=settle))
+    record(results, 'overview.draw', time_runs(lambda _: draw_viewers(), repeat, setup=build_viewers, teardown=settle))
+
+
+def run_suite(data_dir: str, catalog_sizes: list, repeat: int, switches: int, product_sets: int, lightcurve_rows: int,
+              image_size: int, cube_frames: int) -> dict:
+    """Generates the synthetic data and runs every benchmark
+
+    :param data_dir: Directory of the synthetic data
+    :param catalog_sizes: Numbers of targets of the catalogs benchmarked
+    :param repeat: Number of runs of every benchmark
+    :param switches: Number of target switches
+    :param product_sets: Number of distinct sets of product files
+    :param lightcurve_rows: Rows of every lightcurve
+    :param image_size: Width and height of every coadd and cube, in pixels
+    :param cube_frames: Time frames of every cube
+    :returns: dict of 'environment', 'parameters', 'benchmarks' (name to timings) and 'skipped' (name to reason)
+    """
+    parameters = {'catalog_sizes': catalog_sizes, 'repeat': repeat, 'switches': switches, 'product_sets': product_sets,
+                  'lightcurve_rows': lightcurve_rows, 'image_size': image_size, 'cube_frames': cube_frames}
+    results = {'environment': environment(), 'parameters': parameters, 'benchmarks': {}, 'skipped': {}}
+
+    print('Writing synthetic data to ' + data_dir + '...')
+    catalogs = {(catalog_format, targets): write_catalog(data_dir, targets, catalog_format, product_sets, lightcurve_rows,
+                                                         image_size, cube_frames)
+                for targets in catalog_sizes for catalog_format in ('yaml', 'sqlite')}
+    switch_catalog = write_catalog(data_dir, max(product_sets * 2, 10), 'yaml', product_sets, lightcurve_rows, image_size, cube_frames)
+
+    print('Benchmark (median / min seconds):')
+    bench_catalog_validation(results, catalogs, repeat)
+    products = product_set_files(os.path.join(data_dir, 'products'), 0, lightcurve_rows, image_size, cube_frames)
+    bench_autochop(results, {band: os.path.join(data_dir, 'products', file_name) for band, file_name in products['lightcurve'].items()},
+                   repeat)
+
+    gui_benchmarks = ('load_target_dict', 'note_saving', 'target_switch', 'overview')
+    try:
+        from PyQt5 import QtWidgets
+        from ggui.main import gGuiGlueApplication
+    except ImportError as e:
+        for name in gui_benchmarks:
+            skip(results, name, str(e))
+        return results
+
+    ggui_app = gGuiGlueApplication()
+    # Builds the overview tab, as the first pass of the event loop would
+    QtWidgets.QApplication.processEvents()
+    try:
+        bench_catalog_loading(results, ggui_app, catalogs, repeat)
+        bench_target_switching(results, ggui_app, switch_catalog, switches, product_sets)
+        bench_overview(results, ggui_app, repeat)
+    finally:
+        ggui_app.target_manager.close()
+    return results
+
+
+def compare_results(baseline: dict, current: dict, tolerance: float = REGRESSION_TOLERANCE) -> list:
+    """Prints the median of every benchmark of two runs side by side
+
+    :param baseline: Results of the earlier run
+    :param current: Results of the later run
+    :param tolerance: Fraction by which a benchmark may be slower before it counts as a regression
+    :returns: names of the benchmarks that regressed
+    """
+    def describe(results):
+        environment = results['environment']
+        return '{0} ({1})'.format(environment['ggui_version'], environment['revision'] or 'unknown revision')
+
+    print('Comparing {0} against baseline {1} (median seconds):'.format(describe(current), describe(baseline)))
+    if baseline['parameters'] != current['parameters']:
+        print('WARNING: The runs used different parameters, so their timings may not be comparable')
+    regressions = []
+    for name in sorted(set(baseline['benchmarks']) | set(current['benchmarks'])):
+        before = baseline['benchmarks'].get(name, {}).get('median')
+        after = current['benchmarks'].get(name, {}).get('median')
+        if before is None or after is None:
+            print('  {0:48s} {1:>10s} {2:>10s}'.format(name, '-' if before is None else '{0:.4f}'.format(before),
+                                                      '-' if after is None else '{0:.4f}'.format(after)))
+            continue
+        ratio = after / before if before else float('inf')
+        verdict = ''
+        if ratio > 1 + tolerance:
+            verdict = 'REGRESSION'
+            regressions.append(name)
+        elif ratio < 1 - tolerance:
+            verdict = 'faster'
+        print('  {0:48s} {1:10.4f} {2:10.4f} {3:7.2f}x {4}'.format(name, before, after, ratio, verdict))
+    return regressions
+
+
+def main(user_arguments: list = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--catalog_sizes', type=int, nargs='+', default=[10, 1000, 100000],
+                        help='Numbers of targets of the catalogs to benchmark (default: 10 1000 100000)')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs of every benchmark')
+    parser.add_argument('--switches', type=int, default=10, help='Number of target switches to time')
+    parser.add_argument('--product_sets', type=int, default=2, help='Number of distinct sets of product files')
+    parser.add_argument('--lightcurve_rows', type=int, default=100000, help='Rows of every lightcurve')
+    parser.add_argument('--image_size', type=int, default=1200, help='Width and height of every coadd and cube, in pixels')
+    parser.add_argument('--cube_frames', type=int, default=20, help='Time frames of every cube')
+    parser.add_argument('--data_dir', help='Directory of the synthetic data, reused across runs. Defaults to a scratch directory')
+    parser.add_argument('--output', help='File to save the results to. Defaults to bench_<version>_<revision>_<time>.json')
+    parser.add_argument('--compare', help='Results of an earlier run to compare against')
+    parser.add_argument('--results', help='Compare these saved results, instead of running the suite')
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE,
+                        help='Fraction by which a benchmark may be slower than its baseline before it counts as a regression')
+    args = parser.parse_args(user_arguments)
+
+    if args.results:
+        if not args.compare:
+            parser.error('--results needs a baseline to compare against, given with --compare')
+        with open(args.results) as results_file:
+            results = json.load(results_file)
+    else:
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        with tempfile.TemporaryDirectory() as cache_dir:
+            # gGui's caches start empty, and the user's own stay untouched
+            os.environ['GGUI_CACHE_DIR'] = cache_dir
+            if args.data_dir:
+                os.makedirs(args.data_dir, exist_ok=True)
+                results = run_suite(os.path.abspath(args.data_dir), args.catalog_sizes, args.repeat, args.switches,
+                                    args.product_sets, args.lightcurve_rows, args.image_size, args.cube_frames)
+            else:
+                with tempfile.TemporaryDirectory() as data_dir:
+                    results = run_suite(data_dir, args.catalog_sizes, args.repeat, args.switches, args.product_sets,
+                                        args.lightcurve_rows, args.image_size, args.cube_frames)
+        output = args.output or 'bench_{0}_{1}_{2}.json'.format(results['environment']['ggui_version'],
+                                                              results['environment']['revision'] or 'unknown',
+                                                              time.strftime('%Y%m%d-%H%M%S'))
+        with open(output, 'w') as output_file:
+            json.dump(results, output_file, indent=1)
+        print('Results saved to ' + output)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare_results(baseline, results, args.tolerance)
+        if regressions:
+            print('{0:d} regressions: '.format(len(regressions)) + ', '.join(regressions))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+.. module:: mock_mast_server
+    :synopsis: Local stand-in for the MAST API, answering cone searches with synthetic observations
+.. moduleauthor:: Duy Nguyen <dnguyen@nrao.edu>
+
+Usage: python benchmarks/mock_mast_server.py [--port 8765] [--latency 0.2] [--observations 50]
+Then point gGui at it, e.g.: ggui-mast-search --server localhost:8765 --http image.fits
+"""
+
+import argparse
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+import json
+import threading
+import time
+from urllib.parse import parse_qs
+
+# Missions the synthetic observations are drawn from, along with their footprint half width in degrees
+MOCK_MISSIONS = (('HST', 0.02), ('GALEX', 0.6), ('KEPLER', 0.2), ('PS1', 0.3), ('SWIFT', 0.1))
+
+
+def mock_observations(ra: float, dec: float, radius: float, count: int) -> list:
+    """Builds a deterministic set of observations scattered within a cone
+
+    :param ra: Right ascension of the cone center, in degrees
+    :param dec: Declination of the cone center, in degrees
+    :param radius: Radius of the cone, in degrees
+    :param count: Number of observations
+    :returns: list of CAOM-like observation dicts
+    """
+    observations = []
+    for index in range(count):
+        mission, half_width = MOCK_MISSIONS[index % len(MOCK_MISSIONS)]
+        obs_ra = ra + radius * ((index * 0.618) % 1.0 - 0.5)
+        obs_dec = dec + radius * ((index * 0.382) % 1.0 - 0.5)
+        if index % 2:
+            region = "CIRCLE ICRS {0:.6f} {1:.6f} {2:.6f}".format(obs_ra, obs_dec, half_width)
+        else:
+            region = "POLYGON ICRS " + " ".join("{0:.6f} {1:.6f}".format(obs_ra + dx * half_width, obs_dec + dy * half_width)
+                                                for dx, dy in ((-1, -1), (1, -1), (1, 1), (-1, 1)))
+        observations.append({'obsid': str(index), 'obs_collection': mission, 'project': 'hlsp_mock' if index % 7 == 0 else None,
+                             'dataproduct_type': 'image', 's_ra': obs_ra, 's_dec': obs_dec, 's_region': region})
+    return observations
+
+
+class MockMastServer(ThreadingMixIn, HTTPServer):
+    """Threaded HTTP server answering MAST invoke requests with synthetic cone search results"""
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, latency: float = 0.0, observations: int = 50, fail_every: int = 0):
+        """
+        :param port: Port to listen on. 0 picks a free port, see server_address
+        :param latency: Seconds every response is delayed by, to simulate network round trips
+        :param observations: Number of observations in every cone
+        :param fail_every: If set, every n-th request answers HTTP 503, to exercise retries
+        """
+        super().__init__(('localhost', port), MockMastHandler)
+        self.latency = latency
+        self.observations = observations
+        self.fail_every = fail_every
+        self.request_count = 0
+        self._count_lock = threading.Lock()
+
+    def start(self) -> threading.Thread:
+        """Serves requests on a background thread
+
+        :returns: the serving thread
+        """
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+class MockMastHandler(BaseHTTPRequestHandler):
+    """Answers POST /api/v0/invoke the way MAST does, with paging"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        with self.server._count_lock:
+            self.server.request_count += 1
+            request_number = self.server.request_count
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')
+        time.sleep(self.server.latency)
+        if self.server.fail_every and request_number % self.server.fail_every == 0:
+            return self._respond(503, {'status': 'ERROR', 'msg': 'Mock failure'})
+        request = json.loads(parse_qs(body)['request'][0])
+        params = request['params']
+        observations = mock_observations(params['ra'], params['dec'], params['radius'], self.server.observations)
+        page, pagesize = int(request.get('page', 1)), int(request.get('pagesize', len(observations) or 1))
+        page_data = observations[(page - 1) * pagesize:page * pagesize]
+        self._respond(200, {'status': 'COMPLETE', 'msg': '', 'data': page_data,
+                            'paging': {'page': page, 'pageSize': pagesize, 'pagesFiltered': -(-len(observations) // pagesize),
+                                       'rows': len(page_data), 'rowsFiltered': len(observations), 'rowsTotal': len(observations)}})
+
+    def _respond(self, status: int, payload: dict):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *_):
+        pass
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.2, help='Seconds every response is delayed by')
+    parser.add_argument('--observations', type=int, default=50, help='Observations in every cone')
+    parser.add_argument('--fail_every', type=int, default=0, help='Answer every n-th request with HTTP 503')
+    args = parser.parse_args()
+    server = MockMastServer(args.port, args.latency, args.observations, args.fail_every)
+    print('Mock MAST API listening on localhost:{0:d}'.format(server.server_address[1]))
+    server.serve_forever()
@@ -0,0 +1,251 @@
+"""
+.. module:: synthetic_gphoton
+    :synopsis: Generates synthetic gPhoton data products and gGui Target Catalogs of any size, for benchmarks
+.. moduleauthor:: Duy Nguyen <dnguyen@nrao.edu>
+
+Usage (with gGui installed):
+    python benchmarks/synthetic_gphoton.py output_dir [--targets 1000000] [--format sqlite] [--product_sets 2]
+        [--lightcurve_rows 100000] [--image_size 1200] [--cube_frames 20]
+Every target of a catalog points at one of a few sets of product files, so catalogs of a million targets take no more
+disk space than catalogs of ten. Files that already exist are reused, as their names spell out what they hold
+"""
+
+import argparse
+from collections.abc import Mapping
+import os
+
+import numpy
+
+from bench_autochop import synthetic_times
+
+# Columns of a gPhoton lightcurve CSV, in gPhoton's order
+GPHOTON_LIGHTCURVE_COLUMNS = (
+    't0', 't1', 't_mean', 't0_data', 't1_data', 'cps_bgsub', 'cps_bgsub_err', 'flux_bgsub', 'flux_bgsub_err', 'mag_bgsub',
+    'mag_bgsub_err_1', 'mag_bgsub_err_2', 'cps_mcatbgsub', 'cps_mcatbgsub_err', 'flux_mcatbgsub', 'flux_mcatbgsub_err',
+    'mag_mcatbgsub', 'mag_mcatbgsub_err_1', 'mag_mcatbgsub_err_2', 'cps', 'cps_err', 'flux', 'flux_err', 'mag', 'mag_err_1',
+    'mag_err_2', 'counts', 'flat_counts', 'bg_counts', 'bg_flat_counts', 'exptime', 'bg', 'mcat_bg', 'responses', 'detxs',
+    'detys', 'detrad', 'racent', 'deccent', 'q_mean', 'flags',
+)
+
+# GALEX bands, and the data product types gGui overviews
+BANDS = ('FUV', 'NUV')
+PRODUCT_TYPES = ('lightcurve', 'coadd', 'cube')
+
+# gPhoton's default image pixel scale, in degrees
+PIXEL_SCALE = 1.5 / 3600
+
+# Lightcurve bin width, in seconds
+BIN_WIDTH = 10.0
+
+# gPhoton version the parameter rows of lightcurves claim
+GPHOTON_VERSION = '1.28.9'
+
+
+def write_lightcurve_csv(csv_path: str, rows: int, chunk_rows: int = 200000, seed: int = 0, band: str = 'NUV',
+                         ra: float = 10.0, dec: float = 41.0):
+    """Writes a lightcurve CSV with gPhoton's columns, ending in the commented '# key = value' rows of parameters
+    gPhoton appends, each padded with commas to the width of the table
+    Times are binned into visits separated by orbital gaps, as gPhoton's are, so autochop finds observation windows.
+    Every other column is filled with random values
+
+    :param csv_path: Path of the CSV to write
+    :param rows: Number of rows
+    :param chunk_rows: Number of rows formatted at once
+    :param seed: Seed of the random values
+    :param band: Band the parameter rows name
+    :param ra: Right ascension of the target the parameter rows name, in degrees
+    :param dec: Declination of the target the parameter rows name, in degrees
+    """
+    generator = numpy.random.default_rng(seed)
+    times = synthetic_times(rows, bin_width=BIN_WIDTH)
+    time_columns = [GPHOTON_LIGHTCURVE_COLUMNS.index(name) for name in ('t0', 't1', 't_mean')]
+    with open(csv_path, 'w') as csv_file:
+        csv_file.write(','.join(GPHOTON_LIGHTCURVE_COLUMNS) + '\n')
+        for chunk_start in range(0, rows, chunk_rows):
+            chunk_times = times[chunk_start:chunk_start + chunk_rows]
+            chunk = generator.random((len(chunk_times), len(GPHOTON_LIGHTCURVE_COLUMNS)))
+            chunk[:, time_columns] = numpy.column_stack((chunk_times - BIN_WIDTH / 2, chunk_times + BIN_WIDTH / 2, chunk_times))
+            numpy.savetxt(csv_file, chunk, fmt='%.12g', delimiter=',')
+        trange = [float(times[0] - BIN_WIDTH / 2), float(times[-1] + BIN_WIDTH / 2)] if rows else [0.0, 0.0]
+        parameters = (('band', band), ('ra0', ra), ('dec0', dec), ('skypos', [ra, dec]), ('trange', trange),
+                      ('radius', 0.0045), ('annulus', [0.005, 0.006]), ('stepsz', BIN_WIDTH), ('verbose', 0),
+                      ('detsize', 1.25), ('apcorrect1', 0.0), ('apcorrect2', 0.0), ('detbg', 0.0), ('n_apersources', 1),
+                      ('n_bgsources', 0), ('max_bgmag', None), ('version', GPHOTON_VERSION))
+        padding = ',' * (len(GPHOTON_LIGHTCURVE_COLUMNS) - 1)
+        csv_file.write(''.join('# {0} = {1}{2}\n'.format(key, value, padding) for key, value in parameters))
+
+
+def image_header(size: int, ra: float, dec: float, frames: int = 0, exptime: float = 1520.0):
+    """Builds the header of a gPhoton coadd, or of a cube if given frames, with a valid TAN projection WCS
+
+    :param size: Width and height of the image, in pixels
+    :param ra: Right ascension of the image center, in degrees
+    :param dec: Declination of the image center, in degrees
+    :param frames: Number of time frames of a cube. 0 for a coadd
+    :param exptime: Exposure time of the whole image, in seconds
+    :returns: astropy.io.fits.Header
+    """
+    from astropy.io import fits
+    from astropy.wcs import WCS
+
+    wcs = WCS(naxis=3 if frames else 2)
+    # The time axis of a cube is left untyped, so Glue names it 'World 0', the field ggui.conf glues cubes by
+    wcs.wcs.ctype = ['RA---TAN', 'DEC--TAN'] + ([''] if frames else [])
+    wcs.wcs.cunit = ['deg', 'deg'] + ([''] if frames else [])
+    wcs.wcs.crpix = [(size + 1) / 2, (size + 1) / 2] + ([1] if frames else [])
+    wcs.wcs.cdelt = [-PIXEL_SCALE, PIXEL_SCALE] + ([exptime / frames] if frames else [])
+    wcs.wcs.crval = [ra, dec] + ([0] if frames else [])
+    wcs.wcs.equinox = 2000.0
+    header = fits.Header([('SIMPLE', True), ('BITPIX', -32), ('NAXIS', 3 if frames else 2), ('NAXIS1', size), ('NAXIS2', size)])
+    if frames:
+        header['NAXIS3'] = frames
+    header.update(wcs.to_header())
+    header['EXPTIME'] = exptime
+    return header
+
+
+def write_image_fits(fits_path: str, size: int, ra: float, dec: float, frames: int = 0, seed: int = 0):
+    """Writes a gPhoton coadd, or a cube if given frames, one frame at a time so cubes of any size fit in memory
+    Pixels hold Poisson background counts
+
+    :param fits_path: Path of the FITS file to write
+    :param size: Width and height of the image, in pixels
+    :param ra: Right ascension of the image center, in degrees
+    :param dec: Declination of the image center, in degrees
+    :param frames: Number of time frames of a cube. 0 for a coadd
+    :param seed: Seed of the counts
+    """
+    from astropy.io import fits
+
+    generator = numpy.random.default_rng(seed)
+    hdu = fits.StreamingHDU(fits_path, image_header(size, ra, dec, frames))
+    try:
+        for _ in range(frames or 1):
+            hdu.write(generator.poisson(2.0, (size, size)).astype('>f4'))
+    finally:
+        hdu.close()
+
+
+def product_set_files(directory: str, product_set: int, lightcurve_rows: int, image_size: int, cube_frames: int) -> dict:
+    """Writes one target's worth of products, every band of every data product type, unless they exist already
+
+    :param directory: Directory to write the products to
+    :param product_set: Number of the set. Every set is centered on its own position, with its own random values
+    :param lightcurve_rows: Rows of every lightcurve
+    :param image_size: Width and height of every coadd and cube, in pixels
+    :param cube_frames: Time frames of every cube
+    :returns: dict of data product type to band to file name, relative to directory
+    """
+    ra, dec = 10.0 + product_set, 41.0
+    products = {product_type: {} for product_type in PRODUCT_TYPES}
+    for band_number, band in enumerate(BANDS):
+        seed = product_set * len(BANDS) + band_number
+        products['lightcurve'][band] = 'set{0:d}_{1}_lightcurve_{2:d}rows.csv'.format(product_set, band, lightcurve_rows)
+        products['coadd'][band] = 'set{0:d}_{1}_coadd_{2:d}px.fits'.format(product_set, band, image_size)
+        products['cube'][band] = 'set{0:d}_{1}_cube_{2:d}px_{3:d}frames.fits'.format(product_set, band, image_size, cube_frames)
+        writers = {'lightcurve': lambda path: write_lightcurve_csv(path, lightcurve_rows, seed=seed, band=band, ra=ra, dec=dec),
+                   'coadd': lambda path: write_image_fits(path, image_size, ra, dec, seed=seed),
+                   'cube': lambda path: write_image_fits(path, image_size, ra, dec, cube_frames, seed=seed)}
+        for product_type, writer in writers.items():
+            path = os.path.join(directory, products[product_type][band])
+            if not os.path.exists(path):
+                # Written under a temporary name, so an interrupted run never leaves a partial file to be reused
+                writer(path + '.part')
+                os.replace(path + '.part', path)
+    return products
+
+
+class SyntheticCatalog(Mapping):
+    """gGui target dictionary whose entries are made up on demand, so catalogs of any size can be written without
+    holding them in memory. Target number i uses product set i modulo the number of sets
+    """
+
+    def __init__(self, targets: int, product_sets: list):
+        """
+        :param targets: Number of targets
+        :param product_sets: Product dicts returned by product_set_files, with paths as the catalog should list them
+        """
+        self._targets = targets
+        self._product_sets = product_sets
+        self._name_format = 'Synthetic {0:0' + str(len(str(targets))) + 'd}'
+
+    def __len__(self) -> int:
+        return self._targets
+
+    def __iter__(self):
+        return (self._name_format.format(target_number) for target_number in range(self._targets))
+
+    def __getitem__(self, target_name: str) -> dict:
+        try:
+            target_number = int(target_name.rpartition(' ')[2])
+        except ValueError:
+            raise KeyError(target_name)
+        if not 0 <= target_number < self._targets or target_name != self._name_format.format(target_number):
+            raise KeyError(target_name)
+        product_set = self._product_sets[target_number % len(self._product_sets)]
+        return {product_type: dict(band_files) for product_type, band_files in product_set.items()}
+
+
+def write_catalog(directory: str, targets: int, catalog_format: str = 'yaml', product_sets: int = 2, lightcurve_rows: int = 100000,
+                  image_size: int = 1200, cube_frames: int = 20) -> str:
+    """Writes a gGui Target Catalog of synthetic targets, along with the product files they point at
+
+    :param directory: Directory to write the catalog to. Products go to its 'products' subdirectory
+    :param targets: Number of targets
+    :param catalog_format: 'yaml' or 'sqlite'
+    :param product_sets: Number of distinct sets of product files the targets take turns pointing at
+    :param lightcurve_rows: Rows of every lightcurve
+    :param image_size: Width and height of every coadd and cube, in pixels
+    :param cube_frames: Time frames of every cube
+    :returns: path of the catalog
+    """
+    from ggui.catalog import catalog_writer
+    from ggui.sqlite_catalog import write_sqlite_catalog
+
+    product_directory = os.path.join(directory, 'products')
+    os.makedirs(product_directory, exist_ok=True)
+    sets = []
+    for product_set in range(product_sets):
+        products = product_set_files(product_directory, product_set, lightcurve_rows, image_size, cube_frames)
+        # Relative paths, as catalogs that travel with their data use
+        sets.append({product_type: {band: 'products/' + file_name for band, file_name in band_files.items()}
+                     for product_type, band_files in products.items()})
+    catalog = SyntheticCatalog(targets, sets)
+
+    catalog_path = os.path.join(directory, 'catalog_{0:d}targets_{1:d}sets_{2:d}rows_{3:d}px_{4:d}frames.{5}'.format(
+        targets, product_sets, lightcurve_rows, image_size, cube_frames, catalog_format))
+    if os.path.exists(catalog_path):
+        return catalog_path
+    part_path = catalog_path + '.part'
+    if os.path.exists(part_path):
+        os.remove(part_path)
+    if catalog_format == 'sqlite':
+        write_sqlite_catalog(catalog, part_path, catalog_path)
+    elif catalog_format == 'yaml':
+        with catalog_writer(part_path) as writer:
+            for target_name in catalog:
+                writer.write(target_name, catalog[target_name])
+    else:
+        raise ValueError("Unknown catalog format '" + catalog_format + "'. Expected yaml or sqlite")
+    os.replace(part_path, catalog_path)
+    return catalog_path
+
+
+def main(user_arguments: list = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('output_dir', help='Directory to write the catalog and products to')
+    parser.add_argument('--targets', type=int, default=10, help='Number of targets in the catalog')
+    parser.add_argument('--format', choices=('yaml', 'sqlite'), default='yaml', help='Catalog format')
+    parser.add_argument('--product_sets', type=int, default=2, help='Number of distinct sets of product files')
+    parser.add_argument('--lightcurve_rows', type=int, default=100000, help='Rows of every lightcurve')
+    parser.add_argument('--image_size', type=int, default=1200, help='Width and height of every coadd and cube, in pixels')
+    parser.add_argument('--cube_frames', type=int, default=20, help='Time frames of every cube')
+    args = parser.parse_args(user_arguments)
+
+    catalog_path = write_catalog(args.output_dir, args.targets, args.format, args.product_sets, args.lightcurve_rows,
+                                 args.image_size, args.cube_frames)
+    print('Wrote ' + catalog_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,8 +3,135 @@
     :synopsis: Determines time windows of GALEX observations based on time 
 .. moduleauthor:: Duy Nguyen <dtn5ah@virginia.edu>
 """
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import csv
+import pathlib
+
 import numpy
-from glue.core import Data
+
+# Columns of the observation window tables written by the streaming autochop
+WINDOW_TABLE_COLUMNS = ('start_index', 'end_index', 'start_time', 'end_time')
+
+def findObsWindows(times, timeInterval):
+    """
+    Determines observation windows separated by gaps larger than timeInterval in a single vectorized pass
+
+    Windows are returned as half-open index ranges: window i spans rows startIndices[i] up to,
+    but not including, endIndices[i]
+
+    :param times: Monotonically increasing sequence of times (or any parameter to split across)
+    :type times: numpy.ndarray
+
+    :param timeInterval: interval/amount to split parameter across
+    :type timeInterval: numpy.float64
+
+    :returns: tuple -- (startIndices, endIndices, startTimes, endTimes) arrays, one entry per window
+    """
+    times = numpy.asarray(times)
+    if not times.size:
+        emptyIndices = numpy.empty(0, dtype=numpy.intp)
+        return emptyIndices, emptyIndices, times[:0], times[:0]
+    # Every gap larger than timeInterval starts a new window on the following row
+    breaks = numpy.flatnonzero(numpy.diff(times) > timeInterval) + 1
+    startIndices = numpy.concatenate(([0], breaks))
+    endIndices = numpy.concatenate((breaks, [times.size]))
+    return startIndices, endIndices, times[startIndices], times[endIndices - 1]
+
+class ObsWindowCache:
+    """
+    Caches the sorted gaps of a time series so observation windows can be recomputed for any threshold
+    with a single binary search, rather than a new pass over the data. Intended for interactive use
+    """
+
+    def __init__(self, times):
+        """
+        :param times: Monotonically increasing sequence of times (or any parameter to split across)
+        :type times: numpy.ndarray
+        """
+        self._times = numpy.asarray(times)
+        gaps = numpy.diff(self._times)
+        # Gap positions ordered by gap size, and the gap sizes in that same (ascending) order
+        self._gapOrder = numpy.argsort(gaps, kind='stable')
+        self._sortedGaps = gaps[self._gapOrder]
+
+    @property
+    def nbytes(self):
+        """
+        :returns: int -- bytes taken by the cached gaps, not counting the time series itself
+        """
+        return self._gapOrder.nbytes + self._sortedGaps.nbytes
+
+    def gapRange(self):
+        """
+        :returns: tuple -- (smallest, largest) gap in the time series, or None if there are no gaps
+        """
+        if not self._sortedGaps.size:
+            return None
+        return self._sortedGaps[0], self._sortedGaps[-1]
+
+    def windows(self, timeInterval):
+        """
+        Determines observation windows separated by gaps larger than timeInterval. See findObsWindows
+
+        :param timeInterval: interval/amount to split parameter across
+        :type timeInterval: numpy.float64
+
+        :returns: tuple -- (startIndices, endIndices, startTimes, endTimes) arrays, one entry per window
+        """
+        if not self._times.size:
+            return findObsWindows(self._times, timeInterval)
+        # Every gap beyond this position in the sorted gaps is larger than timeInterval
+        firstBreak = numpy.searchsorted(self._sortedGaps, timeInterval, side='right')
+        breaks = numpy.sort(self._gapOrder[firstBreak:]) + 1
+        startIndices = numpy.concatenate(([0], breaks))
+        endIndices = numpy.concatenate((breaks, [self._times.size]))
+        return startIndices, endIndices, self._times[startIndices], self._times[endIndices - 1]
+
+def combineObsWindows(bandWindows, mode='union'):
+    """
+    Combines observation windows of several bands into one shared segmentation with a single sort-merge
+
+    In 'union' mode, a combined window covers every time at least one band is observing. In 'intersection'
+    mode, a combined window covers only the times every band is observing. Windows are closed intervals,
+    so windows that merely touch are merged (union) or overlap in a single instant (intersection)
+
+    :param bandWindows: (startTimes, endTimes) array pairs, one pair per band. Windows of a band must not overlap
+    :type bandWindows: list
+
+    :param mode: 'union' or 'intersection'
+    :type mode: string
+
+    :returns: tuple -- (startTimes, endTimes) arrays of the combined windows, in time order
+    """
+    bandWindows = [(numpy.asarray(startTimes), numpy.asarray(endTimes)) for startTimes, endTimes in bandWindows]
+    if not bandWindows:
+        return numpy.empty(0), numpy.empty(0)
+    startTimes = numpy.concatenate([windows[0] for windows in bandWindows])
+    endTimes = numpy.concatenate([windows[1] for windows in bandWindows])
+    if not startTimes.size:
+        return startTimes, endTimes
+    if mode == 'union':
+        order = numpy.argsort(startTimes, kind='stable')
+        startTimes = startTimes[order]
+        endTimes = endTimes[order]
+        # A window starts a new merged window only if it begins after every previous window has ended
+        reach = numpy.maximum.accumulate(endTimes)
+        groupStarts = numpy.flatnonzero(numpy.concatenate(([True], startTimes[1:] > reach[:-1])))
+        return startTimes[groupStarts], numpy.maximum.reduceat(endTimes, groupStarts)
+    elif mode == 'intersection':
+        # Sweep over all window edges, counting how many bands are observing at every edge.
+        # At equal times, window starts sort before window ends so touching windows still overlap
+        edgeTimes = numpy.concatenate((startTimes, endTimes))
+        edgeSteps = numpy.concatenate((numpy.ones(startTimes.size, dtype=int), -numpy.ones(endTimes.size, dtype=int)))
+        order = numpy.lexsort((-edgeSteps, edgeTimes))
+        edgeTimes = edgeTimes[order]
+        observingBands = numpy.cumsum(edgeSteps[order])
+        # All bands observe from the start edge that completes the count until the very next (end) edge
+        enter = numpy.flatnonzero(observingBands == len(bandWindows))
+        return edgeTimes[enter], edgeTimes[enter + 1]
+    else:
+        raise ValueError("Unrecognized autochop band mode: " + str(mode) + ". Expected 'union' or 'intersection'")
 
 def lightcurveChopList(parentData, axis, timeInterval):
     """
@@ -19,27 +146,14 @@ def lightcurveChopList(parentData, axis, timeInterval):
     :param timeInterval: interval/amount to split parameter 'axis' across
     :type timeInterval: numpy.float64
 
-    :returns: list -- List of autochop regions
-    """
-    import numpy
-    # Calculate all time differences between points
-    timeDifferences = numpy.diff(parentData[axis])
-    # Find all indices of blank jumps greater than timeInterval
-    obsWindows = []
-    # Determine first observation window
-    obsStart = parentData[axis, 0]
-    for index, difference in enumerate(timeDifferences):
-       # If the time difference is larger than specified time 
-       if difference > timeInterval:
-            # End time is the current index
-            obsEnd = parentData['MeanTime', index]
-            # Append this time window as tuple to master array
-            obsWindows.append((index, obsStart, obsEnd))
-            # Next window begins in next data point
-            obsStart = parentData['MeanTime', index + 1]
-    # Add last window to master array
-    obsWindows.append((len(parentData[axis]), obsStart, parentData['MeanTime', -1]))
-    return obsWindows
+    :returns: list -- List of autochop regions as (index, obsStart, obsEnd) tuples. index is the last row
+        of each window, except for the final window, where it is the length of the data
+    """
+    startIndices, endIndices, startTimes, endTimes = findObsWindows(parentData[axis], timeInterval)
+    # Preserve the historical index convention: last row of the window, length of the data for the final window
+    indices = endIndices - 1
+    indices[-1:] = endIndices[-1:]
+    return list(zip(indices.tolist(), startTimes.tolist(), endTimes.tolist()))
 
 def lightcurveChopImport(glueApp, dataCollection, parentData, obsWindows):
     """
@@ -63,8 +177,8 @@ def lightcurveChopImport(glueApp, dataCollection, parentData, obsWindows):
     # Get List of all extensions
     extensionList = parentData.component_ids()
     for window in obsWindows:
-        # Grab ending index from list
-        indxEnd = window[0]
+        # Grab ending index from list. Windows report their last row, so include it in the slice
+        indxEnd = min(window[0] + 1, parentData.size)
         # Instantiate new Data Object container for the chop
         newChop = Data(label="AutoChop " + str(indxStart))
         for extension in extensionList:
@@ -74,34 +188,306 @@ def lightcurveChopImport(glueApp, dataCollection, parentData, obsWindows):
         dataCollection.append(newChop)
         # Display Chop (for debugging purposes)
         #create_scatter_canvas(newChop,'MeanTime','Flux_BackgroundSubtracted',glueApp)
-        # Move new index start to next index beyond current window
-        indxStart = indxEnd + 1
+        # Next window begins on the first row beyond the current window
+        indxStart = indxEnd
+
+def lightcurveChopSubsets(dataCollection, parentData, axis, timeInterval, labelPrefix="AutoChop"):
+    """
+    Represents every observation window of parentData as a Glue subset group, without copying any data
+
+    Each window is a range subset over the 'axis' attribute, so the only per-window cost is the subset
+    state itself. Subsets are created on parentData only
+
+    :param dataCollection: Library of imported data objects to current Glue interface
+    :type dataCollection: glue.core.data.DataCollection
+
+    :param parentData: Glue (Pandas) Data Object containing CSV lightcurve data
+    :type parentData: glue.core.data.Data
+
+    :param axis: parameter to split across (usual = time)
+    :type axis: string
+
+    :param timeInterval: interval/amount to split parameter 'axis' across
+    :type timeInterval: numpy.float64
+
+    :param labelPrefix: Prefix of every subset group label
+    :type labelPrefix: string
+
+    :returns: list -- Subset groups, one per observation window, in time order
+    """
+    _, _, startTimes, endTimes = findObsWindows(parentData[axis], timeInterval)
+    return obsWindowSubsets(dataCollection, parentData, axis, startTimes, endTimes, labelPrefix)
+
+def obsWindowSubsets(dataCollection, parentData, axis, startTimes, endTimes, labelPrefix="AutoChop", chopData=None):
+    """
+    Represents given observation windows of parentData as Glue subset groups, one range subset over 'axis' per window
+
+    Subsets are only created on the lightcurves in chopData, never on coadds, cubes or data loaded later, so image and
+    cube viewers hold no per-window masks however many windows there are
+
+    :param dataCollection: Library of imported data objects to current Glue interface
+    :type dataCollection: glue.core.data.DataCollection
+
+    :param parentData: Glue (Pandas) Data Object containing CSV lightcurve data
+    :type parentData: glue.core.data.Data
+
+    :param axis: parameter the windows span (usual = time)
+    :type axis: string
+
+    :param startTimes: 'axis' value of the first row of every window
+    :type startTimes: numpy.ndarray
+
+    :param endTimes: 'axis' value of the last row of every window
+    :type endTimes: numpy.ndarray
+
+    :param labelPrefix: Prefix of every subset group label
+    :type labelPrefix: string
+
+    :param chopData: Glue Data Objects of the lightcurves to create subsets on. Defaults to parentData alone
+    :type chopData: list
+
+    :returns: list -- Subset groups, one per observation window, in the given order
+    """
+    from glue.core.subset import RangeSubsetState
+    from ggui.chop_subset_group import new_chop_subset_group
+    componentID = parentData.id[axis]
+    chopData = [parentData] if chopData is None else chopData
+    return [new_chop_subset_group(dataCollection, chopData, labelPrefix + " " + str(window), RangeSubsetState(obsStart, obsEnd, componentID))
+            for window, (obsStart, obsEnd) in enumerate(zip(numpy.asarray(startTimes).tolist(), numpy.asarray(endTimes).tolist()))]
+
+def lightcurveWindowTableSubsets(dataCollection, parentData, axis, tableFile, labelPrefix="AutoChop"):
+    """
+    Represents the observation windows of a window table precomputed by ggui-autochop as Glue subset groups
+
+    :param dataCollection: Library of imported data objects to current Glue interface
+    :type dataCollection: glue.core.data.DataCollection
+
+    :param parentData: Glue (Pandas) Data Object of the lightcurve the table was computed from
+    :type parentData: glue.core.data.Data
+
+    :param axis: parameter the table was computed across (ggui-autochop's --axis)
+    :type axis: string
+
+    :param tableFile: Path of the window table, see windowTablePath
+    :type tableFile: string
+
+    :param labelPrefix: Prefix of every subset group label
+    :type labelPrefix: string
+
+    :returns: list -- Subset groups, one per observation window, in time order
+    """
+    _, _, startTimes, endTimes = readObsWindowTable(tableFile)
+    return obsWindowSubsets(dataCollection, parentData, axis, startTimes, endTimes, labelPrefix)
+
+def windowTablePath(outputDir, targetCatalog, targetName, band):
+    """
+    Returns where ggui-autochop writes the window table of a lightcurve. Tables are kept in one directory per
+    catalog, named after the catalog, so targets of the same name in different catalogs do not collide
+
+    :param outputDir: Directory window tables are written to (ggui-autochop's --output_dir)
+    :type outputDir: string
+
+    :param targetCatalog: Path of the gGui Target Catalog of the target
+    :type targetCatalog: string
+
+    :param targetName: Name of the target
+    :type targetName: string
+
+    :param band: Band of the lightcurve
+    :type band: string
+
+    :returns: pathlib.Path -- Path of the window table
+    """
+    return pathlib.Path(outputDir) / pathlib.Path(targetCatalog).stem / (str(targetName) + "_" + str(band) + "_windows.csv")
 
 
 # Before code restructuring, this was the only method here. Not sure what this is supposed to do in context of the other autochop methods...
 def lightcurveChop(parentData, axis, timeInterval):
-    
-    # Calculate all time differences between points
-    timeDifferences = numpy.diff(parentData[axis])
-    # Find all indices of blank jumps greater than timeInterval
-    obsWindows = []
-    obsStart = parentData[axis, 0]
-    for index, difference in enumerate(timeDifferences):
-        if difference > timeInterval:
-            obsEnd = parentData['MeanTime', index]
-            obsWindows.append((obsStart,obsEnd))
-            obsStart = parentData['MeanTime', index + 1]
-    obsWindows.append((obsStart, parentData['MeanTime', -1]))
-
-    return obsWindows
-    """
-    chopMeanTimes = []
-    for chopIndex in chopIndices:
-        chopMeanTimes.append(parentData['MeanTime',chopIndex])
-    import ipdb; ipdb.set_trace()
     """
+    Breaks observation data into observations separated by timeInterval. Returns list of (start, end) times
+
+    :param parentData: Glue (Pandas) Data Object containing CSV lightcurve data
+    :type parentData: glue.core.data.Data
+
+    :param axis: parameter to split across (usual = time)
+    :type axis: string
+
+    :param timeInterval: interval/amount to split parameter 'axis' across
+    :type timeInterval: numpy.float64
+
+    :returns: list -- List of (obsStart, obsEnd) tuples
+    """
+    _, _, startTimes, endTimes = findObsWindows(parentData[axis], timeInterval)
+    return list(zip(startTimes.tolist(), endTimes.tolist()))
+
+def lightcurveChopSubsetsMultiband(dataCollection, bandData, axis, timeInterval, mode='union', labelPrefix="AutoChop"):
+    """
+    Represents observation windows shared by several bands as Glue subset groups, without copying any data
+
+    Every band is chopped on its own, the per-band windows are combined (see combineObsWindows), and one subset
+    group is created per combined window, with a subset on every band's lightcurve. Subset groups are defined on the
+    first band's 'axis' attribute, so the bands must be linked along 'axis' (as TargetManager does for multi-band
+    lightcurves) for the segmentation to apply to every band
+
+    :param dataCollection: Library of imported data objects to current Glue interface
+    :type dataCollection: glue.core.data.DataCollection
+
+    :param bandData: Glue Data Objects containing CSV lightcurve data, one per band
+    :type bandData: list
+
+    :param axis: parameter to split across (usual = time)
+    :type axis: string
+
+    :param timeInterval: interval/amount to split parameter 'axis' across
+    :type timeInterval: numpy.float64
+
+    :param mode: 'union' or 'intersection' of the per-band windows
+    :type mode: string
+
+    :param labelPrefix: Prefix of every subset group label
+    :type labelPrefix: string
+
+    :returns: list -- Subset groups, one per shared observation window, in time order
+    """
+    if not bandData:
+        return []
+    bandWindows = [findObsWindows(data[axis], timeInterval)[2:] for data in bandData]
+    startTimes, endTimes = combineObsWindows(bandWindows, mode)
+    return obsWindowSubsets(dataCollection, bandData[0], axis, startTimes, endTimes, labelPrefix, bandData)
+
+def streamObsWindows(filename, axis, timeInterval, chunkRows=1000000):
+    """
+    Determines observation windows of a lightcurve CSV without loading it. Only the 'axis' column is parsed,
+    chunkRows rows at a time, and every window is yielded as soon as the gap ending it has been read.
+    Memory use depends on chunkRows, not on the size of the file
+
+    :param filename: Path to a lightcurve CSV with a header row
+    :type filename: string
+
+    :param axis: column to split across (usual = time)
+    :type axis: string
+
+    :param timeInterval: interval/amount to split column 'axis' across
+    :type timeInterval: numpy.float64
+
+    :param chunkRows: Number of rows parsed at once
+    :type chunkRows: int
+
+    :returns: generator -- (startIndex, endIndex, startTime, endTime) per window, as findObsWindows
+    """
+    import pandas
+    # Start of the window still open at the end of the previous chunk, and the last time read
+    windowStart, windowStartTime, previousTime = 0, None, None
+    rowsRead = 0
+    # gPhoton appends its run parameters to lightcurves as '#' comment rows
+    for chunk in pandas.read_csv(filename, usecols=[axis], chunksize=chunkRows, comment='#'):
+        times = chunk[axis].to_numpy()
+        if not times.size:
+            continue
+        if previousTime is None:
+            windowStartTime = times[0]
+            chunkTimes, firstRow = times, rowsRead
+        else:
+            # Carry the last time of the previous chunk so gaps across the chunk boundary are found too
+            chunkTimes, firstRow = numpy.concatenate(([previousTime], times)), rowsRead - 1
+        # Positions (within chunkTimes) of the first row of every new window
+        breaks = numpy.flatnonzero(numpy.diff(chunkTimes) > timeInterval) + 1
+        if breaks.size:
+            startIndices = numpy.concatenate(([windowStart], firstRow + breaks[:-1]))
+            startTimes = numpy.concatenate(([windowStartTime], chunkTimes[breaks[:-1]]))
+            yield from zip(startIndices.tolist(), (firstRow + breaks).tolist(), startTimes.tolist(), chunkTimes[breaks - 1].tolist())
+            windowStart, windowStartTime = firstRow + int(breaks[-1]), chunkTimes[breaks[-1]]
+        rowsRead += times.size
+        previousTime = times[-1]
+    # The last window is closed by the end of the file
+    if rowsRead:
+        yield windowStart, rowsRead, float(windowStartTime), float(previousTime)
+
+def writeObsWindowTable(filename, obsWindows):
+    """
+    Writes observation windows to a CSV window table, one row at a time
+
+    :param filename: Path of the window table to write
+    :type filename: string
+
+    :param obsWindows: (startIndex, endIndex, startTime, endTime) windows, as yielded by streamObsWindows
+    :type obsWindows: iterable
+
+    :returns: int -- Number of windows written
+    """
+    windowCount = 0
+    with open(filename, 'w', newline='') as tableFile:
+        tableWriter = csv.writer(tableFile)
+        tableWriter.writerow(WINDOW_TABLE_COLUMNS)
+        for window in obsWindows:
+            tableWriter.writerow(window)
+            windowCount += 1
+    return windowCount
+
+def readObsWindowTable(filename):
+    """
+    Reads a window table written by writeObsWindowTable
+
+    :param filename: Path of the window table
+    :type filename: string
+
+    :returns: tuple -- (startIndices, endIndices, startTimes, endTimes) arrays, as findObsWindows
+    """
+    table = numpy.loadtxt(filename, delimiter=',', skiprows=1, ndmin=2)
+    return (table[:, 0].astype(numpy.intp), table[:, 1].astype(numpy.intp), table[:, 2], table[:, 3])
+
+def _chopLightcurveFile(lightcurveFile, tableFile, axis, timeInterval, chunkRows):
+    """Process pool worker: streams a single lightcurve into its window table"""
+    return lightcurveFile, writeObsWindowTable(tableFile, streamObsWindows(lightcurveFile, axis, timeInterval, chunkRows))
+
+def main(user_arguments: list = None):
+    """Entry point to autochop every lightcurve of one or more gGui Target Catalogs without starting gGui
+
+    :param user_arguments: list of arguments, should simulate command line args. Use ['-h'] or ['--help'] for help documentation
+    """
+    # Initialize argument parser with arguments
+    parser = argparse.ArgumentParser(
+        description="Determines observation windows of every lightcurve in gGui Target Catalogs and writes "
+                    "them out as CSV window tables, one per target and band"
+    )
+    parser.add_argument("target_list", nargs="+", help="Path to a gGui Target Catalog")
+    parser.add_argument("--interval", type=float, default=3600.0, help="Minimum gap between two observation windows (default: 3600)")
+    parser.add_argument("--axis", default="t_mean", help="Lightcurve column to split across (default: t_mean)")
+    parser.add_argument("--output_dir", default=".", help="Directory to write window tables to, in one subdirectory per catalog (default: current directory)")
+    parser.add_argument("--processes", type=int, default=None, help="Number of worker processes (default: number of CPUs)")
+    parser.add_argument("--chunk_rows", type=int, default=1000000, help="Lightcurve rows parsed at once per worker (default: 1000000)")
+    args = parser.parse_args(user_arguments)
+
+    from ggui.catalog import validate_target_catalog_file, resolve_product_path
+    output_dir = pathlib.Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=args.processes) as pool:
+        pending = []
+        for ggui_yaml_file in args.target_list:
+            resolved_path = str(pathlib.Path(ggui_yaml_file).resolve())
+            for target_name, target_data in validate_target_catalog_file(resolved_path).items():
+                for band, band_file in target_data.get('lightcurve', {}).items():
+                    if band_file:
+                        table_file = windowTablePath(output_dir, resolved_path, target_name, band)
+                        table_file.parent.mkdir(exist_ok=True)
+                        pending.append(pool.submit(_chopLightcurveFile, resolve_product_path(band_file, resolved_path), str(table_file), args.axis, args.interval, args.chunk_rows))
+        for future in as_completed(pending):
+            try:
+                lightcurveFile, windowCount = future.result()
+                print(str(windowCount) + " observation windows found in " + lightcurveFile)
+            except (OSError, ValueError) as error:
+                print("WARNING: Unable to autochop lightcurve: " + str(error))
 
 # Note for later. This is how you autochop :P
 #from autochop import lightcurveChopList, lightcurveChopImport
-#obsWindows = lightcurveChopList(lightcurveData, "MeanTime", 3600)
-#lightcurveChopImport(glueApp, dataCollection, lightcurveData, obsWindows)
\ No newline at end of file
+#obsWindows = lightcurveChopList(lightcurveData, "t_mean", 3600)
+#lightcurveChopImport(glueApp, dataCollection, lightcurveData, obsWindows)
+# Or, without copying any data:
+#lightcurveChopSubsets(dataCollection, lightcurveData, "t_mean", 3600)
+# Or, straight from disk:
+#writeObsWindowTable("visit_windows.csv", streamObsWindows("visit.csv", "t_mean", 3600))
+# And back into subsets, once the lightcurve is loaded:
+#lightcurveWindowTableSubsets(dataCollection, lightcurveData, "t_mean", "visit_windows.csv")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+"""
+.. module:: cache
+    :synopsis: Locates the on-disk cache shared by every gGui component
+.. moduleauthor:: Duy Nguyen <dnguyen@nrao.edu>
+"""
+
+import os
+import pathlib
+
+def cache_directory(*subdirectories: str) -> pathlib.Path:
+    """Returns a gGui cache directory, creating it if needed
+    The cache lives in $GGUI_CACHE_DIR if set, otherwise in the user's cache directory ($XDG_CACHE_HOME/ggui or ~/.cache/ggui)
+
+    :param subdirectories: Path components of a subdirectory within the cache
+    :returns: path of the cache directory
+    """
+    cache_root = os.environ.get('GGUI_CACHE_DIR')
+    if not cache_root:
+        cache_root = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'ggui')
+    directory = pathlib.Path(cache_root, *subdirectories)
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory
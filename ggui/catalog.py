@@ -0,0 +1,247 @@
+"""
+.. module:: catalog
+    :synopsis: Headless reading, validation and creation of gGui Target Catalogs
+.. moduleauthor:: Duy Nguyen <dnguyen@nrao.edu>
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import csv
+from functools import lru_cache
+import itertools
+import json
+import os
+import pathlib
+from typing import Callable, Iterator, Tuple
+import yaml
+
+# Data product and band held by each of the six product columns of a catalog CSV, after the target name
+CSV_PRODUCT_COLUMNS = (
+    ('lightcurve', 'FUV'), ('lightcurve', 'NUV'),
+    ('coadd', 'FUV'), ('coadd', 'NUV'),
+    ('cube', 'FUV'), ('cube', 'NUV'),
+)
+
+def validate_target_catalog_file(filepath: str) -> dict:
+    """Verifies a gGui Target Catalog confirms to the gGui YAML format
+    SQLite catalogs are opened as is, without reading any target, and are verified target by target upon load
+
+    :returns: verified gGui target dictionary
+    """
+    from ggui.sqlite_catalog import is_sqlite_catalog, SQLiteTargetCatalog
+    if is_sqlite_catalog(filepath):
+        return SQLiteTargetCatalog(filepath)
+    return validate_targlist_format(
+                yaml.load(open(filepath, "r"), Loader=yaml.BaseLoader),
+                filepath
+    )
+
+def resolve_product_path(filepathString: str, list_source: str) -> str:
+    """Resolves a data product path given in a gGui Target Catalog
+    Relative paths are joined with respect to the parent Target Catalog path, interpreting
+    path delimiters of any OS
+
+    :param filepathString: Data product path as written in the Target Catalog
+    :param list_source: Path of the Target Catalog the data product path came from
+    :returns: data product path usable on this OS
+    """
+    if pathlib.PurePath(filepathString).is_absolute():
+        return filepathString
+    # If there are path delimiters, detect which OS it came from to interpret the path directly
+    if "\\" in filepathString:
+        return str(pathlib.PurePath(list_source).parent.joinpath(pathlib.PureWindowsPath(filepathString)))
+    elif "/" in filepathString:
+        return str(pathlib.PurePath(list_source).parent.joinpath(pathlib.PurePosixPath(filepathString)))
+    else:
+        return str(pathlib.PurePath(list_source).parent.joinpath(pathlib.PurePath(filepathString)))
+
+def validate_targlist_format(target_list: dict,  list_source: str) -> dict:
+    """Verifies dictionary is in gGui YAML format
+    Verifies a given dictionary is the established gGui format.
+    Also verifies all specified files exist. Removes any target that does not have any valid files.
+    Only existence is checked: reading every product's header up front would slow down large catalogs, so headers
+    are checked against the product index (ggui.product_index) when a target loads, see TargetManager.setPrimaryTarget
+
+    :returns: verified gGui target dictionary
+    """
+    empty_targets = []
+    for target_name, target_data in target_list.items():
+        valid_files = 0
+        for data_type, band_data in target_data.items():
+            if data_type == '_notes':
+                continue
+            for band, filepathString in band_data.items():
+                # If a path not specified, or empty string, just skip it
+                if filepathString:
+                    # If a relative path to the data product is given, join it with respect to the parent Target Catalog path
+                    filepathString = resolve_product_path(filepathString, list_source)
+                    if not pathlib.Path(filepathString).is_file():
+                        print("Cannot find " + filepathString + " on disk. Ignoring...")
+                    else: valid_files += 1
+        if not valid_files:
+            empty_targets.append(target_name)
+
+    for bad_target in empty_targets:
+        print(str(bad_target) + " does not have any valid data. Ignoring target...")
+        del target_list[bad_target]
+
+    return target_list
+
+def quoted_presenter(dumper, data):
+    """
+    This is a custom representer for string, so that YAML can be output
+    with quotes to satisfy paths on Windows.
+    """
+    return dumper.represent_scalar('tag:yaml.org,2002:str', data, style='"')
+
+def _quoted_yaml(mapping: dict, indent: str = '') -> str:
+    """Emits nested mappings of strings as block style YAML with quoted strings, as yaml.dump with quoted_presenter would
+    JSON strings are valid YAML double quoted scalars, so json.dumps handles quoting and escaping. This is an
+    order of magnitude faster than yaml.dump, which matters when writing catalogs one target at a time
+    """
+    lines = []
+    for key in sorted(mapping):
+        value = mapping[key]
+        if isinstance(value, dict):
+            lines.append(indent + json.dumps(str(key)) + (":\n" if value else ": {}\n"))
+            lines.append(_quoted_yaml(value, indent + '  '))
+        else:
+            lines.append(indent + json.dumps(str(key)) + ": " + json.dumps(str(value)) + "\n")
+    return ''.join(lines)
+
+@lru_cache(maxsize=4096)
+def _directory_listing(directory: str) -> frozenset:
+    """Returns the names of all entries in a directory, or an empty set if it cannot be listed
+    Cached, so every directory is only listed once no matter how many products it holds
+    """
+    try:
+        return frozenset(os.listdir(directory))
+    except OSError:
+        return frozenset()
+
+def _product_exists(filepath: str) -> bool:
+    """Checks a data product exists using cached directory listings instead of a stat per file"""
+    directory, filename = os.path.split(filepath)
+    return filename in _directory_listing(directory)
+
+def iter_catalog_csv(input_fname: str, log: Callable[[str], None] = print, workers: int = 8,
+                     batch_rows: int = 10000) -> Iterator[Tuple[str, dict]]:
+    """Streams gGui target entries out of a seven column catalog CSV
+    Columns are the target name followed by the FUV and NUV lightcurve, coadd and cube paths, relative to the CSV.
+    Any row that begins with a pound sign charater is skipped. Rows are read batch_rows at a time, and the directories
+    of every batch are listed in parallel to check that its data products exist, so memory use is bounded by batch_rows
+
+    :param input_fname: Path of the catalog CSV
+    :param log: Callback receiving a message for every missing file or malformed row
+    :param workers: Number of threads listing directories
+    :param batch_rows: Number of rows checked at once
+    :returns: generator of (target name, gGui target entry) tuples, in CSV order
+    """
+    input_fname_root = os.path.dirname(os.path.abspath(input_fname))
+    # Directories may have changed since the last catalog was built in this session
+    _directory_listing.cache_clear()
+    with open(input_fname, 'r', newline='') as input_file, ThreadPoolExecutor(max_workers=workers) as pool:
+        numbered_rows = enumerate(csv.reader(input_file, delimiter=','), start=1)
+        while True:
+            batch = list(itertools.islice(numbered_rows, batch_rows))
+            if not batch:
+                break
+            entries = []
+            for row_num, row in batch:
+                # Skip blank and commented rows
+                if not row or not row[0].strip() or row[0].lstrip()[0] == '#':
+                    continue
+                if len(row) != len(CSV_PRODUCT_COLUMNS) + 1:
+                    log("Row number {0:d}".format(row_num) + " does not have seven columns.")
+                    continue
+                entry = {'lightcurve': {}, 'coadd': {}, 'cube': {}}
+                for (data_type, band), cell in zip(CSV_PRODUCT_COLUMNS, row[1:]):
+                    if cell.strip():
+                        entry[data_type][band] = os.path.abspath(os.path.join(input_fname_root, cell.strip()))
+                entries.append((row[0].strip(), entry))
+            # List every directory of this batch concurrently, then check existence against the listings
+            directories = {os.path.dirname(filepath) for _, entry in entries for band_data in entry.values() for filepath in band_data.values()}
+            list(pool.map(_directory_listing, directories))
+            for target_name, entry in entries:
+                for band_data in entry.values():
+                    for filepath in band_data.values():
+                        if not _product_exists(filepath):
+                            log("File not found: " + filepath)
+                yield target_name, entry
+
+class catalog_writer:
+    """Writes a gGui Target Catalog one target at a time, so the full catalog never has to be held in memory"""
+
+    def __init__(self, output_fname: str, log: Callable[[str], None] = print):
+        """
+        :param output_fname: Path of the gGui Target Catalog to write
+        :param log: Callback receiving a message for every duplicate target
+        """
+        self._output_file = open(output_fname, 'w')
+        self._log = log
+        self._target_names = set()
+
+    def write(self, target_name: str, target_entry: dict) -> bool:
+        """Appends a target to the catalog
+        A target already written keeps its first entry, since a repeated top level key is not valid YAML
+
+        :param target_name: Name of the target
+        :param target_entry: gGui target entry (data product type to band to path)
+        :returns: True if the target was written, False if it was a duplicate and skipped
+        """
+        if target_name in self._target_names:
+            self._log("Duplicate target " + target_name + ". Keeping its first entry.")
+            return False
+        self._target_names.add(target_name)
+        # A sequence of single key mappings at the top level reads back as one mapping
+        self._output_file.write(_quoted_yaml({target_name: target_entry}))
+        return True
+
+    def close(self):
+        """Flushes and closes the catalog file"""
+        self._output_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+def build_catalog(input_fname: str, output_fname: str, log: Callable[[str], None] = print, workers: int = 8,
+                  batch_rows: int = 10000) -> int:
+    """Converts a seven column catalog CSV into a gGui Target Catalog, streaming rows from one to the other
+
+    :param input_fname: Path of the catalog CSV. See iter_catalog_csv
+    :param output_fname: Path of the gGui Target Catalog to write
+    :param log: Callback receiving a message for every missing file, malformed row or duplicate target
+    :param workers: Number of threads listing directories
+    :param batch_rows: Number of rows checked at once
+    :returns: number of distinct targets written
+    """
+    target_count = 0
+    with catalog_writer(output_fname, log) as writer:
+        for target_name, target_entry in iter_catalog_csv(input_fname, log, workers, batch_rows):
+            if writer.write(target_name, target_entry):
+                target_count += 1
+    return target_count
+
+def main(user_arguments: list = None):
+    """Entry point to convert a catalog CSV into a gGui Target Catalog without the make_param GUI
+
+    :param user_arguments: list of arguments, should simulate command line args. Use ['-h'] or ['--help'] for help documentation
+    """
+    parser = argparse.ArgumentParser(
+        description="Creates a gGui Target Catalog from a CSV of target names followed by FUV and NUV lightcurve, "
+                    "coadd and cube paths"
+    )
+    parser.add_argument("input_csv", help="Path to the seven column catalog CSV")
+    parser.add_argument("output_yaml", help="Path of the gGui Target Catalog to write")
+    parser.add_argument("--workers", type=int, default=8, help="Number of threads checking file existence (default: 8)")
+    parser.add_argument("--batch_rows", type=int, default=10000, help="Number of CSV rows checked at once (default: 10000)")
+    args = parser.parse_args(user_arguments)
+
+    target_count = build_catalog(args.input_csv, args.output_yaml, workers=args.workers, batch_rows=args.batch_rows)
+    print(str(target_count) + " targets written to " + args.output_yaml)
+
+if __name__ == "__main__":
+    main()
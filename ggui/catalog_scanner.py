@@ -0,0 +1,194 @@
+"""
+.. module:: catalog_scanner
+    :synopsis: Builds gGui Target Catalogs by scanning gPhoton output directory trees
+.. moduleauthor:: Duy Nguyen <dnguyen@nrao.edu>
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import json
+import os
+import pathlib
+import re
+from typing import Callable
+import yaml
+
+from ggui.catalog import catalog_writer
+
+# File name patterns of every gPhoton data product. Each must capture a 'target' and a 'band' group
+DEFAULT_PRODUCT_PATTERNS = {
+    'lightcurve': r'^(?P<target>.+)_(?P<band>fuv|nuv)\.csv$',
+    'coadd': r'^(?P<target>.+)_(?P<band>fuv|nuv)_count_coadd\.fits$',
+    'cube': r'^(?P<target>.+)_(?P<band>fuv|nuv)_count_cube\.fits$',
+}
+
+# Bump whenever the layout of the scan state file changes
+SCAN_STATE_VERSION = 1
+
+def compile_product_patterns(product_patterns: dict) -> list:
+    """Compiles data product file name patterns, verifying each captures a target and a band
+
+    :param product_patterns: Dict of data product type to file name regular expression
+    :returns: list of (data product type, compiled case insensitive pattern) tuples
+    """
+    compiled_patterns = []
+    for data_type, pattern in product_patterns.items():
+        compiled_pattern = re.compile(pattern, re.IGNORECASE)
+        if not {'target', 'band'} <= set(compiled_pattern.groupindex):
+            raise ValueError("Pattern for " + str(data_type) + " must capture 'target' and 'band' groups: " + pattern)
+        compiled_patterns.append((data_type, compiled_pattern))
+    return compiled_patterns
+
+def _scan_directory(directory: str, compiled_patterns: list, previous_scan: dict) -> tuple:
+    """Scans a single directory for data products, unless its mtime shows it is unchanged since previous_scan
+
+    :returns: tuple of (directory scan record, whether the directory was rescanned)
+    """
+    mtime = os.stat(directory).st_mtime_ns
+    if previous_scan and previous_scan['mtime'] == mtime:
+        return previous_scan, False
+    matches = []
+    subdirectories = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories.append(entry.path)
+            elif entry.is_file():
+                for data_type, compiled_pattern in compiled_patterns:
+                    match = compiled_pattern.match(entry.name)
+                    if match:
+                        matches.append((match.group('target'), data_type, match.group('band').upper(), entry.name))
+                        break
+    return {'mtime': mtime, 'matches': matches, 'subdirectories': subdirectories}, True
+
+def scan_roots(roots: list, product_patterns: dict = None, scan_state: dict = None, workers: int = 8,
+               log: Callable[[str], None] = print) -> tuple:
+    """Walks directory trees in parallel, matching file names to gPhoton data products
+
+    :param roots: Directories to walk
+    :param product_patterns: Dict of data product type to file name regular expression. Defaults to DEFAULT_PRODUCT_PATTERNS
+    :param scan_state: Directory scan records of a previous scan. Directories whose mtime has not changed are not rescanned
+    :param workers: Number of threads scanning directories
+    :param log: Callback receiving a message for every unreadable directory or conflicting data product
+    :returns: tuple of (gGui target dictionary, new scan state, number of directories rescanned)
+    """
+    compiled_patterns = compile_product_patterns(product_patterns or DEFAULT_PRODUCT_PATTERNS)
+    scan_state = scan_state or {}
+    new_scan_state = {}
+    targets = {}
+    rescanned = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        def submit(directory):
+            return pool.submit(_scan_directory, directory, compiled_patterns, scan_state.get(directory))
+        pending = {submit(os.path.abspath(root)): os.path.abspath(root) for root in roots}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                directory = pending.pop(future)
+                try:
+                    scan_record, was_rescanned = future.result()
+                except OSError as error:
+                    log("Unable to scan " + directory + ": " + str(error))
+                    continue
+                new_scan_state[directory] = scan_record
+                rescanned += was_rescanned
+                for subdirectory in scan_record['subdirectories']:
+                    pending[submit(subdirectory)] = subdirectory
+    # Assemble targets in a fixed directory order, so conflicts always resolve the same way
+    for directory in sorted(new_scan_state):
+        for target_name, data_type, band, filename in new_scan_state[directory]['matches']:
+            band_data = targets.setdefault(target_name, {}).setdefault(data_type, {})
+            if band in band_data:
+                log("Multiple " + band + " " + data_type + " found for " + target_name + ". Using " + os.path.join(directory, filename))
+            band_data[band] = os.path.join(directory, filename)
+    return targets, new_scan_state, rescanned
+
+def load_scan_state(state_fname: str, product_patterns: dict) -> dict:
+    """Loads the scan state of a previous scan, if it was made with the same product patterns
+
+    :param state_fname: Path of the scan state file
+    :param product_patterns: Dict of data product type to file name regular expression of the current scan
+    :returns: directory scan records, or empty dict if there is no usable previous scan
+    """
+    try:
+        with open(state_fname, 'r') as state_file:
+            saved_state = json.load(state_file)
+    except (OSError, ValueError):
+        return {}
+    if saved_state.get('version') != SCAN_STATE_VERSION or saved_state.get('patterns') != product_patterns:
+        return {}
+    return saved_state['directories']
+
+def save_scan_state(state_fname: str, product_patterns: dict, scan_state: dict):
+    """Saves directory scan records for the next incremental scan
+
+    :param state_fname: Path of the scan state file
+    :param product_patterns: Dict of data product type to file name regular expression the scan used
+    :param scan_state: Directory scan records
+    """
+    with open(state_fname, 'w') as state_file:
+        json.dump({'version': SCAN_STATE_VERSION, 'patterns': product_patterns, 'directories': scan_state}, state_file)
+
+def scan_catalog(roots: list, output_fname: str, product_patterns: dict = None, state_fname: str = None,
+                 workers: int = 8, log: Callable[[str], None] = print) -> int:
+    """Writes a gGui Target Catalog of every gPhoton data product found under the given roots
+    Notes of targets already in an existing catalog at output_fname are carried over
+
+    :param roots: Directories to walk
+    :param output_fname: Path of the gGui Target Catalog to write
+    :param product_patterns: Dict of data product type to file name regular expression. Defaults to DEFAULT_PRODUCT_PATTERNS
+    :param state_fname: Path of the scan state file used for incremental scans. Defaults to output_fname + '.scan.json'
+    :param workers: Number of threads scanning directories
+    :param log: Callback receiving a message for every unreadable directory or conflicting data product
+    :returns: number of targets written
+    """
+    product_patterns = product_patterns or DEFAULT_PRODUCT_PATTERNS
+    state_fname = state_fname or output_fname + '.scan.json'
+    targets, scan_state, rescanned = scan_roots(roots, product_patterns, load_scan_state(state_fname, product_patterns), workers, log)
+    log("Rescanned " + str(rescanned) + " of " + str(len(scan_state)) + " directories")
+
+    # Never lose notes taken in a previous version of this catalog
+    if pathlib.Path(output_fname).is_file():
+        with open(output_fname, 'r') as previous_catalog:
+            for target_name, target_data in (yaml.load(previous_catalog, Loader=yaml.BaseLoader) or {}).items():
+                if target_name in targets and target_data.get('_notes'):
+                    targets[target_name]['_notes'] = target_data['_notes']
+
+    with catalog_writer(output_fname, log) as writer:
+        for target_name in sorted(targets):
+            writer.write(target_name, targets[target_name])
+    save_scan_state(state_fname, product_patterns, scan_state)
+    return len(targets)
+
+def main(user_arguments: list = None):
+    """Entry point to build a gGui Target Catalog from gPhoton output directories
+
+    :param user_arguments: list of arguments, should simulate command line args. Use ['-h'] or ['--help'] for help documentation
+    """
+    parser = argparse.ArgumentParser(
+        description="Creates a gGui Target Catalog by scanning directories for gPhoton lightcurves, coadds and cubes"
+    )
+    parser.add_argument("roots", nargs="+", help="Directory to scan, including all its subdirectories")
+    parser.add_argument("--output", required=True, help="Path of the gGui Target Catalog to write")
+    parser.add_argument(
+        "--pattern",
+        action="append",
+        metavar="PRODUCT=REGEX",
+        help="File name pattern of a data product, capturing 'target' and 'band' groups. Replaces the default "
+             "patterns (<target>_<band>.csv, <target>_<band>_count_coadd.fits, <target>_<band>_count_cube.fits). "
+             "Repeat for every data product",
+    )
+    parser.add_argument("--state", help="Path of the incremental scan state file (default: <output>.scan.json)")
+    parser.add_argument("--workers", type=int, default=8, help="Number of threads scanning directories (default: 8)")
+    args = parser.parse_args(user_arguments)
+
+    product_patterns = None
+    if args.pattern:
+        if not all('=' in pattern for pattern in args.pattern):
+            parser.error("--pattern must be given as PRODUCT=REGEX")
+        product_patterns = dict(pattern.split('=', 1) for pattern in args.pattern)
+    target_count = scan_catalog(args.roots, args.output, product_patterns, args.state, args.workers)
+    print(str(target_count) + " targets written to " + args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+.. module:: chop_subset_group
+    :synopsis: Glue subset group of an autochop observation window, kept on lightcurves only
+.. moduleauthor:: Duy Nguyen <dnguyen@nrao.edu>
+"""
+
+from glue.config import settings
+from glue.core.message import DataCollectionDeleteMessage
+from glue.core.subset_group import GroupedSubset, SubsetGroup
+
+class ChopSubsetGroup(SubsetGroup):
+    """Subset group whose subsets only exist on the lightcurves it was made for
+    Glue's own subset groups add a subset to every dataset of the collection, including coadds and cubes loaded later,
+    so every viewer would compute one mask per window. A window of a lightcurve has no meaning on an image anyway
+    """
+
+    def __init__(self, chop_data: list = None, label: str = None, subset_state=None, **kwargs):
+        """
+        :param chop_data: Glue Data objects (lightcurves) the group has subsets on
+        :param label: Label of the group
+        :param subset_state: Glue subset state shared by every subset of the group
+        """
+        self.chop_data = list(chop_data or [])
+        super().__init__(label=label, subset_state=subset_state, **kwargs)
+
+    def register(self, data):
+        """Registers to a DataCollection, adding subsets to the group's lightcurves only
+
+        :param data: DataCollection holding the lightcurves
+        """
+        self.register_to_hub(data.hub)
+        # Add to self, then to the data, so the group is fully populated by the first broadcast
+        for chop_data in self.chop_data:
+            if chop_data in data:
+                self.subsets.append(GroupedSubset(chop_data, self))
+        for subset in self.subsets:
+            subset.data.add_subset(subset)
+
+    def register_to_hub(self, hub):
+        """Follows datasets leaving the collection. Unlike Glue's subset groups, datasets joining it get no subset
+
+        :param hub: Hub of the DataCollection
+        """
+        hub.subscribe(self, DataCollectionDeleteMessage, lambda message: self._remove_data(message.data))
+
+def new_chop_subset_group(data_collection, chop_data: list, label: str, subset_state) -> ChopSubsetGroup:
+    """Creates a subset group on the given lightcurves of a DataCollection, as DataCollection.new_subset_group does on all of its data
+
+    :param data_collection: Glue DataCollection holding the lightcurves
+    :param chop_data: Glue Data objects (lightcurves) to create subsets on
+    :param label: Label of the group
+    :param subset_state: Glue subset state of the group
+    :returns: the subset group, listed with the collection's other subset groups
+    """
+    color = settings.SUBSET_COLORS[data_collection._sg_count % len(settings.SUBSET_COLORS)]
+    data_collection._sg_count += 1
+    # Delay callbacks so SubsetCreateMessages are only emitted once the subsets exist, as Glue does
+    with data_collection.hub.delay_callbacks():
+        subset_group = ChopSubsetGroup(chop_data, label=label, subset_state=subset_state, color=color)
+        data_collection._subset_groups.append(subset_group)
+        subset_group.register(data_collection)
+    return subset_group
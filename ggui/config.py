@@ -1,23 +1,227 @@
-from glue.config import settings, preference_panes
-from qtpy import QtWidgets
-
-from glue.config import viewer_tool
-from glue.viewers.common.qt.tool import Tool
-
-@viewer_tool
-class GGUIAutoChop(Tool):
-
-    icon = 'myicon.png'
-    tool_id = 'custom_tool'
-    action_text = 'Does cool stuff'
-    tool_tip = 'Does cool stuff'
-    shortcut = 'D'
-
-    def __init__(self, viewer):
-        super(MyCustomMode, self).__init__(viewer)
-
-    def activate(self):
-        pass
-
-    def close(self):
-        pass
+"""
+.. module:: config
+    :synopsis: Locates packaged gGui resources, and loads and validates the gGui configuration (ggui.conf)
+.. moduleauthor:: Duy Nguyen <dnguyen@nrao.edu>
+"""
+
+from configparser import ConfigParser, Error as ConfigParserError
+import os
+import threading
+import time
+from typing import NamedTuple
+
+# Resources are shipped inside the package directory (see package_data in setup.py), so they are located
+# relative to this module rather than through pkg_resources, which is slow to import
+PACKAGE_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+def resource_path(*path_components: str) -> str:
+    """Returns the path of a file shipped with gGui
+
+    :param path_components: Path components relative to the gGui package, e.g. 'ggui.conf'
+    :returns: absolute path of the resource
+    """
+    return os.path.join(PACKAGE_DIRECTORY, *path_components)
+
+def icon_path(icon_name: str) -> str:
+    """Returns the path of a gGui icon
+
+    :param icon_name: File name of the icon, e.g. 'Notepad.png'
+    :returns: absolute path of the icon
+    """
+    return resource_path('icons', icon_name)
+
+# Data product types gGui knows how to display
+PRODUCT_TYPES = ('lightcurve', 'coadd', 'cube')
+
+# Lightcurve field the overview plots as the error of its y axis
+LIGHTCURVE_ERROR_FIELD = 'flux_bgsub_err'
+
+# Fields the overview viewers use besides the configured ones, by data product type
+VIEWER_FIELDS = {'lightcurve': (LIGHTCURVE_ERROR_FIELD,)}
+
+# Target Manager actions that can be bound to a key, and their default keys
+DEFAULT_SHORTCUTS = {'next_target': 'PgDown', 'previous_target': 'PgUp'}
+
+# Seconds between checks of whether the configuration file changed on disk
+CONFIG_CHECK_INTERVAL = 2.0
+
+# Memory budget used unless ggui.conf sets one: a share of physical memory
+DEFAULT_MEMORY_BUDGET = '50%'
+
+# Multipliers of the memory size units ggui.conf accepts
+MEMORY_UNITS = {'B': 1, 'KB': 10 ** 3, 'MB': 10 ** 6, 'GB': 10 ** 9, 'TB': 10 ** 12}
+
+class ProductFields(NamedTuple):
+    """Configured fields of one data product type"""
+    x: str
+    y: str
+    # Every field to glue across bands: x and y first, then the additional fields, without duplicates
+    glue: tuple
+
+EMPTY_FIELDS = ProductFields('', '', ())
+
+class GguiConfig:
+    """Parsed and validated gGui configuration. Fields are plain attributes, so reading them involves no I/O"""
+
+    def __init__(self, filepath: str, mtime_ns: int, product_fields: dict, shortcuts: dict, memory_budget: int = 0):
+        """
+        :param filepath: Path of the configuration file
+        :param mtime_ns: Modification time of the configuration file when it was read
+        :param product_fields: Dict of data product type to ProductFields
+        :param shortcuts: Dict of Target Manager action to key sequence
+        :param memory_budget: Bytes of memory the current target's data and gGui's caches may take. 0 for no limit
+        """
+        self.filepath = filepath
+        self.mtime_ns = mtime_ns
+        self.product_fields = product_fields
+        self.shortcuts = shortcuts
+        self.memory_budget = memory_budget
+
+    def fields(self, product_type: str) -> ProductFields:
+        """Returns the configured fields of a data product type
+
+        :param product_type: Data product type, e.g. 'lightcurve'
+        :returns: ProductFields. Unconfigured fields are empty strings
+        """
+        return self.product_fields.get(product_type, EMPTY_FIELDS)
+
+    def required_fields(self, product_type: str) -> tuple:
+        """Returns every field gGui itself uses of a data product type: the configured ones, and those the viewers plot
+
+        :param product_type: Data product type, e.g. 'lightcurve'
+        :returns: tuple of field names, without duplicates
+        """
+        return tuple(dict.fromkeys(self.fields(product_type).glue + VIEWER_FIELDS.get(product_type, ())))
+
+    def shortcut(self, action: str) -> str:
+        """Returns the key sequence of a Target Manager action
+
+        :param action: Action name, e.g. 'next_target'
+        :returns: key sequence, e.g. 'Right'
+        """
+        return self.shortcuts[action]
+
+def physical_memory() -> int:
+    """Returns the physical memory of this machine in bytes, or 0 if it cannot be determined"""
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, OSError, ValueError):
+        return 0
+
+def parse_memory_size(value: str) -> int:
+    """Parses a memory size from ggui.conf
+
+    :param value: Size with a unit (e.g. '4 GB' or '512MB'), share of physical memory (e.g. '50%'), or 'none'
+    :returns: size in bytes. 0 for 'none', or a share of an unknown physical memory
+    :raises ValueError: if the value is none of the above
+    """
+    size = value.strip().upper()
+    if size in ('NONE', '0', ''):
+        return 0
+    try:
+        if size.endswith('%'):
+            return int(physical_memory() * float(size[:-1]) / 100)
+        number = size.rstrip('KMGTB ')
+        unit = size[len(number):].strip() or 'B'
+        return int(float(number) * MEMORY_UNITS[unit])
+    except (KeyError, ValueError):
+        raise ValueError("Invalid memory size '" + value.strip() + "'. Expected e.g. 4 GB, 512 MB, 50% or none")
+
+def _split_fields(value: str) -> list:
+    """Splits a comma separated list of fields, dropping blank entries"""
+    return [field.strip() for field in value.split(',') if field.strip()]
+
+def parse_config(filepath: str) -> GguiConfig:
+    """Reads and validates a gGui configuration file
+
+    :param filepath: Path of the configuration file
+    :returns: parsed configuration
+    :raises ValueError: if the file cannot be parsed, names an unknown data product type, axis or shortcut, or sets an invalid memory budget
+    """
+    mtime_ns = os.stat(filepath).st_mtime_ns
+    parser = ConfigParser()
+    try:
+        with open(filepath) as config_file:
+            parser.read_file(config_file)
+    except ConfigParserError as e:
+        raise ValueError("Invalid gGui configuration " + filepath + ": " + str(e))
+
+    mandatory_fields = {}
+    if parser.has_section('Mandatory Fields'):
+        for key, value in parser.items('Mandatory Fields'):
+            product_type, _, axis = key.rpartition('_')
+            if product_type not in PRODUCT_TYPES or axis not in ('x', 'y'):
+                raise ValueError("Unknown entry '" + key + "' in [Mandatory Fields] of " + filepath + ". Expected <type>_x or <type>_y, "
+                                 "with <type> one of: " + ", ".join(PRODUCT_TYPES))
+            mandatory_fields[(product_type, axis)] = value.strip()
+    additional_fields = {}
+    if parser.has_section('Additional Fields To Glue'):
+        for product_type, value in parser.items('Additional Fields To Glue'):
+            if product_type not in PRODUCT_TYPES:
+                raise ValueError("Unknown data product type '" + product_type + "' in [Additional Fields To Glue] of " + filepath
+                                 + ". Expected one of: " + ", ".join(PRODUCT_TYPES))
+            additional_fields[product_type] = _split_fields(value)
+    product_fields = {}
+    for product_type in PRODUCT_TYPES:
+        x_att = mandatory_fields.get((product_type, 'x'), '')
+        y_att = mandatory_fields.get((product_type, 'y'), '')
+        glue_fields = [field for field in [x_att, y_att] + additional_fields.get(product_type, []) if field]
+        product_fields[product_type] = ProductFields(x_att, y_att, tuple(dict.fromkeys(glue_fields)))
+
+    shortcuts = dict(DEFAULT_SHORTCUTS)
+    if parser.has_section('Target Manager Shortcuts'):
+        for action, value in parser.items('Target Manager Shortcuts'):
+            if action not in DEFAULT_SHORTCUTS:
+                raise ValueError("Unknown shortcut '" + action + "' in [Target Manager Shortcuts] of " + filepath
+                                 + ". Expected one of: " + ", ".join(DEFAULT_SHORTCUTS))
+            if value.strip():
+                shortcuts[action] = value.strip()
+
+    memory_budget = DEFAULT_MEMORY_BUDGET
+    if parser.has_section('Memory'):
+        for key, value in parser.items('Memory', raw=True):
+            if key != 'budget':
+                raise ValueError("Unknown entry '" + key + "' in [Memory] of " + filepath + ". Expected budget")
+            memory_budget = value
+    try:
+        memory_budget = parse_memory_size(memory_budget)
+    except ValueError as e:
+        raise ValueError(str(e) + " in [Memory] of " + filepath)
+    return GguiConfig(filepath, mtime_ns, product_fields, shortcuts, memory_budget)
+
+def config_path() -> str:
+    """Returns the path of the gGui configuration file: $GGUI_CONFIG if set, otherwise the ggui.conf shipped with gGui"""
+    return os.environ.get('GGUI_CONFIG') or resource_path('ggui.conf')
+
+_config = None
+_config_checked = 0.0
+_config_lock = threading.Lock()
+
+def ggui_config() -> GguiConfig:
+    """Returns the gGui configuration
+    The file is parsed on first use, and parsed again only once its modification time changes, checked at most
+    every CONFIG_CHECK_INTERVAL seconds. An edit that fails validation is reported, and the previous configuration kept
+
+    :returns: parsed configuration
+    :raises ValueError: if the configuration is invalid on first use
+    """
+    global _config, _config_checked
+    now = time.monotonic()
+    if _config is not None and now - _config_checked < CONFIG_CHECK_INTERVAL:
+        return _config
+    with _config_lock:
+        filepath = config_path()
+        try:
+            changed = _config is None or _config.filepath != filepath or os.stat(filepath).st_mtime_ns != _config.mtime_ns
+        except OSError:
+            # The file may be briefly missing while an editor saves it
+            changed = _config is None
+        if changed:
+            try:
+                _config = parse_config(filepath)
+            except (OSError, ValueError) as e:
+                if _config is None:
+                    raise
+                print("WARNING: Keeping the previous gGui configuration. " + str(e))
+        _config_checked = now
+    return _config
@@ -0,0 +1,302 @@
+"""
+.. module:: cross_search
+    :synopsis: Concurrent MAST cross searches over every target of a gGui Target Catalog
+.. moduleauthor:: Duy Nguyen <dnguyen@nrao.edu>
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import http.client
+import itertools
+import json
+import sqlite3
+import threading
+import time
+from typing import Callable, Iterator, Tuple
+
+from ggui.catalog import resolve_product_path, validate_target_catalog_file
+from ggui.mast_client import MAST_SERVER, ConeSearchCache, MastClient
+from ggui.mastCrossSearch import getFITSFootprints
+
+# Observation fields kept in their own columns. The full observation is kept as JSON alongside
+OBSERVATION_COLUMNS = ('obsid', 'obs_collection', 'project', 'dataproduct_type', 's_ra', 's_dec', 's_region')
+
+CROSS_MATCH_SCHEMA = """
+CREATE TABLE IF NOT EXISTS searches (
+    target TEXT PRIMARY KEY, ra REAL, dec REAL, radius REAL, status TEXT, error TEXT, observation_count INTEGER, searched REAL
+);
+CREATE TABLE IF NOT EXISTS observations (
+    target TEXT NOT NULL, obsid TEXT, obs_collection TEXT, project TEXT, dataproduct_type TEXT,
+    s_ra REAL, s_dec REAL, s_region TEXT, observation TEXT
+);
+CREATE INDEX IF NOT EXISTS observations_target ON observations (target);
+"""
+
+class RateLimiter:
+    """Spaces calls evenly so that no more than a given number happen per second, across all threads"""
+
+    def __init__(self, rate: float):
+        """
+        :param rate: Maximum calls per second. 0 or None disables limiting
+        """
+        self._interval = 1.0 / rate if rate else 0.0
+        self._next_slot = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """Blocks until the caller may proceed"""
+        if not self._interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + self._interval
+        if slot > now:
+            time.sleep(slot - now)
+
+class CrossMatchStore:
+    """SQLite store of cross search results, written as searches finish and readable at any time, even mid-search"""
+
+    def __init__(self, store_path: str):
+        """Opens (or creates) a cross match store
+
+        :param store_path: Path of the store database
+        """
+        self.store_path = str(store_path)
+        self._connection = sqlite3.connect(self.store_path, check_same_thread=False)
+        # Write ahead logging lets readers (e.g. the GUI) query while results stream in
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(CROSS_MATCH_SCHEMA)
+        self._lock = threading.Lock()
+
+    def add_search(self, target_name: str, ra: float, dec: float, radius: float, observations: list = None, error: str = None):
+        """Records the result of a target's cone search, replacing any previous result
+
+        :param target_name: Name of the target
+        :param ra: Right ascension of the cone center, in degrees
+        :param dec: Declination of the cone center, in degrees
+        :param radius: Radius of the cone, in degrees
+        :param observations: Observations found, as returned by MAST. None if the search failed
+        :param error: Reason the search failed, if it did
+        """
+        observations = observations or []
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM observations WHERE target = ?", (target_name,))
+            self._connection.execute("INSERT OR REPLACE INTO searches VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                     (target_name, ra, dec, radius, 'failed' if error else 'complete', error, len(observations), time.time()))
+            self._connection.executemany("INSERT INTO observations VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                         ((target_name,) + tuple(observation.get(column) for column in OBSERVATION_COLUMNS) + (json.dumps(observation),)
+                                          for observation in observations))
+
+    def completed_targets(self) -> set:
+        """Returns the names of every target whose search completed"""
+        with self._lock:
+            return {name for (name,) in self._connection.execute("SELECT target FROM searches WHERE status = 'complete'")}
+
+    def searches(self) -> list:
+        """Returns every recorded search
+
+        :returns: list of (target, ra, dec, radius, status, error, observation count) tuples
+        """
+        with self._lock:
+            return self._connection.execute("SELECT target, ra, dec, radius, status, error, observation_count FROM searches ORDER BY target").fetchall()
+
+    def observations(self, target_name: str = None) -> list:
+        """Returns the observations found around a target, or around every target
+
+        :param target_name: Name of the target. None returns the observations of all targets
+        :returns: list of dicts of the OBSERVATION_COLUMNS, plus 'target'
+        """
+        query = "SELECT target, " + ", ".join(OBSERVATION_COLUMNS) + " FROM observations"
+        with self._lock:
+            if target_name is None:
+                rows = self._connection.execute(query).fetchall()
+            else:
+                rows = self._connection.execute(query + " WHERE target = ?", (target_name,)).fetchall()
+        return [dict(zip(('target',) + OBSERVATION_COLUMNS, row)) for row in rows]
+
+    def close(self):
+        """Closes the store"""
+        with self._lock:
+            self._connection.close()
+
+def catalog_footprints(target_catalog: str, targets, product_index=None, workers: int = 8) -> Iterator[Tuple[str, float, float, float]]:
+    """Computes the cone enclosing each target's coadds. Targets without a readable coadd are skipped
+
+    :param target_catalog: Path of the gGui Target Catalog
+    :param targets: Dict of target name to gGui target entry, or SQLiteTargetCatalog
+    :param product_index: Optional ggui.product_index.ProductMetadataIndex to read cached headers from
+    :param workers: Number of threads reading headers
+    :returns: generator of (target name, ra, dec, radius) tuples, in degrees
+    """
+    target_names = iter(targets)
+    while True:
+        batch = list(itertools.islice(target_names, 1000))
+        if not batch:
+            break
+        coadds = [(target_name, resolve_product_path(filepath, target_catalog))
+                  for target_name in batch for filepath in targets[target_name].get('coadd', {}).values() if filepath]
+        _, _, center_ra, center_dec, radius = getFITSFootprints([filepath for _, filepath in coadds], product_index, workers)
+        # Bands of a target share a pointing, so keep the widest coadd's cone
+        cones = {}
+        for (target_name, _), ra, dec, cone_radius in zip(coadds, center_ra, center_dec, radius):
+            if cone_radius == cone_radius and cone_radius > cones.get(target_name, (0, 0, -1))[2]:
+                cones[target_name] = (float(ra), float(dec), float(cone_radius))
+        for target_name in batch:
+            if target_name in cones:
+                yield (target_name,) + cones[target_name]
+
+class CrossSearchEngine:
+    """Runs cone searches concurrently on a bounded thread pool
+    Every thread keeps its own kept-alive MAST connection, all threads share one rate limit and the on-disk cache,
+    failed requests and queries MAST has not completed yet are retried with exponential backoff, and results beyond
+    one page are fetched page by page
+    """
+
+    def __init__(self, server: str = MAST_SERVER, https: bool = True, workers: int = 8, rate: float = 10.0,
+                 retries: int = 3, pagesize: int = 2000, service: str = 'Mast.Caom.Cone', offline: bool = False,
+                 cache: ConeSearchCache = None):
+        """
+        :param server: Host (and optionally ':port') of the MAST API
+        :param https: Whether to connect over HTTPS
+        :param workers: Number of concurrent searches
+        :param rate: Maximum requests per second sent to the server, across all threads. Cached results are not limited
+        :param retries: Number of retries of a failed request
+        :param pagesize: Number of observations requested per page
+        :param service: MAST cone search service
+        :param offline: If True, only cached results are used
+        :param cache: Cone search cache shared by every thread. Defaults to the cache in the gGui cache directory
+        """
+        self.server = server
+        self.https = https
+        self.workers = workers
+        self.retries = retries
+        self.pagesize = pagesize
+        self.service = service
+        self.offline = offline
+        self.cache = ConeSearchCache() if cache is None else cache
+        self._rate_limiter = RateLimiter(rate)
+        self._thread_clients = threading.local()
+        self._clients = []
+        self._clients_lock = threading.Lock()
+
+    def _client(self) -> MastClient:
+        """Returns the calling thread's MAST client"""
+        client = getattr(self._thread_clients, 'client', None)
+        if client is None:
+            client = MastClient(self.server, self.https, self.cache, self.offline, rate_limiter=self._rate_limiter)
+            self._thread_clients.client = client
+            with self._clients_lock:
+                self._clients.append(client)
+        return client
+
+    def _request(self, ra: float, dec: float, radius: float, page: int) -> dict:
+        """Requests a single page, retrying failures and unfinished queries with exponential backoff
+
+        :raises ValueError: if MAST still has not completed the query after every retry
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                response = self._client().cone_search(ra, dec, radius, self.service, page, self.pagesize)
+                # MAST answers 'EXECUTING' while a query is still running. Only a COMPLETE answer holds every observation
+                if response.get('status') != 'COMPLETE':
+                    raise ValueError("MAST query not complete (status " + str(response.get('status')) + ")")
+                return response
+            except (OSError, http.client.HTTPException, ValueError):
+                # Offline cache misses will not get any better
+                if self.offline or attempt == self.retries:
+                    raise
+                time.sleep(0.5 * 2 ** attempt)
+
+    def search(self, ra: float, dec: float, radius: float) -> list:
+        """Runs one cone search, following every page of results
+
+        :param ra: Right ascension of the cone center, in degrees
+        :param dec: Declination of the cone center, in degrees
+        :param radius: Radius of the cone, in degrees
+        :returns: list of every observation found
+        """
+        response = self._request(ra, dec, radius, 1)
+        observations = list(response.get('data', []))
+        page_count = response.get('paging', {}).get('pagesFiltered', 1)
+        for page in range(2, page_count + 1):
+            observations.extend(self._request(ra, dec, radius, page).get('data', []))
+        return observations
+
+    def search_all(self, cones, store: CrossMatchStore, skip_completed: bool = True,
+                   progress: Callable[[int, int], None] = None) -> int:
+        """Searches every cone concurrently, writing each result to the store as soon as it arrives
+
+        :param cones: Iterable of (target name, ra, dec, radius) tuples, consumed lazily
+        :param store: Store to write results to
+        :param skip_completed: If True, targets the store already holds a complete search for are skipped,
+            so interrupted runs resume where they stopped
+        :param progress: Callback receiving (searches finished, searches failed) after every search
+        :returns: number of failed searches
+        """
+        completed = store.completed_targets() if skip_completed else set()
+        cones = (cone for cone in cones if cone[0] not in completed)
+        finished = failed = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            pending = {}
+            while True:
+                # Keep a bounded number of searches in flight, so catalogs of any size stream through
+                for cone in itertools.islice(cones, 2 * self.workers - len(pending)):
+                    pending[pool.submit(self.search, *cone[1:])] = cone
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    cone = pending.pop(future)
+                    try:
+                        store.add_search(*cone, observations=future.result())
+                    except Exception as error:
+                        store.add_search(*cone, error=str(error))
+                        failed += 1
+                    finished += 1
+                    if progress:
+                        progress(finished, failed)
+        return failed
+
+    def close(self):
+        """Closes every thread's MAST connection"""
+        with self._clients_lock:
+            for client in self._clients:
+                client.close()
+            self._clients = []
+
+def main(user_arguments: list = None):
+    """Entry point to cross search MAST around every target of a gGui Target Catalog
+
+    :param user_arguments: list of arguments, should simulate command line args. Use ['-h'] or ['--help'] for help documentation
+    """
+    parser = argparse.ArgumentParser(
+        description="Searches MAST around the coadds of every target of a gGui Target Catalog, "
+                    "streaming the observations found into a SQLite cross match store"
+    )
+    parser.add_argument("target_catalog", help="Path of the gGui Target Catalog (YAML or SQLite)")
+    parser.add_argument("--output", required=True, help="Path of the cross match store to write. Existing stores are resumed")
+    parser.add_argument("--workers", type=int, default=8, help="Number of concurrent searches (default: 8)")
+    parser.add_argument("--rate", type=float, default=10.0, help="Maximum requests per second (default: 10)")
+    parser.add_argument("--retries", type=int, default=3, help="Retries of a failed request (default: 3)")
+    parser.add_argument("--offline", action="store_true", help="Only use cached MAST results, never connect")
+    parser.add_argument("--server", default=MAST_SERVER, help="Host[:port] of the MAST API (default: " + MAST_SERVER + ")")
+    parser.add_argument("--http", action="store_true", help="Connect to the MAST API server over plain HTTP, e.g. a local stand-in server")
+    args = parser.parse_args(user_arguments)
+
+    targets = validate_target_catalog_file(args.target_catalog)
+    engine = CrossSearchEngine(args.server, not args.http, args.workers, args.rate, args.retries, offline=args.offline)
+    store = CrossMatchStore(args.output)
+
+    def report(finished, failed):
+        if finished % 100 == 0:
+            print(str(finished) + " searches finished, " + str(failed) + " failed")
+    try:
+        failed = engine.search_all(catalog_footprints(args.target_catalog, targets), store, progress=report)
+    finally:
+        engine.close()
+        store.close()
+    print("Cross search complete. " + str(failed) + " searches failed and will be retried on the next run")
+
+if __name__ == "__main__":
+    main()
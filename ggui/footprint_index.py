@@ -0,0 +1,340 @@
+"""
+.. module:: footprint_index
+    :synopsis: In-memory spatial index of sky footprints, answering point and overlap queries locally
+.. moduleauthor:: Duy Nguyen <dnguyen@nrao.edu>
+"""
+
+import math
+
+import numpy
+
+from ggui.regions import RegionSet, parse_s_regions
+
+# Number of vertices circles are approximated with when testing overlaps
+CIRCLE_OVERLAP_VERTICES = 64
+
+def radec_to_vectors(ra, dec) -> numpy.ndarray:
+    """Converts sky coordinates to unit vectors
+
+    :param ra: Right ascension(s), in degrees
+    :param dec: Declination(s), in degrees
+    :returns: array of shape (..., 3)
+    """
+    ra, dec = numpy.radians(ra), numpy.radians(dec)
+    return numpy.stack((numpy.cos(dec) * numpy.cos(ra), numpy.cos(dec) * numpy.sin(ra), numpy.sin(dec)), axis=-1)
+
+def vectors_to_radec(vectors: numpy.ndarray) -> tuple:
+    """Converts unit vectors to sky coordinates
+
+    :param vectors: array of shape (..., 3)
+    :returns: tuple of (ra, dec) arrays, in degrees
+    """
+    ra = numpy.degrees(numpy.arctan2(vectors[..., 1], vectors[..., 0])) % 360.0
+    dec = numpy.degrees(numpy.arcsin(numpy.clip(vectors[..., 2], -1, 1)))
+    return ra, dec
+
+def _tangent_basis(center: numpy.ndarray) -> tuple:
+    """Returns east and north unit vectors of the tangent plane at a point of the sphere"""
+    east = numpy.cross([0.0, 0.0, 1.0], center)
+    if numpy.linalg.norm(east) < 1e-12:
+        # At a pole any east will do
+        east = numpy.array([0.0, 1.0, 0.0])
+    east = east / numpy.linalg.norm(east)
+    return east, numpy.cross(center, east)
+
+def _gnomonic(vectors: numpy.ndarray, center: numpy.ndarray, basis: tuple) -> numpy.ndarray:
+    """Projects unit vectors onto the plane tangent at center. Great circle arcs project to straight lines"""
+    depth = vectors @ center
+    return numpy.stack((vectors @ basis[0], vectors @ basis[1]), axis=-1) / depth[..., None]
+
+def _points_in_polygon(points: numpy.ndarray, polygon: numpy.ndarray) -> numpy.ndarray:
+    """Even-odd rule test of planar points against a planar polygon
+
+    :param points: array of shape (n, 2)
+    :param polygon: array of shape (k, 2)
+    :returns: boolean array of shape (n,)
+    """
+    x, y = points[:, 0:1], points[:, 1:2]
+    x1, y1 = polygon[:, 0], polygon[:, 1]
+    x2, y2 = numpy.roll(x1, -1), numpy.roll(y1, -1)
+    crosses = (y1 > y) != (y2 > y)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        x_intersect = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+    return numpy.count_nonzero(crosses & (x < x_intersect), axis=1) % 2 == 1
+
+def _polygons_overlap(polygon_a: numpy.ndarray, polygon_b: numpy.ndarray) -> bool:
+    """Tests whether two planar polygons overlap: an edge of one crosses an edge of the other, or one contains the other"""
+    if _points_in_polygon(polygon_a[:1], polygon_b)[0] or _points_in_polygon(polygon_b[:1], polygon_a)[0]:
+        return True
+    a1, a2 = polygon_a[:, None, :], numpy.roll(polygon_a, -1, axis=0)[:, None, :]
+    b1, b2 = polygon_b[None, :, :], numpy.roll(polygon_b, -1, axis=0)[None, :, :]
+
+    def orientation(p, q, r):
+        return numpy.sign((q[..., 0] - p[..., 0]) * (r[..., 1] - p[..., 1]) - (q[..., 1] - p[..., 1]) * (r[..., 0] - p[..., 0]))
+    return bool(numpy.any((orientation(a1, a2, b1) != orientation(a1, a2, b2)) & (orientation(b1, b2, a1) != orientation(b1, b2, a2))))
+
+def circle_vertices(ra: float, dec: float, radius: float, vertex_count: int = CIRCLE_OVERLAP_VERTICES) -> numpy.ndarray:
+    """Approximates a circle on the sky with a polygon
+
+    :param ra: Right ascension of the center, in degrees
+    :param dec: Declination of the center, in degrees
+    :param radius: Radius, in degrees
+    :param vertex_count: Number of polygon vertices
+    :returns: unit vectors of the vertices, shape (vertex_count, 3)
+    """
+    center = radec_to_vectors(ra, dec)
+    east, north = _tangent_basis(center)
+    angles = numpy.linspace(0, 2 * numpy.pi, vertex_count, endpoint=False)
+    radius = math.radians(radius)
+    return (math.cos(radius) * center + math.sin(radius) * (numpy.cos(angles)[:, None] * east + numpy.sin(angles)[:, None] * north))
+
+class FootprintIndex:
+    """Spatial index of circle and polygon footprints on the sky
+    The sky is cut into declination bands of cell_size degrees, each cut into roughly square cells. Every footprint is
+    listed under each cell its bounding cap touches, so a query only tests the few footprints sharing its cells exactly.
+    Footprints are any size under a hemisphere; records attached to them are returned by queries
+    """
+
+    def __init__(self, cell_size: float = 0.25):
+        """Initializes an empty index
+
+        :param cell_size: Size of the index cells, in degrees. Close to the typical footprint size works best
+        """
+        self.cell_size = cell_size
+        self._band_count = int(math.ceil(180.0 / cell_size))
+        band_edges = -90.0 + cell_size * numpy.arange(self._band_count + 1)
+        # Cells of a band are sized by its edge closest to the equator, so none is narrower than cell_size there
+        widest_cos = numpy.where((band_edges[:-1] < 0) & (band_edges[1:] > 0), 1.0,
+                                 numpy.cos(numpy.radians(numpy.minimum(numpy.abs(band_edges[:-1]), numpy.abs(band_edges[1:])))))
+        self._cells_per_band = numpy.maximum(1, numpy.floor(360.0 * widest_cos / cell_size)).astype(numpy.int64)
+        self._band_offsets = numpy.concatenate(([0], numpy.cumsum(self._cells_per_band)))
+        self.records = []
+        # Per footprint
+        self._record_ids = []
+        self._centers = []
+        self._bound_radii = []
+        self._circle_radii = []
+        self._vertices = []
+        self._dirty = False
+        self._cell_ids = self._cell_footprints = None
+
+    def __len__(self) -> int:
+        return len(self._record_ids)
+
+    def _cap_cells(self, ra: float, dec: float, radius: float) -> numpy.ndarray:
+        """Returns the ids of every cell a cap touches"""
+        cell_ids = []
+        first_band = int(numpy.clip((max(dec - radius, -90.0) + 90.0) // self.cell_size, 0, self._band_count - 1))
+        last_band = int(numpy.clip((min(dec + radius, 90.0) + 90.0) // self.cell_size, 0, self._band_count - 1))
+        # Half width in right ascension of the cap, unless it covers a pole
+        sin_radius, cos_dec = math.sin(math.radians(radius)), math.cos(math.radians(dec))
+        half_width = math.degrees(math.asin(sin_radius / cos_dec)) if sin_radius < cos_dec and abs(dec) + radius < 90.0 else 180.0
+        for band in range(first_band, last_band + 1):
+            cell_count = int(self._cells_per_band[band])
+            cell_width = 360.0 / cell_count
+            first_cell = int(math.floor((ra - half_width) / cell_width))
+            last_cell = int(math.floor((ra + half_width) / cell_width))
+            if half_width >= 180.0 or last_cell - first_cell + 1 >= cell_count:
+                cells = numpy.arange(cell_count)
+            else:
+                cells = numpy.arange(first_cell, last_cell + 1) % cell_count
+            cell_ids.append(self._band_offsets[band] + cells)
+        return numpy.concatenate(cell_ids)
+
+    def _point_cells(self, ra: numpy.ndarray, dec: numpy.ndarray) -> numpy.ndarray:
+        """Returns the id of the cell holding each point"""
+        bands = numpy.clip(((dec + 90.0) // self.cell_size).astype(numpy.int64), 0, self._band_count - 1)
+        cell_counts = self._cells_per_band[bands]
+        cells = numpy.floor((ra % 360.0) / (360.0 / cell_counts)).astype(numpy.int64) % cell_counts
+        return self._band_offsets[bands] + cells
+
+    def _add_footprint(self, record_id: int, center: numpy.ndarray, bound_radius: float, circle_radius: float = None,
+                       vertices: numpy.ndarray = None):
+        self._record_ids.append(record_id)
+        self._centers.append(center)
+        self._bound_radii.append(bound_radius)
+        self._circle_radii.append(numpy.nan if circle_radius is None else circle_radius)
+        self._vertices.append(vertices)
+        self._dirty = True
+
+    def add_circle(self, ra: float, dec: float, radius: float, record=None) -> int:
+        """Adds a circular footprint
+
+        :param ra: Right ascension of the center, in degrees
+        :param dec: Declination of the center, in degrees
+        :param radius: Radius, in degrees
+        :param record: Anything to return along with the footprint in query results
+        :returns: id of the record
+        """
+        self.records.append(record)
+        self._add_footprint(len(self.records) - 1, radec_to_vectors(ra, dec), radius, circle_radius=radius)
+        return len(self.records) - 1
+
+    def add_polygon(self, ra, dec, record=None) -> int:
+        """Adds a polygon footprint. Edges are great circle arcs between consecutive vertices
+
+        :param ra: Right ascensions of the vertices, in degrees
+        :param dec: Declinations of the vertices, in degrees
+        :param record: Anything to return along with the footprint in query results
+        :returns: id of the record
+        """
+        self.records.append(record)
+        self._add_polygon_vectors(len(self.records) - 1, radec_to_vectors(numpy.asarray(ra, dtype=float), numpy.asarray(dec, dtype=float)))
+        return len(self.records) - 1
+
+    def _add_polygon_vectors(self, record_id: int, vertices: numpy.ndarray):
+        center = vertices.mean(axis=0)
+        center /= numpy.linalg.norm(center)
+        bound_radius = math.degrees(math.acos(numpy.clip((vertices @ center).min(), -1, 1)))
+        self._add_footprint(record_id, center, bound_radius, vertices=vertices)
+
+    def add_s_region(self, s_region: str, record=None) -> int:
+        """Adds every shape of a MAST s_region string, all sharing one record
+
+        :param s_region: STC-S region string
+        :param record: Anything to return along with the footprint in query results
+        :returns: id of the record, or None if the s_region holds no supported shape
+        """
+        record_ids = self.add_region_set(parse_s_regions([s_region]), [record])
+        return record_ids[0] if record_ids else None
+
+    def add_region_set(self, region_set: RegionSet, records: list = None) -> list:
+        """Adds every shape of a RegionSet. Shapes sharing an owner share one record
+
+        :param region_set: Regions to add, e.g. from ggui.regions.parse_s_regions
+        :param records: Record of each region owner. Defaults to the owner index
+        :returns: list of the record id of each owner that had at least one shape
+        """
+        owner_record_ids = {}
+        for index in range(len(region_set)):
+            owner = int(region_set.owners[index])
+            if owner not in owner_record_ids:
+                self.records.append(records[owner] if records is not None else owner)
+                owner_record_ids[owner] = len(self.records) - 1
+            shape, parameters = region_set.shape(index)
+            if shape == 'CIRCLE':
+                self._add_footprint(owner_record_ids[owner], radec_to_vectors(parameters[0], parameters[1]), parameters[2], circle_radius=parameters[2])
+            else:
+                self._add_polygon_vectors(owner_record_ids[owner], radec_to_vectors(parameters[0::2], parameters[1::2]))
+        return list(owner_record_ids.values())
+
+    def build(self):
+        """(Re)builds the cell lookup. Called automatically by the first query after footprints were added"""
+        centers = numpy.array(self._centers).reshape(-1, 3)
+        center_ra, center_dec = vectors_to_radec(centers)
+        cells = [self._cap_cells(ra, dec, radius) for ra, dec, radius in zip(center_ra, center_dec, self._bound_radii)]
+        cell_ids = numpy.concatenate(cells) if cells else numpy.empty(0, dtype=numpy.int64)
+        footprints = numpy.repeat(numpy.arange(len(cells)), [len(cell) for cell in cells])
+        order = numpy.argsort(cell_ids, kind='stable')
+        self._cell_ids, self._cell_footprints = cell_ids[order], footprints[order]
+        self._center_array = centers
+        self._bound_cos = numpy.cos(numpy.radians(self._bound_radii))
+        self._bound_radius_array = numpy.array(self._bound_radii, dtype=float)
+        self._circle_cos = numpy.cos(numpy.radians(self._circle_radii))
+        self._record_id_array = numpy.array(self._record_ids, dtype=numpy.int64)
+        self._dirty = False
+
+    def _candidates(self, cell_ids: numpy.ndarray) -> numpy.ndarray:
+        """Returns the ids of the footprints listed under any of the given cells"""
+        if self._dirty or self._cell_ids is None:
+            self.build()
+        starts = numpy.searchsorted(self._cell_ids, cell_ids, side='left')
+        ends = numpy.searchsorted(self._cell_ids, cell_ids, side='right')
+        if len(cell_ids) == 1:
+            return self._cell_footprints[starts[0]:ends[0]]
+        return numpy.unique(numpy.concatenate([self._cell_footprints[start:end] for start, end in zip(starts, ends)]))
+
+    def _contains(self, footprint: int, point: numpy.ndarray) -> bool:
+        """Exact test of a point (unit vector) against a footprint"""
+        if self._vertices[footprint] is None:
+            return point @ self._center_array[footprint] >= self._circle_cos[footprint]
+        center = self._center_array[footprint]
+        basis = _tangent_basis(center)
+        return bool(_points_in_polygon(_gnomonic(point[None, :], center, basis), _gnomonic(self._vertices[footprint], center, basis))[0])
+
+    def query_point(self, ra: float, dec: float) -> list:
+        """Finds every footprint containing a point
+
+        :param ra: Right ascension, in degrees
+        :param dec: Declination, in degrees
+        :returns: list of record ids, without duplicates
+        """
+        point = radec_to_vectors(ra, dec)
+        candidates = self._candidates(self._point_cells(numpy.array([ra], dtype=float), numpy.array([dec], dtype=float)))
+        candidates = candidates[self._center_array[candidates] @ point >= self._bound_cos[candidates]]
+        return list(dict.fromkeys(int(self._record_id_array[footprint]) for footprint in candidates if self._contains(footprint, point)))
+
+    def query_points(self, ra, dec) -> list:
+        """Finds the footprints containing each of many points
+
+        :param ra: Right ascensions, in degrees
+        :param dec: Declinations, in degrees
+        :returns: list of lists of record ids, one per point
+        """
+        return [self.query_point(point_ra, point_dec) for point_ra, point_dec in zip(numpy.atleast_1d(ra), numpy.atleast_1d(dec))]
+
+    def query_circle(self, ra: float, dec: float, radius: float) -> list:
+        """Finds every footprint overlapping a circle
+
+        :param ra: Right ascension of the center, in degrees
+        :param dec: Declination of the center, in degrees
+        :param radius: Radius, in degrees
+        :returns: list of record ids, without duplicates
+        """
+        return self._query_footprint(radec_to_vectors(ra, dec), radius, circle_vertices(ra, dec, radius))
+
+    def query_polygon(self, ra, dec) -> list:
+        """Finds every footprint overlapping a polygon
+
+        :param ra: Right ascensions of the vertices, in degrees
+        :param dec: Declinations of the vertices, in degrees
+        :returns: list of record ids, without duplicates
+        """
+        vertices = radec_to_vectors(numpy.asarray(ra, dtype=float), numpy.asarray(dec, dtype=float))
+        center = vertices.mean(axis=0)
+        center /= numpy.linalg.norm(center)
+        return self._query_footprint(center, math.degrees(math.acos(numpy.clip((vertices @ center).min(), -1, 1))), vertices)
+
+    def _query_footprint(self, center: numpy.ndarray, bound_radius: float, vertices: numpy.ndarray) -> list:
+        center_ra, center_dec = vectors_to_radec(center)
+        candidates = self._candidates(self._cap_cells(float(center_ra), float(center_dec), bound_radius))
+        # Bounding caps must overlap
+        separations = numpy.degrees(numpy.arccos(numpy.clip(self._center_array[candidates] @ center, -1, 1)))
+        candidates = candidates[separations <= self._bound_radius_array[candidates] + bound_radius]
+        basis = _tangent_basis(center)
+        query_polygon = _gnomonic(vertices, center, basis)
+        # Footprints whose center falls within the query overlap it for sure. Test those all at once
+        candidate_centers = self._center_array[candidates]
+        projectable = candidate_centers @ center > 0
+        centered = numpy.zeros(len(candidates), dtype=bool)
+        centered[projectable] = _points_in_polygon(_gnomonic(candidate_centers[projectable], center, basis), query_polygon)
+        matches = [int(record_id) for record_id in self._record_id_array[candidates[centered]]]
+        for footprint in candidates[~centered]:
+            footprint_vertices = self._vertices[footprint]
+            if footprint_vertices is None:
+                footprint_ra, footprint_dec = vectors_to_radec(self._center_array[footprint])
+                footprint_vertices = circle_vertices(float(footprint_ra), float(footprint_dec), self._bound_radii[footprint])
+            # Both footprints must lie in the hemisphere around the query to be projected
+            if numpy.any(footprint_vertices @ center <= 0):
+                continue
+            if _polygons_overlap(query_polygon, _gnomonic(footprint_vertices, center, basis)):
+                matches.append(int(self._record_id_array[footprint]))
+        return list(dict.fromkeys(matches))
+
+def build_cross_match_index(store, coadd_footprints=None, cell_size: float = 0.25) -> FootprintIndex:
+    """Indexes every observation of a cross match store, and optionally the catalog's own coadds
+
+    :param store: ggui.cross_search.CrossMatchStore
+    :param coadd_footprints: Optional iterable of (target name, corner ra array, corner dec array), e.g. from
+        ggui.mastCrossSearch.getFITSFootprints
+    :param cell_size: Size of the index cells, in degrees
+    :returns: footprint index. Observation records are the store's observation dicts; coadd records are
+        {'target': name, 'obs_collection': 'GGUI_COADD'}
+    """
+    index = FootprintIndex(cell_size)
+    observations = store.observations()
+    index.add_region_set(parse_s_regions([observation['s_region'] for observation in observations]), observations)
+    for target_name, corner_ra, corner_dec in coadd_footprints or ():
+        index.add_polygon(corner_ra, corner_dec, {'target': target_name, 'obs_collection': 'GGUI_COADD'})
+    index.build()
+    return index
@@ -0,0 +1,66 @@
+"""
+.. module:: lazy_component
+    :synopsis: Glue component whose values are only read from the lightcurve cache once something uses them
+.. moduleauthor:: Duy Nguyen <dnguyen@nrao.edu>
+"""
+
+import threading
+
+import numpy
+from glue.core.component import Component
+from glue.utils import coerce_numeric
+
+class LazyColumnComponent(Component):
+    """Glue component standing in for a lightcurve column that has not been loaded
+    It is listed, and can be picked in viewers, like any other component. Its column is read (and parsed from the CSV,
+    if not cached yet) the first time its values are accessed, e.g. when a user plots it.
+    Unloaded columns are assumed numeric, as every gPhoton lightcurve column is
+    """
+
+    def __init__(self, lightcurve_cache, csv_path: str, column_name: str, shape: tuple, units: str = None):
+        """
+        :param lightcurve_cache: LightcurveCache the column is read from
+        :param csv_path: Path of the lightcurve CSV
+        :param column_name: Name of the column
+        :param shape: Shape of the column, i.e. (rows,)
+        :param units: Unit label
+        """
+        super().__init__(None, units)
+        self._lightcurve_cache = lightcurve_cache
+        self._csv_path = csv_path
+        self._column_name = column_name
+        self._shape = tuple(shape)
+        self._load_lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        """Whether the column has been read"""
+        return self._data is not None
+
+    @property
+    def data(self) -> numpy.ndarray:
+        """The column's values, read on first access"""
+        if self._data is None:
+            with self._load_lock:
+                if self._data is None:
+                    values = self._lightcurve_cache.load_columns(self._csv_path, [self._column_name])[self._column_name]
+                    values = coerce_numeric(values)
+                    values.setflags(write=False)
+                    self._data = values
+        return self._data
+
+    @property
+    def shape(self) -> tuple:
+        return self._shape
+
+    @property
+    def ndim(self) -> int:
+        return len(self._shape)
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    @property
+    def numeric(self) -> bool:
+        # Checking the values would load the column just to list it
+        return self._data is None or super().numeric
@@ -0,0 +1,220 @@
+"""
+.. module:: lightcurve_cache
+    :synopsis: Columnar binary cache of gPhoton lightcurve CSVs, loaded back as memory mapped arrays
+.. moduleauthor:: Duy Nguyen <dnguyen@nrao.edu>
+"""
+
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import tempfile
+
+import numpy
+
+from ggui.cache import cache_directory
+
+# Bump whenever the cache layout changes. Older entries are then converted again
+LIGHTCURVE_CACHE_VERSION = 3
+
+# Name of the file describing a cached CSV and its columns
+MANIFEST_NAME = 'manifest.json'
+
+def column_values(column) -> numpy.ndarray:
+    """Converts a parsed CSV column into the array Glue's own CSV reader would give
+    Glue fills empty cells of integer columns with -1 and keeps them integers, and fills those of other columns with NaN
+
+    :param column: pandas Series parsed with nullable dtypes, which tell integer columns with empty cells apart
+    :returns: numpy array. Text columns are fixed width, which numpy can memory map
+    """
+    import pandas
+
+    if pandas.api.types.is_bool_dtype(column.dtype) or pandas.api.types.is_integer_dtype(column.dtype):
+        return column.to_numpy(dtype=column.dtype.numpy_dtype, na_value=-1)
+    if pandas.api.types.is_float_dtype(column.dtype):
+        return column.to_numpy(dtype=column.dtype.numpy_dtype, na_value=numpy.nan)
+    return column.to_numpy(dtype=object, na_value='nan').astype(str)
+
+class LightcurveCache:
+    """Converts lightcurve CSVs into one .npy file per column, so they are parsed as text only once
+    Entries are keyed by the CSV's path and remain valid for as long as its size and mtime are unchanged.
+    Cached columns are memory mapped, so loading costs the same no matter how long the lightcurve is
+    """
+
+    def __init__(self, cache_path: str = None):
+        """
+        :param cache_path: Directory of the cache, created if needed. Defaults to lightcurves in the gGui cache directory
+        """
+        self.cache_path = pathlib.Path(cache_path) if cache_path else cache_directory('lightcurves')
+        self.cache_path.mkdir(parents=True, exist_ok=True)
+
+    def entry_path(self, csv_path: str) -> pathlib.Path:
+        """Returns the directory a CSV's columns are cached in
+
+        :param csv_path: Path of the lightcurve CSV
+        :returns: cache entry directory, which may not exist yet
+        """
+        return self.cache_path / hashlib.sha1(os.path.abspath(csv_path).encode('utf-8')).hexdigest()
+
+    def manifest(self, csv_path: str) -> dict:
+        """Returns the manifest of a CSV's cache entry, if the entry is up to date
+
+        :param csv_path: Path of the lightcurve CSV
+        :returns: manifest dict ('header' lists every column name in CSV order, 'columns' the file and dtype of every
+            cached column, and 'rows' the row count, if known yet), or None
+        """
+        try:
+            with open(str(self.entry_path(csv_path) / MANIFEST_NAME)) as manifest_file:
+                manifest = json.load(manifest_file)
+            stat = os.stat(csv_path)
+        except (OSError, ValueError):
+            return None
+        if (manifest.get('version') != LIGHTCURVE_CACHE_VERSION or manifest.get('source') != os.path.abspath(csv_path)
+                or manifest.get('fingerprint') != [stat.st_size, stat.st_mtime_ns]):
+            return None
+        return manifest
+
+    def convert(self, csv_path: str, columns: list = None) -> dict:
+        """Parses columns of a CSV and writes them to the cache
+        Only columns not cached yet are parsed. A CSV that changed since it was cached starts a new entry
+
+        :param csv_path: Path of the lightcurve CSV
+        :param columns: Names of the columns to convert. Defaults to every column. Names not in the CSV are ignored
+        :returns: manifest of the entry
+        """
+        import pandas
+
+        stat = os.stat(csv_path)
+        entry_path = self.entry_path(csv_path)
+        manifest = self.manifest(csv_path)
+        if manifest is None:
+            # pandas renames duplicate column names, so take the names from pandas rather than the raw header line
+            header = [str(name) for name in pandas.read_csv(csv_path, nrows=0, engine='c', comment='#', skip_blank_lines=True).columns]
+            manifest = {'version': LIGHTCURVE_CACHE_VERSION, 'source': os.path.abspath(csv_path),
+                        'fingerprint': [stat.st_size, stat.st_mtime_ns], 'rows': None, 'header': header, 'columns': {}}
+        header = manifest['header']
+        wanted = [name for name in (header if columns is None else columns) if name in header and name not in manifest['columns']]
+        if not wanted:
+            if manifest['rows'] is not None:
+                return manifest
+            # Parse one column to learn the row count
+            wanted = header[:1]
+        # gPhoton lightcurves end in commented '# key = value' parameter rows, which are not data. Floats are parsed
+        # exactly and nullable dtypes keep integer columns with empty cells apart, so values match Glue's own reader
+        table = pandas.read_csv(csv_path, engine='c', usecols=wanted, comment='#', skip_blank_lines=True, float_precision='round_trip',
+                                dtype_backend='numpy_nullable') if wanted else pandas.DataFrame()
+        manifest['rows'] = len(table)
+
+        # A new entry is written next to its final place, then swapped in, so a reader never sees a partial entry.
+        # Columns added to an existing entry are written under temporary names first, for the same reason
+        new_entry = not entry_path.is_dir() or not manifest['columns']
+        write_path = pathlib.Path(tempfile.mkdtemp(prefix=entry_path.name + '.', dir=str(self.cache_path))) if new_entry else entry_path
+        try:
+            for name in table.columns:
+                values = column_values(table[name])
+                column_file = 'column_{0:d}.npy'.format(header.index(str(name)))
+                with open(str(write_path / (column_file + '.part')), 'wb') as column_output:
+                    numpy.save(column_output, values, allow_pickle=False)
+                os.replace(str(write_path / (column_file + '.part')), str(write_path / column_file))
+                manifest['columns'][str(name)] = {'file': column_file, 'dtype': values.dtype.str}
+            with open(str(write_path / (MANIFEST_NAME + '.part')), 'w') as manifest_file:
+                json.dump(manifest, manifest_file)
+            os.replace(str(write_path / (MANIFEST_NAME + '.part')), str(write_path / MANIFEST_NAME))
+            if new_entry:
+                if entry_path.exists():
+                    shutil.rmtree(str(entry_path), ignore_errors=True)
+                os.replace(str(write_path), str(entry_path))
+        finally:
+            if new_entry and write_path.exists():
+                shutil.rmtree(str(write_path), ignore_errors=True)
+        return manifest
+
+    def column_names(self, csv_path: str) -> list:
+        """Returns the names of every column of a CSV, in CSV order, parsing no more than its header
+
+        :param csv_path: Path of the lightcurve CSV
+        :returns: list of column names
+        """
+        manifest = self.manifest(csv_path) or self.convert(csv_path, [])
+        return list(manifest['header'])
+
+    def row_count(self, csv_path: str) -> int:
+        """Returns the number of rows of a CSV
+
+        :param csv_path: Path of the lightcurve CSV
+        :returns: number of rows
+        """
+        manifest = self.manifest(csv_path)
+        if manifest is None or manifest['rows'] is None:
+            manifest = self.convert(csv_path, [])
+        return manifest['rows']
+
+    def is_cached(self, csv_path: str, columns: list = None) -> bool:
+        """Checks whether columns of a CSV can be loaded without parsing it
+
+        :param csv_path: Path of the lightcurve CSV
+        :param columns: Names of the columns. Defaults to every column. Names not in the CSV are ignored
+        :returns: True if the entry is up to date and holds every column
+        """
+        manifest = self.manifest(csv_path)
+        return manifest is not None and manifest['rows'] is not None and all(
+            name in manifest['columns'] for name in (manifest['header'] if columns is None else columns) if name in manifest['header'])
+
+    def load_columns(self, csv_path: str, columns: list = None) -> OrderedDict:
+        """Returns columns of a CSV as memory mapped arrays, converting any that are not cached yet
+
+        :param csv_path: Path of the lightcurve CSV
+        :param columns: Names of the columns to return. Defaults to every column. Names not in the CSV are ignored
+        :returns: ordered dict of column name to read only array, in CSV order
+        """
+        manifest = (self.manifest(csv_path) if self.is_cached(csv_path, columns) else None) or self.convert(csv_path, columns)
+        entry_path = self.entry_path(csv_path)
+        wanted = set(manifest['header'] if columns is None else columns)
+        return OrderedDict((name, numpy.load(str(entry_path / manifest['columns'][name]['file']), mmap_mode='r'))
+                           for name in manifest['header'] if name in wanted and name in manifest['columns'])
+
+    def load_data(self, csv_path: str, label: str = None, columns: list = None):
+        """Loads a lightcurve CSV as a Glue Data object, built from cached columns
+
+        :param csv_path: Path of the lightcurve CSV
+        :param label: Label of the data. Defaults to the label Glue would give the file
+        :param columns: Columns to load up front. Every other column becomes a component that is only read
+            (and converted, if need be) once something uses it. Defaults to every column
+        :returns: Glue Data with one component per column, in CSV order
+        """
+        from glue.core import Data
+        from glue.core.data_factories.helpers import data_label
+        from ggui.lazy_component import LazyColumnComponent
+
+        loaded = self.load_columns(csv_path, columns)
+        rows = self.row_count(csv_path)
+        data = Data(label=label or data_label(csv_path))
+        # Added one by one, since Data(**columns) would sort them by name rather than keep the CSV's order
+        for name in self.column_names(csv_path):
+            if name in loaded:
+                data.add_component(loaded[name], name)
+            else:
+                data.add_component(LazyColumnComponent(self, csv_path, name, (rows,)), name)
+        return data
+
+    def purge(self) -> int:
+        """Deletes every cache entry whose CSV was modified or no longer exists
+
+        :returns: number of entries deleted
+        """
+        purged = 0
+        for entry_path in self.cache_path.iterdir():
+            # Entries being written have a dotted temporary name
+            if '.' in entry_path.name:
+                continue
+            try:
+                with open(str(entry_path / MANIFEST_NAME)) as manifest_file:
+                    source = json.load(manifest_file)['source']
+            except (OSError, ValueError, KeyError):
+                source = None
+            if source is None or self.manifest(source) is None:
+                shutil.rmtree(str(entry_path), ignore_errors=True)
+                purged += 1
+        return purged
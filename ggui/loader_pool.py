@@ -0,0 +1,341 @@
+"""
+.. module:: loader_pool
+    :synopsis: Loader processes that parse gPhoton data products away from the GUI, handing arrays back through shared memory
+.. moduleauthor:: Duy Nguyen <dnguyen@nrao.edu>
+"""
+
+from collections import deque
+from concurrent.futures import Future
+import io
+import itertools
+import multiprocessing
+from multiprocessing import shared_memory
+from multiprocessing.connection import wait
+import os
+import signal
+import threading
+import time
+import traceback
+import weakref
+
+import numpy
+
+# Seconds a loader process may spend on one task before it is considered hung, killed and replaced
+LOAD_TIMEOUT = 120.0
+
+# Arrays smaller than this are sent through the pipe. Shared memory only pays off for larger ones
+INLINE_ARRAY_BYTES = 65536
+
+# Shared memory segments only outlive the process that created them on POSIX systems
+SHARED_MEMORY_SUPPORTED = os.name == 'posix'
+
+class ProductLoadError(RuntimeError):
+    """A data product could not be loaded: reading it failed, or its loader process crashed or hung"""
+
+# Name prefix of the shared memory segments of the task a loader process is running, and the segments it created so far
+_task_segment_prefix = None
+_task_segments = []
+
+# Buffers of the shared memory segments arrays were attached to in this process
+_attached_buffers = weakref.WeakSet()
+
+def _task_segment_names(prefix: str):
+    """Yields the names a task's shared memory segments get, in the order they are created"""
+    return (prefix + str(segment_number) for segment_number in itertools.count())
+
+def unlink_task_segments(prefix: str):
+    """Frees the shared memory segments a task created, e.g. when its loader process died before handing them over
+
+    :param prefix: Name prefix of the task's segments
+    """
+    for name in _task_segment_names(prefix):
+        try:
+            segment = shared_memory.SharedMemory(name=name)
+        except FileNotFoundError:
+            return
+        segment.close()
+        segment.unlink()
+
+def share_array(array: numpy.ndarray) -> dict:
+    """Copies an array into a new shared memory segment. Run in the loader processes
+
+    :param array: Array to share
+    :returns: descriptor of the array, to pass to attach_array in the GUI process
+    """
+    array = numpy.ascontiguousarray(array)
+    if array.nbytes < INLINE_ARRAY_BYTES or array.dtype.hasobject:
+        return {'inline': array}
+    # Segments are named after their task, so whoever ends up with them can be found should the task fail
+    segment = shared_memory.SharedMemory(name=_task_segment_prefix + str(len(_task_segments)), create=True, size=array.nbytes)
+    _task_segments.append(segment.name)
+    shared = numpy.ndarray(array.shape, array.dtype, buffer=segment.buf)
+    shared[...] = array
+    # The segment cannot be closed while an array still uses its buffer
+    del shared
+    segment.close()
+    return {'name': segment.name, 'shape': array.shape, 'dtype': array.dtype.str}
+
+def _close_segment(segment: shared_memory.SharedMemory):
+    try:
+        segment.close()
+    except BufferError:
+        # Something still uses the buffer. The mapping goes away with it instead
+        pass
+
+def attach_array(descriptor: dict) -> numpy.ndarray:
+    """Returns the array a loader process shared, without copying it
+
+    :param descriptor: Descriptor returned by share_array
+    :returns: array backed by the shared memory segment, which is freed once the array is
+    """
+    if 'inline' in descriptor:
+        return descriptor['inline']
+    segment = shared_memory.SharedMemory(name=descriptor['name'])
+    array = numpy.ndarray(tuple(descriptor['shape']), numpy.dtype(descriptor['dtype']), buffer=segment.buf)
+    _attached_buffers.add(array.base)
+    # Nothing else attaches to the segment. Its pages stay mapped for as long as the array is alive
+    segment.unlink()
+    weakref.finalize(array, _close_segment, segment)
+    return array
+
+def is_shared_buffer(buffer) -> bool:
+    """Checks whether an array's base is the buffer of a shared memory segment attached by attach_array
+
+    :param buffer: Base of an array
+    :returns: True for shared memory, which is resident, unlike the memory mapped files it looks alike to
+    """
+    try:
+        return buffer in _attached_buffers
+    except TypeError:
+        return False
+
+def read_fits_product(filepath: str) -> list:
+    """Reads every HDU of a FITS file, sharing their data. Run in the loader processes
+
+    :param filepath: Path of the FITS file
+    :returns: list of HDU dicts of 'kind' ('image', 'table' or 'empty'), 'header' (as string), and 'data' (array
+        descriptor, for images and tables), to pass to fits_from_shared in the GUI process
+    """
+    from astropy.io import fits
+
+    hdus = []
+    with fits.open(filepath, ignore_missing_end=True, mode='denywrite') as hdulist:
+        hdulist.verify('fix')
+        for hdu in hdulist:
+            header = hdu.header.copy()
+            if isinstance(hdu, (fits.PrimaryHDU, fits.ImageHDU, fits.CompImageHDU)) and hdu.data is not None:
+                # Images are shared scaled and decompressed, so their headers must no longer describe the stored values
+                for keyword in ('BSCALE', 'BZERO', 'BLANK'):
+                    header.remove(keyword, ignore_missing=True)
+                hdus.append({'kind': 'image', 'header': header.tostring(), 'data': share_array(hdu.data)})
+            elif isinstance(hdu, (fits.TableHDU, fits.BinTableHDU)) and hdu.data is not None:
+                # Table columns may be scaled, or stored as strings or bits. Share the table in FITS form instead
+                table_file = io.BytesIO()
+                fits.HDUList([fits.PrimaryHDU(), type(hdu)(data=hdu.data.copy(), header=hdu.header)]).writeto(table_file)
+                hdus.append({'kind': 'table', 'header': header.tostring(),
+                             'data': share_array(numpy.frombuffer(table_file.getbuffer(), dtype=numpy.uint8))})
+            else:
+                hdus.append({'kind': 'empty', 'header': header.tostring()})
+    return hdus
+
+def fits_from_shared(hdus: list):
+    """Rebuilds a FITS file read by read_fits_product, around its shared arrays
+
+    :param hdus: HDU dicts returned by read_fits_product
+    :returns: astropy HDUList
+    """
+    from astropy.io import fits
+
+    hdulist = fits.HDUList()
+    for extnum, hdu in enumerate(hdus):
+        if hdu['kind'] == 'table':
+            table_file = fits.open(io.BytesIO(attach_array(hdu['data']).tobytes()))
+            # Read the table now, while the file is open
+            table_file[1].data
+            hdulist.append(table_file[1])
+            continue
+        header = fits.Header.fromstring(hdu['header'])
+        data = attach_array(hdu['data']) if hdu['kind'] == 'image' else None
+        hdulist.append((fits.PrimaryHDU if extnum == 0 else fits.ImageHDU)(data=data, header=header))
+    return hdulist
+
+def convert_lightcurve(cache_path: str, csv_path: str, columns: list) -> str:
+    """Converts the columns of a lightcurve CSV into the lightcurve cache. Run in the loader processes
+    The converted columns are memory mapped from the cache afterwards, so nothing is sent back
+
+    :param cache_path: Directory of the lightcurve cache
+    :param csv_path: Path of the lightcurve CSV
+    :param columns: Names of the columns to convert
+    :returns: None, or why the CSV cannot be cached
+    """
+    from ggui.lightcurve_cache import LightcurveCache
+
+    try:
+        LightcurveCache(cache_path).convert(csv_path, columns)
+    except (OSError, ValueError) as e:
+        return str(e)
+    return None
+
+def _loader_main(connection):
+    """Runs the tasks sent over a pipe, until the pipe closes. Main loop of the loader processes"""
+    global _task_segment_prefix
+    # Interrupting gGui from its terminal is for the GUI process to handle
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    while True:
+        try:
+            _task_segment_prefix, function, args = connection.recv()
+        except EOFError:
+            return
+        _task_segments.clear()
+        try:
+            reply = (True, function(*args))
+        except Exception as e:
+            unlink_task_segments(_task_segment_prefix)
+            reply = (False, type(e).__name__ + ": " + str(e) + "\n" + traceback.format_exc())
+        connection.send(reply)
+
+class _LoaderProcess:
+    """A loader process, with the pipe it takes tasks from and the task it is running"""
+
+    def __init__(self, context):
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(target=_loader_main, args=(child_connection,), name='ggui-loader', daemon=True)
+        self.process.start()
+        child_connection.close()
+        self.future = None
+        self.description = None
+        self.started = None
+        self.task_number = 0
+
+    @property
+    def segment_prefix(self) -> str:
+        """Name prefix of the shared memory segments of the current task. Kept short, as macOS limits names to 31 characters"""
+        return 'ggui_{0:d}_{1:d}_'.format(self.process.pid, self.task_number)
+
+    def run(self, future: Future, description: str, function, args: tuple):
+        self.task_number += 1
+        self.future, self.description, self.started = future, description, time.monotonic()
+        self.connection.send((self.segment_prefix, function, args))
+
+    def finish(self) -> Future:
+        future = self.future
+        self.future = self.description = self.started = None
+        return future
+
+    def kill(self):
+        self.connection.close()
+        self.process.kill()
+        self.process.join()
+        # The task it was running may have left shared memory segments behind
+        unlink_task_segments(self.segment_prefix)
+
+class LoaderPool:
+    """Runs product loading tasks in a few separate processes, so parsing never holds the GUI process's GIL
+    A loader process that crashes, or hangs for longer than the timeout, is killed and replaced by a fresh one.
+    Only the task it was running fails, with ProductLoadError. Processes are started on first use
+    """
+
+    def __init__(self, processes: int = None, timeout: float = LOAD_TIMEOUT):
+        """
+        :param processes: Number of loader processes. Defaults to the number of CPUs, up to 4
+        :param timeout: Seconds a task may run before its process is considered hung
+        """
+        self.processes = processes or min(4, os.cpu_count() or 1)
+        self.timeout = timeout
+        # Forking would copy the GUI's threads and Qt state into the loader processes
+        self._context = multiprocessing.get_context('spawn')
+        self._lock = threading.Lock()
+        self._queue = deque()
+        self._loaders = []
+        self._wakeup_receiver, self._wakeup_sender = multiprocessing.Pipe(duplex=False)
+        self._dispatcher = None
+        self._closed = False
+
+    def submit(self, function, *args, description: str = None) -> Future:
+        """Queues a task for the loader processes
+
+        :param function: Module level function to run. Its arguments and result must be picklable
+        :param args: Arguments of the function
+        :param description: What the task does, for error messages. Defaults to its first argument
+        :returns: future of the function's result. It fails with ProductLoadError if the function raises, or its
+            loader process crashes or hangs
+        """
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Loader pool is closed")
+            self._queue.append((future, description or str(args[0] if args else function.__name__), function, args))
+            if self._dispatcher is None:
+                self._loaders = [_LoaderProcess(self._context) for _ in range(self.processes)]
+                self._dispatcher = threading.Thread(target=self._dispatch, name='ggui-loader-dispatcher', daemon=True)
+                self._dispatcher.start()
+        self._wakeup_sender.send_bytes(b'')
+        return future
+
+    def close(self):
+        """Stops the loader processes. Tasks not finished yet fail"""
+        with self._lock:
+            self._closed = True
+        self._wakeup_sender.send_bytes(b'')
+        if self._dispatcher is not None:
+            self._dispatcher.join()
+
+    def _replace(self, loader: _LoaderProcess) -> _LoaderProcess:
+        loader.kill()
+        replacement = _LoaderProcess(self._context)
+        self._loaders[self._loaders.index(loader)] = replacement
+        return replacement
+
+    def _dispatch(self):
+        """Hands queued tasks to idle loader processes and collects their results. Runs in its own thread"""
+        while True:
+            with self._lock:
+                if self._closed:
+                    break
+                for loader in list(self._loaders):
+                    while loader.future is None and self._queue:
+                        future, description, function, args = self._queue.popleft()
+                        if not future.set_running_or_notify_cancel():
+                            continue
+                        try:
+                            loader.run(future, description, function, args)
+                        except (OSError, ValueError):
+                            # The process died while idle
+                            loader.finish()
+                            loader = self._replace(loader)
+                            loader.run(future, description, function, args)
+            busy = [loader for loader in self._loaders if loader.future is not None]
+            deadline = min((loader.started + self.timeout for loader in busy), default=None)
+            ready = wait([loader.connection for loader in busy] + [self._wakeup_receiver],
+                         None if deadline is None else max(0.0, deadline - time.monotonic()))
+            while self._wakeup_receiver.poll():
+                self._wakeup_receiver.recv_bytes()
+            for loader in busy:
+                description = loader.description
+                if loader.connection in ready:
+                    try:
+                        succeeded, result = loader.connection.recv()
+                    except (EOFError, OSError):
+                        future = loader.finish()
+                        self._replace(loader)
+                        future.set_exception(ProductLoadError("Loader process crashed (exit code " + str(loader.process.exitcode)
+                                                              + ") while loading " + description))
+                        continue
+                    future = loader.finish()
+                    if succeeded:
+                        future.set_result(result)
+                    else:
+                        future.set_exception(ProductLoadError("Unable to load " + description + ": " + result))
+                elif time.monotonic() - loader.started >= self.timeout:
+                    future = loader.finish()
+                    self._replace(loader)
+                    future.set_exception(ProductLoadError("Loading " + description + " took over " + str(self.timeout) + " s. Gave up"))
+
+        for loader in self._loaders:
+            if loader.future is not None:
+                loader.finish().set_exception(ProductLoadError("Loader pool closed while loading " + loader.description))
+            loader.kill()
+        for future, description, _, _ in self._queue:
+            if future.set_running_or_notify_cancel():
+                future.set_exception(ProductLoadError("Loader pool closed before loading " + description))
+        self._queue.clear()
@@ -5,25 +5,32 @@
 """
 
 import argparse
+from functools import partial
 import pathlib
-import tempfile
-import urllib
-from urllib.parse import urlparse
 import webbrowser
-import yaml
-from zipfile import ZipFile
 
 from glue.core import DataCollection
 from glue.app.qt.application import GlueApplication
-from glue.config import menubar_plugin
 from glue.utils import nonpartial
 from PyQt5 import QtWidgets, QtCore
+import yaml
 
-from ggui import qtTabLayouts
-from ggui.targetManager import TargetManager
-from ggui.make_param import validate_target_catalog_file
+# ggui.qtTabLayouts (and with it the scatter and image viewers and matplotlib) is imported once the window is up
+from ggui.targetManager import TargetManager, switch_timing_panel
+from ggui.catalog import validate_target_catalog_file
+from ggui.sample_data import sample_data_path
+from ggui.session import ParsedCatalogCache, last_session_path, read_session, write_session
+from ggui.timing import switch_timer
+from ggui.watchdog import STALL_THRESHOLD, StallWatchdog
 from .version import __version__
 
+# File dialog filter of every gGui Target Catalog format
+TARGET_CATALOG_NAME_FILTER = "gGUI YAML (*.yaml *.yml);;gGui SQLite Catalog (*.sqlite *.db)"
+# File dialog filter of gGui session snapshots
+SESSION_NAME_FILTER = "gGui Session (*.json)"
+# Milliseconds the timing summary of a target switch stays in the status bar
+SWITCH_SUMMARY_TIMEOUT = 15000
+
 # Enable High DPI
 QtWidgets.QApplication.setAttribute(QtCore.Qt.AA_EnableHighDpiScaling, True) #enable highdpi scaling
 QtWidgets.QApplication.setAttribute(QtCore.Qt.AA_UseHighDpiPixmaps, True) #use highdpi icons
@@ -37,13 +44,19 @@ class gGuiGlueApplication(GlueApplication):
         self,
         data_collection: DataCollection = DataCollection(),
         imported_target_catalogs: dict = None,
+        target_catalog_paths: list = None,
+        session_path: str = None,
     ):
         """Initializes gGui
         If provided a dictionary of targets, in outlined gGui YAML structure,
-        it will load those targets into the target manager
+        it will load those targets into the target manager.
+        The overview tab is built, and the target catalogs loaded, once the event loop starts,
+        so the window appears without waiting for the data viewers to be imported or the catalogs to be validated
 
         :param data_collection: Glue data collection containing Glue data to plot
         :param imported_target_catalogs: Dict of targets and paths to associated gPhoton data products to load initially
+        :param target_catalog_paths: Paths of gGui Target Catalogs to validate and load initially
+        :param session_path: Path of a gGui session snapshot to restore initially
         """
         super().__init__(data_collection)
         # Modify window title to specify gGui modified Glue environment
@@ -53,6 +66,12 @@ class gGuiGlueApplication(GlueApplication):
         self.menuBar().actions()[0].menu().addAction(
             "Load gGui Target Catalog", self.load_ggui_yaml
         )
+        self.menuBar().actions()[0].menu().addAction(
+            "Save gGui Session", self.save_ggui_session
+        )
+        self.menuBar().actions()[0].menu().addAction(
+            "Restore gGui Session", self.restore_ggui_session
+        )
 
         # Rename Glue "Help" to "Glue Help"
         self.menuBar().actions()[6].setText("&Glue Help")
@@ -70,51 +89,148 @@ class gGuiGlueApplication(GlueApplication):
         # Add tutorial button
         menu_about_ggui.addAction("Load gGui Sample Data", self.ggui_tutorial)
 
+        self.overview_widget = None
+        # Session snapshot being restored, whose viewer states apply to the overview of its primary target
+        self._restoring_snapshot = None
+
+        # Initialize empty Target Manager
+        self.target_manager = TargetManager(self, self.primary_target_changed)
+        self.addToolBarBreak()
+        self.addToolBar(self.target_manager)
+
+        # Add target switch timing panel, hidden until toggled from the "View" menu
+        self.switch_timing_panel = switch_timing_panel(self)
+        self.addDockWidget(QtCore.Qt.BottomDockWidgetArea, self.switch_timing_panel)
+        self.switch_timing_panel.hide()
+        self.menuBar().actions()[2].menu().addSeparator()
+        self.menuBar().actions()[2].menu().addAction(self.switch_timing_panel.toggleViewAction())
+        # Summarize every timed switch in the status bar
+        switch_timer().add_listener(
+            lambda switch: self.statusBar().showMessage(switch.summary(), SWITCH_SUMMARY_TIMEOUT)
+        )
+
+        # Everything else waits for the first pass of the event loop, which comes right after the window is shown
+        QtCore.QTimer.singleShot(0, partial(self.finish_startup, imported_target_catalogs, target_catalog_paths, session_path))
+
+    def finish_startup(self, imported_target_catalogs: dict = None, target_catalog_paths: list = None, session_path: str = None):
+        """Builds the overview tab and loads the initial target catalogs or session
+        Called once the window is shown. See __init__
+
+        :param imported_target_catalogs: Dict of validated gGui Target Catalogs and their targets
+        :param target_catalog_paths: Paths of gGui Target Catalogs still to validate
+        :param session_path: Path of a gGui session snapshot to restore
+        """
+        from ggui import qtTabLayouts
+
         # Save a reference to the default tab
         # We won't need this, but can't delete it until we have multiple tabs
         default_tab = self.current_tab
 
         # Initialize blank overview tab
-        def init_overview_tab(self):
-            # Initialize blank overview_widget
-            self.overview_widget = qtTabLayouts.ggui_overview_tab(session=self.session)
-            self.tab_widget.addTab(
-                self.overview_widget, "gGui Overview Tab: No Data Loaded"
-            )
-            # Set Overview Tab to focus
-            self.tab_widget.setCurrentWidget(self.overview_widget)
-
-        init_overview_tab(self)
+        self.overview_widget = qtTabLayouts.ggui_overview_tab(session=self.session)
+        self.tab_widget.addTab(
+            self.overview_widget, "gGui Overview Tab: No Data Loaded"
+        )
+        # Set Overview Tab to focus
+        self.tab_widget.setCurrentWidget(self.overview_widget)
 
-        # Initialize empty Target Manager
-        self.target_manager = TargetManager(self, self.primary_target_changed)
-        self.addToolBarBreak()
-        self.addToolBar(self.target_manager)
+        # Delete first default tab
+        self.close_tab(self.get_tab_index(default_tab), False)
 
+        imported_target_catalogs = dict(imported_target_catalogs or {})
+        for target_catalog_path in target_catalog_paths or []:
+            # The window is already up, so report a bad catalog rather than abort
+            try:
+                imported_target_catalogs[target_catalog_path] = validate_target_catalog_file(str(target_catalog_path))
+            except (OSError, ValueError, yaml.YAMLError) as e:
+                print("WARNING: Unable to load gGui Target Catalog " + str(target_catalog_path) + ": " + str(e))
+                QtWidgets.QMessageBox.warning(self, "gGui Target Catalog", "Unable to load " + str(target_catalog_path) + ":\n" + str(e))
         if imported_target_catalogs:
             # Load supplied target catalog into target manager
             # NOTE: Upon first load, Target Manager will automatically update target manager's
             #       primary target with the first entry in this dict.
             self.load_targets(imported_target_catalogs)
-
-        # Delete first default tab
-        self.close_tab(self.get_tab_index(default_tab), False)
+        if session_path:
+            self.restore_session(session_path)
 
     def closeEvent(self, event):
         """Handles subwindows when gGui is closed"""
 
+        # Save the workspace, so it can be resumed with 'ggui --resume'
+        if self.target_manager.getTargetCatalogPaths():
+            try:
+                self.save_session(last_session_path())
+            except OSError as e:
+                print("WARNING: Unable to save the gGui session: " + str(e))
         # Notify Target Manager of closing
         self.target_manager.close()
+        switch_timer().close_trace()
+
+    def save_session(self, session_path: str):
+        """Saves a snapshot of the workspace: loaded catalogs, primary target, and overview viewer states
+
+        :param session_path: Path of the snapshot to write
+        """
+        primary_target = None
+        if self.target_manager.getPrimaryTargetCatalog():
+            primary_target = {'target_catalog': self.target_manager.getPrimaryTargetCatalog(),
+                              'target': self.target_manager.getPrimaryName(),
+                              'row': self.target_manager.QComboBox.currentIndex()}
+        write_session(session_path, self.target_manager.getTargetCatalogPaths(), primary_target,
+                      self.overview_widget.snapshot_state() if self.overview_widget else {})
+
+    def restore_session(self, session_path: str):
+        """Restores a workspace snapshot saved by save_session
+        Catalogs come from the parsed catalog cache, and only the saved primary target's data is loaded, from cached
+        data (see TargetManager.restoreTargets). Viewer states are applied as the overview is built, before it is drawn
+
+        :param session_path: Path of the snapshot
+        """
+        try:
+            snapshot = read_session(session_path)
+        except (OSError, ValueError) as e:
+            QtWidgets.QMessageBox.warning(self, "gGui Session", "Unable to restore " + str(session_path) + ":\n" + str(e))
+            return
+        catalog_cache = ParsedCatalogCache()
+        target_catalogs = {}
+        for target_catalog in snapshot['target_catalogs']:
+            try:
+                target_catalogs[target_catalog] = catalog_cache.load(target_catalog)
+            except (OSError, ValueError, yaml.YAMLError) as e:
+                print("WARNING: Unable to restore gGui Target Catalog " + target_catalog + ": " + str(e))
+        self._restoring_snapshot = snapshot
+        try:
+            self.target_manager.restoreTargets(target_catalogs, snapshot['primary_target'])
+        finally:
+            self._restoring_snapshot = None
+
+    def save_ggui_session(self):
+        """Prompts user with File Dialog for where to save the gGui session"""
+        session_path, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Save gGui Session", "", SESSION_NAME_FILTER)
+        if session_path:
+            self.save_session(session_path)
+
+    def restore_ggui_session(self):
+        """Prompts user with File Dialog for a gGui session to restore"""
+        for session_path in gGuiGlueApplication.prompt_user_for_file("Select gGui Session", SESSION_NAME_FILTER):
+            self.restore_session(session_path)
 
     def primary_target_changed(self, _):
         """Updates tab data of new primary target
         Indended as signal callback for the target manager to notify gGui of primary target changes
         """
+        # A restored session's viewer states only apply to the target they were saved with
+        viewer_states = None
+        primary_target = self._restoring_snapshot['primary_target'] if self._restoring_snapshot else None
+        if primary_target and (primary_target['target_catalog'], primary_target['target']) == (
+                self.target_manager.getPrimaryTargetCatalog(), self.target_manager.getPrimaryName()):
+            viewer_states = self._restoring_snapshot['viewers']
         # Update overview tab with new target's data
         self.overview_widget.load_data(
             self.session,
             self.target_manager.getPrimaryName(),
             self.target_manager.getPrimaryData(),
+            viewer_states,
         )
         self.tab_widget.setTabText(
             self.get_tab_index(self.overview_widget),
@@ -138,14 +254,11 @@ class gGuiGlueApplication(GlueApplication):
         Validates the YAML file and loads it into the Target Manager
         """
         for ggui_yaml_file in gGuiGlueApplication.prompt_user_for_file(
-            "Select GGUI YAML Target List", "gGUI YAML (*.yaml; *.yml)"
+            "Select GGUI YAML Target List", TARGET_CATALOG_NAME_FILTER
         ):
             self.target_manager.loadTargetDict(
                 ggui_yaml_file, 
-                validate_targlist_format(
-                    yaml.load(open(ggui_yaml_file, "r"), Loader=yaml.BaseLoader),
-                    ggui_yaml_file,
-                )
+                validate_target_catalog_file(ggui_yaml_file)
             )
 
     def show_about_ggui(self):
@@ -161,25 +274,15 @@ class gGuiGlueApplication(GlueApplication):
         )
 
     def ggui_tutorial(self):
-        """Loads gGui sample data"""
-        sample_data_url = 'https://github.com/gphoton-tools/ggui/raw/master/docs/ggui_tutorial_data2019-11-11.zip'
-        # Dynamically get the sample data archive filename in case it changes
-        sample_filename = pathlib.Path(urlparse(sample_data_url).path).name
-        # Get temp path on disk to where this sample data will be written
-        sample_data_local_path = pathlib.Path(tempfile.gettempdir()) / sample_filename
-
-        # If we don't have the sample data downloaded, download it
-        if not sample_data_local_path.is_file():
-            print("Downloading sample data to: " + str(sample_data_local_path) + " from: " + str(sample_data_url))
-            urllib.request.urlretrieve(sample_data_url, str(sample_data_local_path))
-            print("Download Successful: " + str(sample_data_local_path.is_file()))
-
-        with ZipFile(sample_data_local_path, 'r') as sample_data_zip:
-            # Unzip sample data archive
-            sample_data_zip.extractall(tempfile.gettempdir())
-            # Resolve the yaml path and load it to gGui
-            resolved_path = (pathlib.Path(tempfile.gettempdir()) / 'tutorial.yaml').resolve()
-            self.load_targets({resolved_path: validate_target_catalog_file(str(resolved_path))})
+        """Loads gGui sample data
+        The sample data is downloaded (or seeded, see ggui.sample_data) and extracted into the gGui cache once, and verified
+        """
+        try:
+            resolved_path = sample_data_path('tutorial').resolve()
+        except (OSError, ValueError) as e:
+            QtWidgets.QMessageBox.warning(self, "gGui Sample Data", "Unable to prepare the gGui sample data:\n" + str(e))
+            return
+        self.load_targets({resolved_path: validate_target_catalog_file(str(resolved_path))})
 
     @staticmethod
     def prompt_user_for_file(dialog_caption: str, dialog_name_filter: str) -> list:
@@ -215,7 +318,7 @@ def main(user_arguments: list = None):
         "--target_list",
         nargs="+",
         help="Specify a path to a YAML style list of astronomical targets and associated gPhoton "
-             "data products",
+             "data products, or a gGui SQLite catalog",
     )
     parser.add_argument(
         "--yaml_select",
@@ -223,34 +326,78 @@ def main(user_arguments: list = None):
         help="Spawns a file select dialog to choose a YAML style list of astronomical targets and "
              "associated gPhoton data products",
     )
+    parser.add_argument(
+        "--session",
+        help="Restores a gGui session snapshot saved from the File menu",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Resumes the session gGui last exited with",
+    )
+    parser.add_argument(
+        "--switch_trace",
+        metavar="TRACE_FILE",
+        help="Times every target switch, appending its phases to TRACE_FILE as JSON lines",
+    )
+    parser.add_argument(
+        "--stall_watchdog",
+        action="store_true",
+        help="Reports whenever gGui stops responding, with where it was stuck",
+    )
+    parser.add_argument(
+        "--stall_threshold",
+        type=float,
+        default=STALL_THRESHOLD,
+        help="Seconds gGui may be unresponsive before the stall watchdog reports it (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--stall_report",
+        metavar="REPORT_FILE",
+        help="Appends stall watchdog reports to REPORT_FILE as JSON lines. Implies --stall_watchdog",
+    )
     if user_arguments:
         args = parser.parse_args(user_arguments)
     else:
         args = parser.parse_args()
 
-    target_data_products = {}
+    # Catalogs are validated by gGui itself once its window is up
+    target_catalog_paths = []
 
     # If the user specified a gGui YAML file, load its targets
     if args.target_list:
         for ggui_yaml_file in args.target_list:
-            resolved_path = pathlib.Path(ggui_yaml_file).resolve()
-            target_data_products[resolved_path] = validate_target_catalog_file(str(resolved_path))
+            target_catalog_paths.append(pathlib.Path(ggui_yaml_file).resolve())
     # If the user requested a file-selector dialog to select a gGui YAML file, display it and load
     #   its contents
     if args.yaml_select:
         x = QtWidgets.QApplication([])
         for ggui_yaml_file in gGuiGlueApplication.prompt_user_for_file(
-            "Select GGUI YAML Target List", "gGUI YAML (*.yaml; *.yml)"
+            "Select GGUI YAML Target List", TARGET_CATALOG_NAME_FILTER
         ):
-            resolved_path = pathlib.Path(ggui_yaml_file).resolve()
-            target_data_products[resolved_path] = validate_target_catalog_file(str(resolved_path))
+            target_catalog_paths.append(pathlib.Path(ggui_yaml_file).resolve())
+    if args.switch_trace:
+        switch_timer().enable(args.switch_trace)
+    session_path = args.session
+    if args.resume:
+        session_path = last_session_path()
+        if not session_path.is_file():
+            print("No previous gGui session to resume")
+            session_path = None
     # If no targets were recognized, notify the user
-    if not target_data_products:
+    if not target_catalog_paths and not session_path:
         print("No yaml received. Starting empty gGui session...")
     # Initialize gGui with user-supplied targets, if any
-    ggui_app = gGuiGlueApplication(imported_target_catalogs=target_data_products)
+    ggui_app = gGuiGlueApplication(target_catalog_paths=target_catalog_paths, session_path=session_path)
+    # Watch the event loop for stalls, if asked
+    watchdog = None
+    if args.stall_watchdog or args.stall_report:
+        watchdog = StallWatchdog(args.stall_threshold, args.stall_report)
+        watchdog.start()
     # Start gGui
     ggui_app.start()
+    if watchdog:
+        watchdog.stop()
 
 
 if __name__ == "__main__":
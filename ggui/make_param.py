@@ -3,78 +3,54 @@
     :synopsis: GUI used to create input param files needed to run GGUI.
 .. moduleauthor:: Scott W. Fleming <fleming@stsci.edu>
 """
-import csv
-import os
 import sys
-import yaml
 try:
-    from PyQt5.QtCore import Qt
+    from PyQt5.QtCore import Qt, QThread, pyqtSignal
     from PyQt5.QtGui import QFont
     import PyQt5.QtWidgets as QtWidgets
     from PyQt5.QtWidgets import QApplication, QLineEdit, QPushButton, QFileDialog
     from PyQt5.QtWidgets import QTextEdit, QScrollArea
 except ImportError:
-    from PyQt4.QtCore import Qt
+    from PyQt4.QtCore import Qt, QThread, pyqtSignal
     from PyQt4.QtGui import QFont
     import PyQt4.QtWidgets as QtWidgets
     from PyQt4.QtWidgets import QApplication, QLineEdit, QPushButton, QFileDialog
     from PyQt4.QtWidgets import QTextEdit, QScrollArea
 
-import pathlib
+# Catalog logic lives in the headless ggui.catalog module. Re-exported here for existing callers
+from ggui.catalog import (validate_target_catalog_file, validate_targlist_format, resolve_product_path,
+                          quoted_presenter, iter_catalog_csv, catalog_writer)
 
-def validate_target_catalog_file(filepath: str) -> dict:
-    """Verifies a gGui Target Catalog confirms to the gGui YAML format
-
-    :returns: verified gGui target dictionary
+class catalog_load_worker(QThread):
     """
-    return validate_targlist_format(
-                yaml.load(open(filepath, "r"), Loader=yaml.BaseLoader),
-                filepath
-    )
-
-def validate_targlist_format(target_list: dict,  list_source: str) -> dict:
-    """Verifies dictionary is in gGui YAML format
-    Verifies a given dictionary is the established gGui format.
-    Also verifies all specified files exist. Removes any target that does not have any valid files
-
-    :returns: verified gGui target dictionary
+    Runs the catalog CSV engine off the GUI thread, handing targets and log messages back through signals.
     """
-    empty_targets = []
-    for target_name, target_data in target_list.items():
-        valid_files = 0
-        for data_type, band_data in target_data.items():
-            if data_type == '_notes':
-                continue
-            for band, filepathString in band_data.items():
-                # If a path not specified, or empty string, just skip it
-                if filepathString:
-                    # If a relative path to the data product is given, join it with respect to the parent Target Catalog path
-                    if not pathlib.PurePath(filepathString).is_absolute():
-                        # If there are path delimiters, detect which OS it came from to interpret the path directly
-                        if "\\" in filepathString:
-                            filepathString = str(pathlib.PurePath(list_source).parent.joinpath(pathlib.PureWindowsPath(filepathString)))
-                        elif "/" in filepathString:
-                            filepathString = str(pathlib.PurePath(list_source).parent.joinpath(pathlib.PurePosixPath(filepathString)))
-                        else:
-                            filepathString = str(pathlib.PurePath(list_source).parent.joinpath(pathlib.PurePath(filepathString)))
-                    if not pathlib.Path(filepathString).is_file():
-                        print("Cannot find " + filepathString + " on disk. Ignoring...")
-                    else: valid_files += 1
-        if not valid_files:
-            empty_targets.append(target_name)
-
-    for bad_target in empty_targets:
-        print(str(bad_target) + " does not have any valid data. Ignoring target...")
-        del target_list[bad_target]
+    message = pyqtSignal(str)
+    targets_loaded = pyqtSignal(dict)
 
-    return target_list
+    def __init__(self, input_fname, batch_size=1000):
+        super().__init__()
+        self.input_fname = input_fname
+        self.batch_size = batch_size
 
-def quoted_presenter(dumper, data):
-    """
-    This is a custom representer for string, so that YAML can be output
-    with quotes to satisfy paths on Windows.
-    """
-    return dumper.represent_scalar('tag:yaml.org,2002:str', data, style='"')
+    def run(self):
+        """
+        Streams the catalog CSV, emitting targets in batches to keep signal traffic low.
+        A duplicate target keeps its first entry, as it would in a catalog built from the command line.
+        """
+        batch = dict()
+        target_names = set()
+        for target_name, target_entry in iter_catalog_csv(self.input_fname, log=self.message.emit):
+            if target_name in target_names:
+                self.message.emit("Duplicate target " + target_name + ". Keeping its first entry.")
+                continue
+            target_names.add(target_name)
+            batch[target_name] = target_entry
+            if len(batch) >= self.batch_size:
+                self.targets_loaded.emit(batch)
+                batch = dict()
+        if batch:
+            self.targets_loaded.emit(batch)
 
 class MakeParamGUI(QtWidgets.QWidget):
     """
@@ -82,7 +58,6 @@ class MakeParamGUI(QtWidgets.QWidget):
     """
 
     def __init__(self):
-        yaml.add_representer(str, quoted_presenter)
         super().__init__()
         self.input_fname = ''
         self.output_fname = ''
@@ -93,6 +68,7 @@ class MakeParamGUI(QtWidgets.QWidget):
         self.save_button = QPushButton()
         self.iscrollarea = QScrollArea()
         self.yaml_params = dict()
+        self.load_worker = None
         self.init_ui()
 
     def getifile(self):
@@ -149,73 +125,39 @@ class MakeParamGUI(QtWidgets.QWidget):
         """
         Actions performed when pressing the Load button.
         Any row that begins with a pound sign charater is skipped.
+        The CSV is parsed on a worker thread so the window stays responsive.
         """
         if self.input_fname:
-            with open(self.input_fname, 'r') as input_file:
-                csv_reader = csv.reader(input_file, delimiter=',')
-                input_fname_root = os.path.join(
-                    os.path.dirname(self.input_fname), '')
-                row_num = 0
-                for row in csv_reader:
-                    row_num = row_num + 1
-                    if row[0].lstrip()[0] != '#':
-                        if len(row) == 7:
-                            # Then found expected number of entries.  Add this
-                            # target to the list object to prepare for yaml
-                            # output.
-                            testfs = row[1:]
+            self.yaml_params = dict()
+            self.load_button.setEnabled(False)
+            self.save_button.setEnabled(False)
+            self.load_worker = catalog_load_worker(self.input_fname)
+            self.load_worker.message.connect(self.log_display.append)
+            self.load_worker.targets_loaded.connect(self.yaml_params.update)
+            self.load_worker.finished.connect(self.load_finished)
+            self.load_worker.start()
 
-                            # Check for file existence.
-                            for testf in testfs:
-                                if not os.path.isfile(testf) and testf:
-                                    self.log_display.append("File not found: "
-                                                            + testf)
-                            prikey = row[0].strip()
-                            self.yaml_params[prikey] = {'lightcurve':{},
-                                                        'coadd':{}, 'cube':{}}
-                            if row[1].strip():
-                                self.yaml_params[prikey]['lightcurve']['FUV'] = (
-                                    os.path.abspath(input_fname_root +
-                                                    row[1].strip()))
-                            if row[2].strip():
-                                self.yaml_params[prikey]['lightcurve']['NUV'] = (
-                                    os.path.abspath(input_fname_root +
-                                                    row[2].strip()))
-                            if row[3].strip():
-                                self.yaml_params[prikey]['coadd']['FUV'] = (
-                                    os.path.abspath(input_fname_root +
-                                                    row[3].strip()))
-                            if row[4].strip():
-                                self.yaml_params[prikey]['coadd']['NUV'] = (
-                                    os.path.abspath(input_fname_root +
-                                                    row[4].strip()))
-                            if row[5].strip():
-                                self.yaml_params[prikey]['cube']['FUV'] = (
-                                    os.path.abspath(input_fname_root +
-                                                    row[5].strip()))
-                            if row[6].strip():
-                                self.yaml_params[prikey]['cube']['NUV'] = (
-                                    os.path.abspath(input_fname_root +
-                                                    row[6].strip()))
-                        else:
-                            # Then need to print an error to the log area.
-                            err_string = ("Row number {0:d}".format(row_num) +
-                                          " does not have seven columns.")
-                            self.log_display.append(err_string)
-                # After parsing the CSV, enable the Save button.
-                # Only enable if an output file has been decided.
-                if self.output_fname:
-                    self.save_button.setStyleSheet(
-                        "QPushButton { background-color:"
-                        '"#7af442";border-color:"#45a018";}')
-                    self.save_button.setEnabled(True)
+    def load_finished(self):
+        """
+        Actions performed once the worker thread has parsed the whole CSV.
+        """
+        self.load_button.setEnabled(True)
+        self.log_display.append("Loaded {0:d} targets.".format(len(self.yaml_params)))
+        # After parsing the CSV, enable the Save button.
+        # Only enable if an output file has been decided.
+        if self.output_fname:
+            self.save_button.setStyleSheet(
+                "QPushButton { background-color:"
+                '"#7af442";border-color:"#45a018";}')
+            self.save_button.setEnabled(True)
 
     def save_yaml(self):
         """
         Writes yaml parameters to file.
         """
-        with open(self.output_fname, 'w') as outfile:
-            yaml.dump(self.yaml_params, outfile, default_flow_style=False)
+        with catalog_writer(self.output_fname, log=self.log_display.append) as writer:
+            for target_name, target_entry in self.yaml_params.items():
+                writer.write(target_name, target_entry)
 
     def make_input_row(self):
         """
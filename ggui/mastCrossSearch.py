@@ -1,198 +1,184 @@
-"""
-.. module:: mastCrossSearch
-    :synopsis: Search MAST Archive for matching observations on a given gPhoton GALEX WCS frame
-.. moduleauthor:: Duy Nguyen <dtn5ah@virginia.edu>
-"""
-# Science Imports
-from astropy.io import fits
-from astropy.wcs import WCS
-from astropy.wcs.utils import pixel_to_skycoord as pix2RaDec
-from math import floor
-from scipy.spatial import distance
-
-# API Response Imports
-import sys
-import json
-try: # Python 3.x
-    from urllib.parse import quote as urlencode
-    from urllib.request import urlretrieve
-except ImportError:  # Python 2.x
-    from urllib import pathname2url as urlencode
-    from urllib import urlretrieve
-try: # Python 3.x
-    import http.client as httplib 
-except ImportError:  # Python 2.x
-    import httplib 
-
-#TEMPFILE = 'cr_dra_count_coadd.fits'
-TEMPFILE = 'Messier060_coadd.fits'
-
-
-def getFITSCornerCoords(filename):
-    fitsImage = fits.open(filename)
-    wcs = WCS(fitsImage[0].header)
-    rangeX = fitsImage[0].header['NAXIS1']
-    rangeY = fitsImage[0].header['NAXIS2']
-    corner1 = pix2RaDec(rangeX, 0, wcs)
-    corner2 = pix2RaDec(0, 0, wcs)
-    corner3 = pix2RaDec(0, rangeY, wcs)
-    corner4 = pix2RaDec(rangeX, rangeY, wcs)
-    cornerCoords = [corner1, corner2, corner3, corner4]
-    return cornerCoords
-
-def getFITSCenterCoords(filename):
-    fitsImage = fits.open(filename)
-    wcs = WCS(fitsImage[0].header)
-    rangeX = fitsImage[0].header['NAXIS1']
-    rangeY = fitsImage[0].header['NAXIS2']
-    center = pix2RaDec(floor(rangeX / 2.0), floor(rangeY / 2.0), wcs)
-    return center
-
-def minCircle(cornerList, center):
-    radius = distance.euclidean((cornerList[0].ra.degree, cornerList[0].dec.degree),(center.ra.degree, center.dec.degree))
-    return radius
-
-def mastConeQuery(center, radius):
-    # Define target server
-    server = 'mast.stsci.edu'
-    requestsVersion = ".".join(map(str, sys.version_info[:3]))
-
-    # Define request parameters
-    requestParams = {'service':'Mast.Caom.Cone',
-                     'params':{'ra':center.ra.degree,
-                               'dec':center.dec.degree,
-                               'radius':radius},
-                     'format':'json',
-                     'pagesize':2000,
-                     'removenullcolumns':True,
-                     'timeout':30,
-                     'removecache':True}
-    JSONquery = urlencode(json.dumps(requestParams))
-
-    # Define HTTP parameters
-    httpHeaders = {"Content-type": "application/x-www-form-urlencoded",
-                   "Accept": "text/plain",
-                   "User-agent":"python-requests/" + requestsVersion}
-
-    # Connect to Server
-    connMAST = httplib.HTTPSConnection(server)
-    # Invoke MAST Request
-    connMAST.request("POST", "/api/v0/invoke", "request="+JSONquery, httpHeaders)
-    # Receive MAST Response
-    httpResponse = connMAST.getresponse()
-    # Return HTTP Response objects
-    header = httpResponse.getheaders()
-    data = httpResponse.read().decode('utf-8')
-    return header,data
-
-def extractGGUIFields(jsonReturn):
-    gguiFields = []
-    for i, obs in enumerate(jsonReturn['data']):
-        mission = obs['obs_collection']
-        project = obs['project']
-        region = obs['s_region']
-        dataType = obs['dataproduct_type']
-        gguiFields.append((i, mission, project, dataType, region))
-        #print(i, "\t", mission, "\t", project, "\t", dataType, "\n\t\t", region)
-    return gguiFields
-
-def appendRegionList(regOutFile, regionParse, paramIgnore):
-    shape = regionParse[0]
-    ds9Region = regionParse[0].lower() + "("
-    #import ipdb; ipdb.set_trace()
-    for param in regionParse[paramIgnore:]:
-        ds9Region = ds9Region + param + ", "
-    ds9Region = ds9Region[:-2] + ")"
-    print(ds9Region)
-
-    # DS9 Style Arguments
-    mission = obs['obs_collection']
-    project = obs['project']
-    #import ipdb; ipdb.set_trace()
-    if type(project) is type(None): project = "NULL"
-    styleArgs = ' ' + '#'
-    if project[:4] == "hlsp":
-        styleArgs = styleArgs + ' ' + "color=yellow"
-    elif mission == "HST" or mission == "HLA":
-        styleArgs = styleArgs + ' ' + "color=red"
-    elif mission == "KEPLER" or mission == "K2":
-        styleArgs = styleArgs + ' ' + "color=green"
-    elif mission == "PS1":
-        styleArgs = styleArgs + ' ' + "color=blue"
-    elif mission == "SWIFT":
-        styleArgs = styleArgs + ' ' + "color=cyan"
-    elif mission == "GALEX":
-        styleArgs = styleArgs + ' ' + "color=magenta"
-    else:
-        styleArgs = styleArgs + ' ' + "color=green dash=1"
-    ds9Region = ds9Region + styleArgs
-    print(ds9Region)
-    regOutFile.write(ds9Region + "\n")
-    
-
-def exportDS9Regions(jsonReturn, fileOutputName):
-    gguiFields = []
-    regOutFile = open(fileOutputName, "w")
-
-    # DS9 Geometry Syntax
-    for i, obs in enumerate(jsonReturn['data']):
-        region = obs['s_region']
-        regionParse = region.split()
-        ds9Region = ''
-        paramIgnore = 0
-        for param in regionParse:
-            try:
-                float(param)
-                break
-            except Exception: paramIgnore+=1; pass
-        if regionParse[0] != "CIRCLE" and regionParse[0] != "POLYGON":
-            print("Illegal/Unimplemented Shape Detected: ", regionParse[0], ". Skipping Object")
-        else:
-            #appendRegionList(regOutFile, regionParse, paramIgnore)
-            shape = regionParse[0]
-            ds9Region = regionParse[0].lower() + "("
-            #import ipdb; ipdb.set_trace()
-            for param in regionParse[paramIgnore:]:
-                ds9Region = ds9Region + param + ", "
-            ds9Region = ds9Region[:-2] + ")"
-            print(ds9Region)
-
-            # DS9 Style Arguments
-            mission = obs['obs_collection']
-            project = obs['project']
-            #import ipdb; ipdb.set_trace()
-            if type(project) is type(None): project = "NULL"
-            styleArgs = ' ' + '#'
-            if project[:4] == "hlsp":
-                styleArgs = styleArgs + ' ' + "color=yellow"
-            elif mission == "HST" or mission == "HLA":
-                styleArgs = styleArgs + ' ' + "color=red"
-            elif mission == "KEPLER" or mission == "K2":
-                styleArgs = styleArgs + ' ' + "color=green"
-            elif mission == "PS1":
-                styleArgs = styleArgs + ' ' + "color=blue"
-            elif mission == "SWIFT":
-                styleArgs = styleArgs + ' ' + "color=cyan"
-            elif mission == "GALEX":
-                styleArgs = styleArgs + ' ' + "color=magenta"
-            else:
-                styleArgs = styleArgs + ' ' + "color=green dash=1"
-            ds9Region = ds9Region + styleArgs
-            print(ds9Region)
-            regOutFile.write(ds9Region + "\n")
-    regOutFile.close()
-            
-# Get Coordinates of Corners
-cornerCoords = getFITSCornerCoords(TEMPFILE)
-# Get Coordinates of Frame Center
-center = getFITSCenterCoords(TEMPFILE)
-# Get Radius of smallest enclosing circle of frame
-radius = minCircle(cornerCoords, center)
-
-# Perform Mast Cone Query; interpret results
-header,data = mastConeQuery(center, radius)
-jsonReturn = json.loads(data)
-# Extract Relevant information from return
-gguiFields = extractGGUIFields(jsonReturn)
-#print(gguiFields)
-exportDS9Regions(jsonReturn, TEMPFILE + ".reg")
+"""
+.. module:: mastCrossSearch
+    :synopsis: Search MAST Archive for matching observations on a given gPhoton GALEX WCS frame
+.. moduleauthor:: Duy Nguyen <dtn5ah@virginia.edu>
+"""
+# Science Imports
+from astropy.coordinates import SkyCoord
+from astropy.io import fits
+from astropy.wcs import WCS
+from concurrent.futures import ThreadPoolExecutor
+from math import floor
+import numpy
+
+# API Response Imports
+import argparse
+import json
+
+from ggui.mast_client import MAST_SERVER, MastClient
+from ggui.regions import observation_colors, parse_s_regions, write_ds9_regions
+
+# Client shared by every mastConeQuery call that does not bring its own
+_defaultMastClient = None
+
+
+def readFITSHeader(filename, productIndex=None):
+    """Reads the header of a FITS image without reading its data
+
+    :param filename: Path of the FITS image
+    :param productIndex: Optional ggui.product_index.ProductMetadataIndex. If given, its cached header is used instead of opening the file
+    :returns: astropy FITS header of the first image
+    """
+    if productIndex is not None:
+        metadata = productIndex.get(filename)
+        if not metadata or not metadata.get('header'):
+            raise ValueError("No image header found for " + str(filename))
+        return fits.Header.fromstring(metadata['header'])
+    return fits.getheader(filename)
+
+def footprintPixels(rangeX, rangeY):
+    """Returns the pixel coordinates of a frame's four corners, followed by its center
+
+    :param rangeX: Width of the frame (NAXIS1)
+    :param rangeY: Height of the frame (NAXIS2)
+    :returns: tuple of (x, y) arrays of length 5
+    """
+    return (numpy.array([rangeX, 0, 0, rangeX, floor(rangeX / 2.0)], dtype=float),
+            numpy.array([0, 0, rangeY, rangeY, floor(rangeY / 2.0)], dtype=float))
+
+def headerFootprint(header):
+    """Computes the sky coordinates of a frame's corners and center in one WCS transform
+
+    :param header: FITS header of a gPhoton coadd or cube. Only its celestial axes are used
+    :returns: tuple of (ra, dec) arrays of length 5, in degrees: four corners, then the center
+    """
+    wcs = WCS(header).celestial
+    return wcs.all_pix2world(*footprintPixels(header['NAXIS1'], header['NAXIS2']), 0)
+
+def angularSeparation(ra1, dec1, ra2, dec2):
+    """Great circle distance between sky coordinates, broadcasting over arrays
+
+    :returns: separation in degrees
+    """
+    ra1, dec1, ra2, dec2 = map(numpy.radians, (ra1, dec1, ra2, dec2))
+    haversine = numpy.sin((dec2 - dec1) / 2.0) ** 2 + numpy.cos(dec1) * numpy.cos(dec2) * numpy.sin((ra2 - ra1) / 2.0) ** 2
+    return numpy.degrees(2 * numpy.arcsin(numpy.sqrt(numpy.clip(haversine, 0, 1))))
+
+def getFITSFootprints(filenames, productIndex=None, workers=8):
+    """Computes the footprints of many FITS images, reading each header once and nothing else
+    Headers are read concurrently. Images whose header cannot be read get NaN footprints
+
+    :param filenames: Paths of the FITS images
+    :param productIndex: Optional ggui.product_index.ProductMetadataIndex to read cached headers from
+    :param workers: Number of threads reading headers
+    :returns: tuple of (cornerRA, cornerDec, centerRA, centerDec, radius) arrays, in degrees.
+        Corner arrays have shape (len(filenames), 4). radius is that of the smallest circle about
+        the center enclosing every corner
+    """
+    def footprint(filename):
+        try:
+            return headerFootprint(readFITSHeader(filename, productIndex))
+        except Exception as error:
+            print("Unable to compute the footprint of " + str(filename) + ": " + str(error))
+            return numpy.full(5, numpy.nan), numpy.full(5, numpy.nan)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        footprints = list(pool.map(footprint, filenames))
+    footprintRA = numpy.array([ra for ra, _ in footprints]).reshape(-1, 5)
+    footprintDec = numpy.array([dec for _, dec in footprints]).reshape(-1, 5)
+    radius = angularSeparation(footprintRA[:, :4], footprintDec[:, :4], footprintRA[:, 4:], footprintDec[:, 4:]).max(axis=1)
+    return footprintRA[:, :4], footprintDec[:, :4], footprintRA[:, 4], footprintDec[:, 4], radius
+
+def getFITSCornerCoords(filename):
+    """Returns the sky coordinates of the four corners of a FITS image
+
+    :param filename: Path of the FITS image
+    :returns: list of four SkyCoord
+    """
+    ra, dec = headerFootprint(readFITSHeader(filename))
+    return list(SkyCoord(ra[:4], dec[:4], unit='deg'))
+
+def getFITSCenterCoords(filename):
+    """Returns the sky coordinates of the center of a FITS image
+
+    :param filename: Path of the FITS image
+    :returns: SkyCoord of the center pixel
+    """
+    ra, dec = headerFootprint(readFITSHeader(filename))
+    return SkyCoord(ra[4], dec[4], unit='deg')
+
+def minCircle(cornerList, center):
+    """Returns the radius of the smallest circle about center that encloses every corner
+
+    :param cornerList: SkyCoord of the frame corners
+    :param center: SkyCoord of the frame center
+    :returns: radius in degrees
+    """
+    return float(max(corner.separation(center).degree for corner in cornerList))
+
+def mastConeQuery(center, radius, client=None):
+    """Runs a MAST CAOM cone search, answering from the on-disk cache when the same cone was searched before
+
+    :param center: SkyCoord of the cone center
+    :param radius: Radius of the cone, in degrees
+    :param client: ggui.mast_client.MastClient to query through. Defaults to a shared client with the default cache
+    :returns: tuple of (HTTP response headers as a list of (name, value) tuples, response body). Headers are empty
+        for cached results
+    """
+    global _defaultMastClient
+    if client is None:
+        if _defaultMastClient is None:
+            _defaultMastClient = MastClient()
+        client = _defaultMastClient
+    return client.cone_search_response(center.ra.degree, center.dec.degree, radius)
+
+def extractGGUIFields(jsonReturn):
+    gguiFields = []
+    for i, obs in enumerate(jsonReturn['data']):
+        mission = obs['obs_collection']
+        project = obs['project']
+        region = obs['s_region']
+        dataType = obs['dataproduct_type']
+        gguiFields.append((i, mission, project, dataType, region))
+        #print(i, "\t", mission, "\t", project, "\t", dataType, "\n\t\t", region)
+    return gguiFields
+
+def exportDS9Regions(jsonReturn, fileOutputName, compress=None):
+    """Writes the footprints of every observation of a MAST response as DS9 regions, colored by mission
+
+    :param jsonReturn: Parsed MAST response
+    :param fileOutputName: Path of the region file to write. Names ending in '.gz' are gzip compressed
+    :param compress: Force (True) or prevent (False) gzip compression
+    :returns: number of regions written
+    """
+    observations = jsonReturn['data']
+    regionSet = parse_s_regions([obs['s_region'] for obs in observations])
+    return write_ds9_regions(regionSet, fileOutputName, observation_colors(observations), compress)
+
+def main(user_arguments: list = None):
+    """Entry point to search MAST for observations overlapping gPhoton images, writing the matches as DS9 regions
+
+    :param user_arguments: list of arguments, should simulate command line args. Use ['-h'] or ['--help'] for help documentation
+    """
+    parser = argparse.ArgumentParser(
+        description="Searches the MAST archive for observations overlapping gPhoton coadds or cubes. "
+                    "Matches are written as DS9 regions to <image>.reg"
+    )
+    parser.add_argument("images", nargs="+", help="Path of a gPhoton coadd or cube FITS image")
+    parser.add_argument("--offline", action="store_true", help="Only use cached MAST results, never connect")
+    parser.add_argument("--server", default=MAST_SERVER, help="Host[:port] of the MAST API (default: " + MAST_SERVER + ")")
+    parser.add_argument("--http", action="store_true", help="Connect to the MAST API server over plain HTTP, e.g. a local stand-in server")
+    parser.add_argument("--gzip", action="store_true", help="Write gzip compressed regions to <image>.reg.gz")
+    args = parser.parse_args(user_arguments)
+    client = MastClient(args.server, https=not args.http, offline=args.offline)
+
+    _, _, centerRA, centerDec, radius = getFITSFootprints(args.images)
+    for filename, ra, dec, searchRadius in zip(args.images, centerRA, centerDec, radius):
+        if numpy.isnan(searchRadius):
+            continue
+        # Perform Mast Cone Query; interpret results
+        header, data = mastConeQuery(SkyCoord(ra, dec, unit='deg'), searchRadius, client)
+        jsonReturn = json.loads(data)
+        exportDS9Regions(jsonReturn, filename + (".reg.gz" if args.gzip else ".reg"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+.. module:: mast_client
+    :synopsis: MAST API client with a persistent connection and an on-disk cache of cone search results
+.. moduleauthor:: Duy Nguyen <dnguyen@nrao.edu>
+"""
+
+import http.client
+import json
+import sqlite3
+import sys
+import threading
+import time
+from urllib.parse import quote as urlencode
+import zlib
+
+from ggui.cache import cache_directory
+
+# Default MAST API host and endpoint
+MAST_SERVER = 'mast.stsci.edu'
+MAST_INVOKE_PATH = '/api/v0/invoke'
+
+# Cone searches closer than this (in degrees) in ra, dec and radius share a cached result. About a third of an arcsecond
+CONE_QUANTUM = 1e-4
+
+class ConeSearchCache:
+    """On-disk cache of MAST cone search results, keyed by service and quantized (ra, dec, radius)
+    Entries expire after a time to live, and the least recently used entries are evicted once the
+    cache grows beyond its size limit. Results are stored zlib compressed
+    """
+
+    def __init__(self, cache_path: str = None, ttl: float = 7 * 24 * 3600, max_bytes: int = 256 * 2 ** 20):
+        """Opens (or creates) a cone search cache
+
+        :param cache_path: Path of the cache database. Defaults to cone_searches.sqlite in the gGui cache directory
+        :param ttl: Seconds after which a cached result is stale
+        :param max_bytes: Size limit of the compressed results, in bytes
+        """
+        self.cache_path = str(cache_path or cache_directory('mast') / 'cone_searches.sqlite')
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.cache_path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, service TEXT, created REAL, "
+                                     "last_used REAL, size INTEGER, body BLOB)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+
+    @staticmethod
+    def cone_key(service: str, ra: float, dec: float, radius: float, extra_params: dict = None) -> str:
+        """Returns the cache key of a cone search
+
+        :param service: MAST service name, e.g. 'Mast.Caom.Cone'
+        :param ra: Right ascension of the cone center, in degrees
+        :param dec: Declination of the cone center, in degrees
+        :param radius: Radius of the cone, in degrees
+        :param extra_params: Any other request parameter that changes the result, such as the page
+        :returns: cache key
+        """
+        quantized = [int(round(value / CONE_QUANTUM)) for value in (ra % 360.0, dec, radius)]
+        return json.dumps([service] + quantized + [extra_params or {}], sort_keys=True)
+
+    def get(self, key: str, allow_stale: bool = False) -> str:
+        """Returns a cached result
+
+        :param key: Cache key, see cone_key
+        :param allow_stale: If True, results older than the time to live are returned as well
+        :returns: cached response body, or None if not cached (or stale)
+        """
+        with self._lock:
+            row = self._connection.execute("SELECT created, body FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None or (not allow_stale and time.time() - row[0] > self.ttl):
+                return None
+            with self._connection:
+                self._connection.execute("UPDATE results SET last_used = ? WHERE key = ?", (time.time(), key))
+        return zlib.decompress(row[1]).decode('utf-8')
+
+    def put(self, key: str, service: str, body: str):
+        """Caches a result, evicting the least recently used results if the cache grows too large
+
+        :param key: Cache key, see cone_key
+        :param service: MAST service name
+        :param body: Response body
+        """
+        compressed = zlib.compress(body.encode('utf-8'))
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                                     (key, service, now, now, len(compressed), compressed))
+            total_bytes = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+            if total_bytes > self.max_bytes:
+                evicted_bytes = 0
+                evicted_keys = []
+                for old_key, size in self._connection.execute("SELECT key, size FROM results WHERE key != ? ORDER BY last_used", (key,)):
+                    if total_bytes - evicted_bytes <= self.max_bytes:
+                        break
+                    evicted_keys.append((old_key,))
+                    evicted_bytes += size
+                self._connection.executemany("DELETE FROM results WHERE key = ?", evicted_keys)
+
+    def purge_expired(self) -> int:
+        """Deletes every result older than the time to live
+
+        :returns: number of results deleted
+        """
+        with self._lock, self._connection:
+            return self._connection.execute("DELETE FROM results WHERE created < ?", (time.time() - self.ttl,)).rowcount
+
+    def close(self):
+        """Closes the cache database"""
+        with self._lock:
+            self._connection.close()
+
+class MastClient:
+    """Client of the MAST API that reuses one keep-alive connection and caches cone search results on disk
+    In offline mode, only cached results are returned, however old they are. Not thread safe; use one client per thread
+    """
+
+    def __init__(self, server: str = MAST_SERVER, https: bool = True, cache: ConeSearchCache = None,
+                 offline: bool = False, timeout: float = 60, rate_limiter=None):
+        """Initializes a MAST client. No connection is made until the first uncached request
+
+        :param server: Host (and optionally ':port') of the MAST API. Point it at a local stand-in server for testing
+        :param https: Whether to connect over HTTPS
+        :param cache: Cone search cache. Defaults to the cache in the gGui cache directory. Pass False to disable caching
+        :param offline: If True, never connect, and raise ConnectionError on cache misses
+        :param timeout: Socket timeout in seconds
+        :param rate_limiter: Optional object whose wait() is called before every request sent to the server
+        """
+        self.server = server
+        self.https = https
+        self.cache = ConeSearchCache() if cache is None else cache
+        self.offline = offline
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        self._connection = None
+
+    def invoke(self, request_params: dict) -> str:
+        """Sends a request to the MAST API, bypassing the cache
+
+        :param request_params: MAST request (service, params, format, ...)
+        :returns: response body
+        """
+        return self.invoke_with_headers(request_params)[1]
+
+    def invoke_with_headers(self, request_params: dict) -> tuple:
+        """Sends a request to the MAST API, bypassing the cache, like invoke
+
+        :param request_params: MAST request (service, params, format, ...)
+        :returns: tuple of (HTTP response headers as a list of (name, value) tuples, response body)
+        """
+        if self.offline:
+            raise ConnectionError("MAST client is offline")
+        body = "request=" + urlencode(json.dumps(request_params))
+        headers = {"Content-type": "application/x-www-form-urlencoded",
+                   "Accept": "text/plain",
+                   "User-agent": "python-requests/" + ".".join(map(str, sys.version_info[:3]))}
+        # A kept alive connection may have been closed by the server since the last request. Retry once on a fresh one
+        for attempt in range(2):
+            if self._connection is None:
+                connection_type = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+                self._connection = connection_type(self.server, timeout=self.timeout)
+            if self.rate_limiter:
+                self.rate_limiter.wait()
+            try:
+                self._connection.request("POST", MAST_INVOKE_PATH, body, headers)
+                response = self._connection.getresponse()
+                data = response.read().decode('utf-8')
+            except (http.client.HTTPException, ConnectionError):
+                self.close()
+                if attempt:
+                    raise
+                continue
+            if response.status != 200:
+                raise ConnectionError("MAST request failed with HTTP " + str(response.status) + ": " + data[:200])
+            return response.getheaders(), data
+
+    def cone_search(self, ra: float, dec: float, radius: float, service: str = 'Mast.Caom.Cone',
+                    page: int = 1, pagesize: int = 2000) -> dict:
+        """Runs a cone search, answering from the cache whenever possible
+
+        :param ra: Right ascension of the cone center, in degrees
+        :param dec: Declination of the cone center, in degrees
+        :param radius: Radius of the cone, in degrees
+        :param service: MAST cone search service
+        :param page: Page of results to return
+        :param pagesize: Number of results per page
+        :returns: parsed MAST response
+        """
+        return json.loads(self.cone_search_raw(ra, dec, radius, service, page, pagesize))
+
+    def cone_search_raw(self, ra: float, dec: float, radius: float, service: str = 'Mast.Caom.Cone',
+                        page: int = 1, pagesize: int = 2000) -> str:
+        """Runs a cone search like cone_search, returning the unparsed response body"""
+        return self.cone_search_response(ra, dec, radius, service, page, pagesize)[1]
+
+    def cone_search_response(self, ra: float, dec: float, radius: float, service: str = 'Mast.Caom.Cone',
+                             page: int = 1, pagesize: int = 2000) -> tuple:
+        """Runs a cone search like cone_search, returning the HTTP response headers along with the unparsed body
+
+        :returns: tuple of (HTTP response headers as a list of (name, value) tuples, response body). Headers are
+            empty when the result came from the cache
+        """
+        key = ConeSearchCache.cone_key(service, ra, dec, radius, {'page': page, 'pagesize': pagesize})
+        if self.cache:
+            cached = self.cache.get(key, allow_stale=self.offline)
+            if cached is not None:
+                return [], cached
+        if self.offline:
+            raise ConnectionError("Cone search at ({0:f}, {1:f}) r={2:f} is not cached, and the MAST client is offline".format(ra, dec, radius))
+        request_params = {'service': service,
+                          'params': {'ra': ra, 'dec': dec, 'radius': radius},
+                          'format': 'json',
+                          'page': page,
+                          'pagesize': pagesize,
+                          'removenullcolumns': True,
+                          'timeout': 30}
+        try:
+            headers, data = self.invoke_with_headers(request_params)
+        except (OSError, http.client.HTTPException) as error:
+            # Better a stale result than none at all
+            stale = self.cache.get(key, allow_stale=True) if self.cache else None
+            if stale is None:
+                raise
+            print("WARNING: MAST unreachable (" + str(error) + "). Using a stale cached result")
+            return [], stale
+        # MAST answers 'EXECUTING' while a query is still running. Only cache finished results
+        if self.cache and json.loads(data).get('status') == 'COMPLETE':
+            self.cache.put(key, service, data)
+        return headers, data
+
+    def close(self):
+        """Closes the connection to MAST, if open"""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
@@ -0,0 +1,148 @@
+"""
+.. module:: memory
+    :synopsis: Accounts for the memory taken by loaded data products and gGui's caches, and keeps it within the budget set in ggui.conf
+.. moduleauthor:: Duy Nguyen <dnguyen@nrao.edu>
+"""
+
+from collections import OrderedDict
+import mmap
+from typing import Callable, NamedTuple
+
+import numpy
+
+from ggui.config import ggui_config
+from ggui.loader_pool import is_shared_buffer
+
+class MemoryUsage(NamedTuple):
+    """Bytes of data held in memory
+    Resident data was read or copied into memory. Mapped data is paged in from a file on demand, and the operating
+    system can drop it again under memory pressure without swapping, so it does not count against the budget
+    """
+    resident: int = 0
+    mapped: int = 0
+
+    def __add__(self, other):
+        return MemoryUsage(self.resident + other.resident, self.mapped + other.mapped)
+
+def array_memory(array: numpy.ndarray) -> MemoryUsage:
+    """Returns the memory an array's values take
+
+    :param array: Array, or view of an array
+    :returns: MemoryUsage of the array's values. Mapped if the array is a view of a memory mapped file, as numpy
+        and astropy map them. Shared memory from the loader processes is resident
+    """
+    base = array
+    while base is not None:
+        if isinstance(base, numpy.memmap) or (isinstance(base, mmap.mmap) and not is_shared_buffer(base)):
+            return MemoryUsage(0, array.nbytes)
+        base = getattr(base, 'base', None)
+    return MemoryUsage(array.nbytes, 0)
+
+def data_memory(data) -> MemoryUsage:
+    """Returns the memory the components of Glue data take
+    Coordinate and derived components are computed on demand, and lightcurve columns that were not loaded yet hold no
+    values, so neither counts
+
+    :param data: Glue Data, or list of Glue Data if a file holds several datasets
+    :returns: MemoryUsage of the data
+    """
+    if isinstance(data, list):
+        return sum((data_memory(dataset) for dataset in data), MemoryUsage())
+    usage = MemoryUsage()
+    for component_id in data.components:
+        values = getattr(data.get_component(component_id), '_data', None)
+        if isinstance(values, numpy.ndarray):
+            usage += array_memory(values)
+    return usage
+
+def estimate_product_memory(data_product_type: str, metadata: dict, memory_mapped: bool = False) -> int:
+    """Estimates the resident memory a data product will take once loaded, from its metadata alone
+
+    :param data_product_type: gGui data product type, e.g. 'lightcurve'
+    :param metadata: Product metadata from the product index
+    :param memory_mapped: Whether FITS files that can be memory mapped will be
+    :returns: estimated bytes
+    """
+    if metadata['kind'] == 'fits':
+        return 0 if memory_mapped and metadata.get('memmap') else metadata['data_nbytes']
+    if metadata['kind'] == 'csv':
+        # Lightcurves are memory mapped from the lightcurve cache. Other CSVs are parsed into 8 byte columns
+        return 0 if data_product_type == 'lightcurve' else metadata['estimated_rows'] * len(metadata['columns']) * 8
+    return metadata.get('size', 0)
+
+def format_bytes(nbytes: int) -> str:
+    """Formats a number of bytes in the units describe_product uses, e.g. '49.4 MB'"""
+    if nbytes >= 10 ** 9:
+        return "{0:.2f} GB".format(nbytes / 1e9)
+    return "{0:.1f} MB".format(nbytes / 1e6)
+
+class MemoryBudget:
+    """Keeps the primary target's data and gGui's caches within the memory budget set in ggui.conf
+    Caches register how to measure and how to drop themselves. When a target needs room, caches are dropped in the
+    order they were registered, oldest first, until its data fits
+    """
+
+    def __init__(self):
+        # Name of every registered cache to its (usage, evict) functions, oldest first
+        self._caches = OrderedDict()
+
+    @property
+    def limit(self) -> int:
+        """Budget in bytes, 0 for no limit"""
+        return ggui_config().memory_budget
+
+    def register_cache(self, name: str, usage: Callable[[], int], evict: Callable[[], None]):
+        """Registers a cache the budget may drop. Registering a name again replaces the earlier cache, as the newest
+
+        :param name: Unique name of the cache, e.g. 'Autochop gaps of lightcurve viewer'
+        :param usage: Function returning the bytes the cache takes
+        :param evict: Function dropping the cache
+        """
+        self._caches.pop(name, None)
+        self._caches[name] = (usage, evict)
+
+    def unregister_cache(self, name: str):
+        """Forgets a cache, e.g. once its owner dropped it itself
+
+        :param name: Name the cache was registered under
+        """
+        self._caches.pop(name, None)
+
+    def cache_usage(self) -> OrderedDict:
+        """Returns the bytes every registered cache takes, oldest first
+
+        :returns: ordered dict of cache name to bytes
+        """
+        return OrderedDict((name, usage()) for name, (usage, _) in self._caches.items())
+
+    def make_room(self, nbytes: int, in_use: int = 0) -> bool:
+        """Drops caches, oldest first, until data of the given size fits in the budget along with what is in use
+
+        :param nbytes: Bytes of resident memory needed
+        :param in_use: Bytes of resident memory taken by data that is not a cache, e.g. the primary target's
+        :returns: True if the data fits in the budget, even after dropping every cache
+        """
+        limit = self.limit
+        if not limit:
+            return True
+        cache_bytes = self.cache_usage()
+        total = nbytes + in_use + sum(cache_bytes.values())
+        for name, cached in cache_bytes.items():
+            if total <= limit:
+                break
+            _, evict = self._caches.pop(name)
+            evict()
+            total -= cached
+        return total <= limit
+
+_memory_budget = None
+
+def memory_budget() -> MemoryBudget:
+    """Returns the memory budget shared by gGui
+
+    :returns: the MemoryBudget
+    """
+    global _memory_budget
+    if _memory_budget is None:
+        _memory_budget = MemoryBudget()
+    return _memory_budget
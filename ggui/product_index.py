@@ -0,0 +1,261 @@
+"""
+.. module:: product_index
+    :synopsis: Persistent index of gPhoton data product metadata, read from file headers only
+.. moduleauthor:: Duy Nguyen <dnguyen@nrao.edu>
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import reduce
+import itertools
+import json
+import operator
+import os
+import sqlite3
+import threading
+from typing import TYPE_CHECKING, Iterable, Iterator
+
+from ggui.cache import cache_directory
+from ggui.catalog import resolve_product_path
+
+# astropy is imported on first use, so that building an index (e.g. at gGui startup) stays cheap
+if TYPE_CHECKING:
+    from astropy.wcs import WCS
+
+# Every FITS file starts with this card
+FITS_SIGNATURE = b'SIMPLE  ='
+
+# Bump whenever the metadata layout changes. Older entries are then re-read
+INDEX_VERSION = 1
+
+# Bytes read from the start of a CSV to estimate its row count
+CSV_SAMPLE_BYTES = 65536
+
+# Header keywords copied out of FITS headers for quick access
+FITS_SUMMARY_KEYWORDS = ('BAND', 'EXPTIME', 'EXPSTART', 'EXPEND')
+
+def read_fits_metadata(filepath: str) -> dict:
+    """Reads the metadata of a FITS file from its headers, without reading any data
+
+    :param filepath: Path of the FITS file
+    :returns: metadata dict. 'hdus' describes every HDU, and the first image HDU's header,
+        shape and data size are copied to the top level
+    """
+    from astropy.io import fits
+
+    metadata = {'kind': 'fits', 'hdus': [], 'header': None, 'shape': None, 'data_nbytes': 0, 'memmap': False}
+    with fits.open(filepath, memmap=True, lazy_load_hdus=True, ignore_missing_end=True) as hdulist:
+        for extnum, hdu in enumerate(hdulist):
+            header = hdu.header
+            is_image = isinstance(hdu, (fits.PrimaryHDU, fits.ImageHDU, fits.CompImageHDU))
+            shape = list(hdu.shape) if is_image else [header.get('NAXIS' + str(axis), 0) for axis in range(header.get('NAXIS', 0), 0, -1)]
+            data_nbytes = abs(header.get('BITPIX', 8)) // 8 * reduce(operator.mul, shape) if shape else 0
+            metadata['hdus'].append({'name': hdu.name or "HDU" + str(extnum), 'shape': shape, 'bitpix': header.get('BITPIX'),
+                                     'data_nbytes': data_nbytes, 'image': is_image})
+            metadata['data_nbytes'] += data_nbytes
+            if is_image and data_nbytes and metadata['header'] is None:
+                metadata['header'] = hdu.header.tostring()
+                metadata['shape'] = shape
+                # Only uncompressed, unscaled images can be memory mapped as is
+                metadata['memmap'] = not isinstance(hdu, fits.CompImageHDU) and header.get('BSCALE', 1) == 1 and header.get('BZERO', 0) == 0
+                for keyword in FITS_SUMMARY_KEYWORDS:
+                    if keyword in header:
+                        metadata[keyword.lower()] = header[keyword]
+    return metadata
+
+def read_csv_metadata(filepath: str) -> dict:
+    """Reads the column names of a CSV, and estimates its row count from the average length of its first rows
+
+    :param filepath: Path of the CSV file
+    :returns: metadata dict with 'columns' and 'estimated_rows'
+    """
+    file_size = os.path.getsize(filepath)
+    with open(filepath, 'rb') as csv_file:
+        header_line = csv_file.readline()
+        sample = csv_file.read(CSV_SAMPLE_BYTES)
+    columns = [column.strip() for column in header_line.decode().rstrip('\r\n').split(',')]
+    sample_lines = sample.splitlines(keepends=True)
+    # Unless the sample covered the whole file, its last line is likely cut short
+    if len(sample) == CSV_SAMPLE_BYTES:
+        sample_lines = sample_lines[:-1]
+    # gPhoton lightcurves end in commented parameter rows, which are not data
+    data_lines = [line for line in sample_lines if not line.startswith(b'#')]
+    if len(sample) < CSV_SAMPLE_BYTES or not data_lines:
+        estimated_rows = len(data_lines)
+    else:
+        estimated_rows = round((file_size - len(header_line)) * len(data_lines) / sum(map(len, data_lines)))
+    return {'kind': 'csv', 'columns': columns, 'estimated_rows': estimated_rows}
+
+def read_product_metadata(filepath: str) -> dict:
+    """Reads the metadata of a gPhoton data product from its header, detecting FITS files by signature
+
+    :param filepath: Path of the data product
+    :returns: metadata dict. 'kind' is 'fits', 'csv', 'other' (not a format gGui inspects),
+        or 'unreadable' (along with an 'error' message)
+    """
+    from astropy.io.fits import VerifyError
+
+    try:
+        with open(filepath, 'rb') as product_file:
+            signature = product_file.read(len(FITS_SIGNATURE))
+        if signature == FITS_SIGNATURE:
+            return read_fits_metadata(filepath)
+        if filepath.lower().endswith('.csv'):
+            return read_csv_metadata(filepath)
+        return {'kind': 'other'}
+    # Missing or truncated files raise OSError, malformed headers ValueError or VerifyError, and non-UTF-8 CSV headers
+    # UnicodeDecodeError, a ValueError
+    except (OSError, ValueError, VerifyError) as error:
+        return {'kind': 'unreadable', 'error': str(error)}
+
+def catalog_product_paths(target_catalog: str, targets) -> Iterator[str]:
+    """Yields the resolved path of every data product of a gGui Target Catalog
+
+    :param target_catalog: Path of the gGui Target Catalog
+    :param targets: Dict of target name to gGui target entry, or SQLiteTargetCatalog
+    :returns: generator of data product paths
+    """
+    if hasattr(targets, 'iter_product_paths'):
+        yield from targets.iter_product_paths()
+        return
+    for _, target_data in list(targets.items()):
+        for data_type, band_data in list(target_data.items()):
+            if data_type == '_notes':
+                continue
+            for filepathString in list(band_data.values()):
+                if filepathString:
+                    yield resolve_product_path(filepathString, target_catalog)
+
+class ProductMetadataIndex:
+    """Persistent index of data product metadata (shapes, WCS headers, exposure, bands, CSV columns and sizes)
+    Entries are keyed by path and are only trusted while the file's mtime and size are unchanged.
+    Catalogs are indexed in the background, while get() reads any missing entry on demand
+    """
+    # Number of products checked and stored at once when indexing in the background
+    batch_size = 256
+
+    def __init__(self, index_path: str = None, workers: int = 4):
+        """Opens (or creates) a metadata index
+
+        :param index_path: Path of the index database. Defaults to product_index.sqlite in the gGui cache directory
+        :param workers: Number of threads reading headers in the background
+        """
+        self.index_path = str(index_path or cache_directory() / 'product_index.sqlite')
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.index_path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS products (path TEXT PRIMARY KEY, mtime_ns INTEGER, "
+                                     "size INTEGER, version INTEGER, metadata TEXT)")
+        self._readers = ThreadPoolExecutor(max_workers=workers)
+        # Background indexing runs one catalog at a time, feeding the readers in batches
+        self._indexer = ThreadPoolExecutor(max_workers=1)
+        self._closed = False
+
+    def get(self, filepath: str) -> dict:
+        """Returns the metadata of a data product, reading its header now if it is not indexed or has changed
+
+        :param filepath: Path of the data product
+        :returns: metadata dict (see read_product_metadata), plus the file's 'size'. None if the file does not exist
+        """
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return None
+        with self._lock:
+            row = self._connection.execute("SELECT mtime_ns, size, version, metadata FROM products WHERE path = ?", (filepath,)).fetchone()
+        if row and row[:3] == (stat.st_mtime_ns, stat.st_size, INDEX_VERSION):
+            metadata = json.loads(row[3])
+        else:
+            metadata = read_product_metadata(filepath)
+            self._store([(filepath, stat, metadata)])
+        metadata['size'] = stat.st_size
+        return metadata
+
+    def wcs(self, filepath: str) -> 'WCS':
+        """Returns the WCS of a FITS product's first image, built from its indexed header
+
+        :param filepath: Path of the FITS product
+        :returns: astropy WCS, or None if the product has no image
+        """
+        metadata = self.get(filepath)
+        if not metadata or not metadata.get('header'):
+            return None
+        from astropy.io import fits
+        from astropy.wcs import WCS
+
+        return WCS(fits.Header.fromstring(metadata['header']))
+
+    def index_catalog(self, target_catalog: str, targets):
+        """Indexes every data product of a gGui Target Catalog in the background
+
+        :param target_catalog: Path of the gGui Target Catalog
+        :param targets: Dict of target name to gGui target entry, or SQLiteTargetCatalog
+        :returns: future resolving to the number of products (re)read
+        """
+        return self.prefetch(catalog_product_paths(target_catalog, targets))
+
+    def prefetch(self, filepaths: Iterable[str]):
+        """Indexes data products in the background. Products already indexed and unchanged are skipped
+
+        :param filepaths: Paths of the data products. Consumed lazily on the background thread
+        :returns: future resolving to the number of products (re)read
+        """
+        return self._indexer.submit(self._index_paths, filepaths)
+
+    def _index_paths(self, filepaths: Iterable[str]) -> int:
+        filepaths = iter(filepaths)
+        reread = 0
+        while not self._closed:
+            batch = list(itertools.islice(filepaths, self.batch_size))
+            if not batch:
+                break
+            stats = {}
+            for filepath in batch:
+                try:
+                    stats[filepath] = os.stat(filepath)
+                except OSError:
+                    continue
+            with self._lock:
+                indexed = {row[0]: row[1:] for row in self._connection.execute(
+                    "SELECT path, mtime_ns, size, version FROM products WHERE path IN (" + ",".join("?" * len(stats)) + ")", list(stats))}
+            stale = [filepath for filepath, stat in stats.items() if indexed.get(filepath) != (stat.st_mtime_ns, stat.st_size, INDEX_VERSION)]
+            self._store([(filepath, stats[filepath], metadata) for filepath, metadata in zip(stale, self._readers.map(read_product_metadata, stale))])
+            reread += len(stale)
+        return reread
+
+    def _store(self, entries: list):
+        """Writes (path, os.stat result, metadata) entries to the index in one transaction"""
+        if not entries:
+            return
+        with self._lock, self._connection:
+            self._connection.executemany("INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?, ?)",
+                                         ((filepath, stat.st_mtime_ns, stat.st_size, INDEX_VERSION, json.dumps(metadata))
+                                          for filepath, stat, metadata in entries))
+
+    def close(self):
+        """Stops background indexing and closes the index"""
+        self._closed = True
+        self._indexer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+        with self._lock:
+            self._connection.close()
+
+def describe_product(metadata: dict) -> str:
+    """Summarizes product metadata in a short human readable line
+
+    :param metadata: metadata dict returned by ProductMetadataIndex.get
+    :returns: summary, e.g. '3600 x 3600 image, 49.4 MB, EXPTIME 1520.0'
+    """
+    if not metadata:
+        return "missing"
+    size = "{0:.1f} MB".format(metadata.get('size', 0) / 1e6)
+    if metadata['kind'] == 'fits':
+        shape = " x ".join(map(str, reversed(metadata['shape']))) + " image" if metadata['shape'] else "no image"
+        summary = shape + ", " + size
+        if 'exptime' in metadata:
+            summary += ", EXPTIME " + str(metadata['exptime'])
+        return summary
+    if metadata['kind'] == 'csv':
+        return "~{0:d} rows x {1:d} columns, ".format(metadata['estimated_rows'], len(metadata['columns'])) + size
+    if metadata['kind'] == 'unreadable':
+        return "unreadable: " + metadata['error']
+    return size
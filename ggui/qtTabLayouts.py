@@ -4,18 +4,27 @@
 .. moduleauthor:: Duy Nguyen <dnguyen@nrao.edu>
 """
 
-from configparser import ConfigParser
-from PyQt5 import QtWidgets
+import itertools
+import math
+import numpy
+from PyQt5 import QtWidgets, QtCore
 from glue.app.qt.application import GlueApplication
 import glue.core.session
 from glue.config import qt_fixed_layout_tab, viewer_tool
-from glue.viewers.common.qt.tool import Tool
+from glue.viewers.common.qt.tool import Tool, CheckableTool
+from astropy.wcs import WCS
+from matplotlib.collections import PolyCollection
+from matplotlib.transforms import blended_transform_factory
 
 from glue.viewers.matplotlib.qt.data_viewer import MatplotlibDataViewer
 from glue.viewers.scatter.qt import ScatterViewer
 from glue.viewers.image.qt import ImageViewer
 
-from pkg_resources import resource_filename
+from ggui.config import LIGHTCURVE_ERROR_FIELD, ggui_config, icon_path
+from ggui.autochop import ObsWindowCache, combineObsWindows
+from ggui.memory import memory_budget
+from ggui.regions import RegionSet, read_ds9_regions
+from ggui.timing import switch_timer
 
 class gGuiOverviewBaseViewer(MatplotlibDataViewer):
     """Base class for gGui data viewers
@@ -23,6 +32,9 @@ class gGuiOverviewBaseViewer(MatplotlibDataViewer):
     Adds FUV/NUV band support and associated band toggle tools
     """
     tools = ['fuv_toggle', 'nuv_toggle']
+    # Viewer state kept in gGui session snapshots: plain properties, and attributes (saved by label). Missing ones are skipped
+    snapshot_properties = ('x_min', 'x_max', 'y_min', 'y_max', 'x_log', 'y_log', 'slices')
+    snapshot_attributes = ('x_att', 'y_att')
 
     def __init__(self, glue_session: glue.core.session, data: dict):
         """Initializes base gGui data viewer
@@ -67,6 +79,48 @@ class gGuiOverviewBaseViewer(MatplotlibDataViewer):
             # Set the band's visibility
             self.data_cache[band]['layer'].visible = value
 
+    def snapshot_state(self) -> dict:
+        """Captures the viewer's axes, limits, slices and band visibility, as JSON serializable values
+
+        :returns: viewer state, to restore with restore_state
+        """
+        state = {'bands': {band: bool(band_cache['layer'].visible) for band, band_cache in self.data_cache.items()}}
+        for attribute_name in self.snapshot_attributes:
+            attribute = getattr(self.state, attribute_name, None)
+            if attribute is not None:
+                state[attribute_name] = attribute.label
+        for property_name in self.snapshot_properties:
+            value = getattr(self.state, property_name, None)
+            if isinstance(value, (numpy.generic, bool, int, float)):
+                state[property_name] = value.item() if isinstance(value, numpy.generic) else value
+            elif isinstance(value, tuple) and all(isinstance(item, (int, numpy.integer)) for item in value):
+                state[property_name] = [int(item) for item in value]
+        return state
+
+    def restore_state(self, state: dict):
+        """Restores a state captured by snapshot_state. Anything that does not apply to the viewer's data is skipped
+
+        :param state: viewer state
+        """
+        band_data = list(self.data_cache.values())[0]['data'] if self.data_cache else None
+        # Attributes go first, since changing them resets the limits
+        for attribute_name in self.snapshot_attributes:
+            if attribute_name in state and band_data is not None and hasattr(self.state, attribute_name):
+                try:
+                    setattr(self.state, attribute_name, band_data.id[state[attribute_name]])
+                except (KeyError, ValueError):
+                    pass
+        for property_name in self.snapshot_properties:
+            if property_name in state and hasattr(self.state, property_name):
+                value = state[property_name]
+                try:
+                    setattr(self.state, property_name, tuple(value) if isinstance(value, list) else value)
+                except (ValueError, TypeError, IndexError):
+                    pass
+        for band, visible in state.get('bands', {}).items():
+            if band in self.data_cache:
+                self.data_cache[band]['layer'].visible = visible
+
     def mousePressEvent(self, event):
         self._session.application._viewer_in_focus = self
         self._session.application._update_focus_decoration()
@@ -74,6 +128,7 @@ class gGuiOverviewBaseViewer(MatplotlibDataViewer):
 
 class ggui_lightcurve_viewer(gGuiOverviewBaseViewer, ScatterViewer):
     """Data Viewer class that handles gPhoton lightcurve events"""
+    tools = gGuiOverviewBaseViewer.tools + ['ggui_autochop']
 
     def __init__(self, session: glue.core.session, lightcurve_data: dict, x_att: str = None, y_att: str = None):
         """Initializes an instance of the gPhoton lightcurve viewer
@@ -107,20 +162,121 @@ class ggui_lightcurve_viewer(gGuiOverviewBaseViewer, ScatterViewer):
             datalayer['layer'].linestyle = 'solid'
             datalayer['layer'].line_visible = True
             # Set, and Enable, flux (y axis) error
-            datalayer['layer'].yerr_att = datalayer['data'].id['flux_bgsub_err']
+            datalayer['layer'].yerr_att = datalayer['data'].id[LIGHTCURVE_ERROR_FIELD]
             datalayer['layer'].yerr_visible = True
 
 
 class ggui_image_viewer(gGuiOverviewBaseViewer, ImageViewer):
     """Data Viewer class that handles gPhoton FITS images"""
-    def __init__(self, session: glue.core.session, image_data: dict, x_att: str, y_att: str):
+    tools = gGuiOverviewBaseViewer.tools + ['ggui_region_overlay']
+
+    def __init__(self, session: glue.core.session, image_data: dict, x_att: str, y_att: str, data_product_type: str = None):
+        """Initializes an instance of the gPhoton image viewer
+
+        :param session: Corresponding Glue parent's 'session' object that stores
+        information about the current environment of glue. Needed for superclass constructor
+        :param image_data: Dict containing image data identified via respective frequency band
+        :param x_att: Label of attribute to assign to the x-axis
+        :param y_att: Label of attribute to assign to the y-axis
+        :param data_product_type: gGui data product type of the images, e.g. 'coadd', under which the Target Manager
+            knows their files
+        """
         super().__init__(session, image_data)
+        self.data_product_type = data_product_type
+        self._region_overlay = None
+
+    def product_metadata(self) -> dict:
+        """Returns the product index metadata of the viewer's image files, read from their headers only
+
+        :returns: dict of band to metadata dict (see ggui.product_index.read_product_metadata). Empty if the
+            Target Manager does not know the files
+        """
+        target_manager = getattr(self._session.application, 'target_manager', None)
+        if target_manager is None or self.data_product_type is None:
+            return {}
+        product_index = target_manager.getProductIndex()
+        return {band: product_index.get(band_file) for band, band_file in target_manager.getPrimaryProductFiles(self.data_product_type).items()
+                if band in self.data_cache}
+
+    def celestial_wcs(self) -> WCS:
+        """Returns the celestial WCS of the viewer's images, or None if they have none
+        Taken from the product index when it has the images' headers, or else from the loaded data
+        """
+        target_manager = getattr(self._session.application, 'target_manager', None)
+        if target_manager is not None and self.data_product_type is not None:
+            for band, band_file in target_manager.getPrimaryProductFiles(self.data_product_type).items():
+                wcs = target_manager.getProductIndex().wcs(band_file) if band in self.data_cache else None
+                if wcs is not None and wcs.has_celestial:
+                    return wcs.celestial
+        for band_cache in self.data_cache.values():
+            coords = band_cache['data'].coords
+            # Older Glue versions wrap the astropy WCS
+            if not isinstance(coords, WCS):
+                coords = getattr(coords, 'wcs', None)
+            if isinstance(coords, WCS) and coords.has_celestial:
+                return coords.celestial
+        return None
+
+    def image_shape(self) -> tuple:
+        """Returns the (height, width) in pixels of the viewer's images
+        Taken from the product index when it has the images' headers, or else from the loaded data
+
+        :returns: tuple of (height, width), or None if the viewer has no images
+        """
+        for metadata in self.product_metadata().values():
+            if metadata and metadata.get('shape') and len(metadata['shape']) >= 2:
+                return tuple(metadata['shape'][-2:])
+        for band_cache in self.data_cache.values():
+            if band_cache['data'].ndim >= 2:
+                return tuple(band_cache['data'].shape[-2:])
+        return None
+
+    def show_regions(self, region_set: RegionSet, colors: list = None) -> int:
+        """Overlays sky regions on the image, replacing any previous overlay
+        Every vertex of every region goes through one WCS transform, and all regions are drawn as a single collection.
+        Regions entirely outside the image are left out, so overlays of whole-sky searches stay cheap to draw
+
+        :param region_set: Regions to draw, e.g. from ggui.regions.read_ds9_regions or parse_s_regions
+        :param colors: DS9 color property of each region owner (e.g. 'red' or 'green dash=1'). Defaults to green
+        :returns: number of regions drawn
+        """
+        self.clear_regions()
+        wcs = self.celestial_wcs()
+        if wcs is None or not len(region_set):
+            return 0
+        polygons = region_set.polygons()
+        vertices = numpy.concatenate(polygons)
+        pixel_x, pixel_y = wcs.all_world2pix(vertices[:, 0], vertices[:, 1], 0)
+        pixel_polygons = numpy.split(numpy.column_stack((pixel_x, pixel_y)), numpy.cumsum([len(polygon) for polygon in polygons])[:-1])
+        # Only the color itself of DS9 color properties is used, e.g. 'green' of 'green dash=1'
+        edge_colors = ['green'] * len(region_set) if colors is None else [colors[owner].split()[0] for owner in region_set.owners.tolist()]
+        shape = self.image_shape()
+        if shape is not None:
+            # Keep regions whose pixel bounding box overlaps the image
+            height, width = shape
+            on_image = [polygon[:, 0].max() >= -0.5 and polygon[:, 0].min() <= width - 0.5 and
+                        polygon[:, 1].max() >= -0.5 and polygon[:, 1].min() <= height - 0.5 for polygon in pixel_polygons]
+            pixel_polygons = [polygon for polygon, keep in zip(pixel_polygons, on_image) if keep]
+            edge_colors = [color for color, keep in zip(edge_colors, on_image) if keep]
+        if not pixel_polygons:
+            return 0
+        self._region_overlay = PolyCollection(pixel_polygons, facecolor='none', edgecolors=edge_colors, linewidths=1, zorder=10)
+        self.axes.add_collection(self._region_overlay, autolim=False)
+        self.figure.canvas.draw_idle()
+        return len(pixel_polygons)
+
+    def clear_regions(self):
+        """Removes the region overlay, if any"""
+        if self._region_overlay is not None:
+            self._region_overlay.remove()
+            self._region_overlay = None
+            self.figure.canvas.draw_idle()
 
 @viewer_tool
 class FuvToggleTool(Tool):
     """Glue data viewer tool that calls the FUV band visibility toggle method to corresponding ggui data viewer"""
     # Set the boilerplate attributes
-    icon = resource_filename('ggui.icons', 'FUV_transparent.png')
+    icon = icon_path('FUV_transparent.png')
     tool_id = 'fuv_toggle'
     tool_tip = 'Toggle the FUV Dataset'
 
@@ -139,7 +295,7 @@ class FuvToggleTool(Tool):
 class NuvToggleTool(Tool):
     """Glue data viewer tool that calls the NUV band visibility toggle method to corresponding ggui data viewer"""
     # Set the boilerplate attributes
-    icon = resource_filename('ggui.icons', 'NUV_transparent.png')
+    icon = icon_path('NUV_transparent.png')
     tool_id = 'nuv_toggle'
     tool_tip = 'Toggle the NUV Dataset'
 
@@ -154,6 +310,299 @@ class NuvToggleTool(Tool):
         """Calls the ggui data viewer's data visibility toggle with the 'FUV' band"""
         self.viewer.toggle_band_visibility('NUV')
 
+@viewer_tool
+class AutoChopTool(CheckableTool):
+    """Glue data viewer tool that previews autochop observation windows of a ggui lightcurve viewer
+    A slider sets the gap threshold between observation windows. Windows are recomputed from a cached,
+    sorted gap array and drawn as blitted spans, so dragging the slider stays interactive on long lightcurves
+    """
+    # Set the boilerplate attributes
+    icon = icon_path('AutoChop_transparent.png')
+    tool_id = 'ggui_autochop'
+    action_text = 'Autochop lightcurve'
+    tool_tip = 'Preview and apply autochop observation windows'
+    status_tip = 'Drag the slider to change the gap threshold between observation windows'
+    # Number of slider steps between the smallest and largest gap
+    slider_steps = 1000
+    # Initial gap threshold, in seconds. Clamped to the lightcurve's range of gaps
+    default_threshold = 3600.0
+    # Numbers the gap caches of every tool for the memory budget
+    _cache_numbers = itertools.count(1)
+
+    def __init__(self, viewer):
+        """Initializes the autochop tool
+
+        :param viewer: The corresponding data viewer this tool belongs to
+        """
+        super().__init__(viewer)
+        self._window_caches = {}
+        self._span_collections = {}
+        self._background = None
+        self._draw_connection = None
+        self._log_range = None
+        self._slider_widget = None
+        self._cache_name = "Autochop preview " + str(next(self._cache_numbers))
+        # None previews every band's own windows. 'union' or 'intersection' previews windows shared by all bands
+        self.band_mode = None
+
+    def activate(self):
+        """Caches every band's gaps and displays the gap threshold slider along with the current windows"""
+        x_att = self.viewer.state.x_att
+        if x_att is None:
+            return
+        axes = self.viewer.axes
+        # Spans cover the full height of the axes regardless of the y limits
+        span_transform = blended_transform_factory(axes.transData, axes.transAxes)
+        gap_ranges = []
+        for band, band_cache in self.viewer.data_cache.items():
+            self._window_caches[band] = ObsWindowCache(band_cache['data'][x_att.label])
+            if self._window_caches[band].gapRange():
+                gap_ranges.append(self._window_caches[band].gapRange())
+            band_color = band_cache['layer'].color
+            self._span_collections[band] = PolyCollection([], transform=span_transform, animated=True,
+                                                          facecolor=band_color, edgecolor=band_color, alpha=0.15)
+            axes.add_collection(self._span_collections[band], autolim=False)
+        # Under memory pressure, the budget ends the preview to drop the gap caches
+        memory_budget().register_cache(self._cache_name, self.cache_nbytes, self.end_preview)
+        # Shared windows are drawn in a neutral color, as they belong to every band
+        self._span_collections[None] = PolyCollection([], transform=span_transform, animated=True,
+                                                      facecolor='gray', edgecolor='gray', alpha=0.25)
+        axes.add_collection(self._span_collections[None], autolim=False)
+        # Without any gaps, every lightcurve is a single window and there is nothing to slide over
+        if not gap_ranges:
+            return
+        # Logarithmic slider between the smallest positive gap and the largest gap
+        smallest_gap = max(min(gap_range[0] for gap_range in gap_ranges), 1e-3)
+        largest_gap = max(max(gap_range[1] for gap_range in gap_ranges), smallest_gap * 10)
+        self._log_range = (math.log10(smallest_gap), math.log10(largest_gap))
+
+        self._slider_widget = autochop_slider_widget(self)
+        self._slider_widget.set_threshold(min(max(self.default_threshold, smallest_gap), largest_gap))
+        self._draw_connection = self.viewer.figure.canvas.mpl_connect('draw_event', self._on_draw)
+        self.viewer.figure.canvas.draw_idle()
+        self._slider_widget.show()
+
+    def deactivate(self):
+        """Removes the window spans and hides the gap threshold slider"""
+        if self._draw_connection is not None:
+            self.viewer.figure.canvas.mpl_disconnect(self._draw_connection)
+            self._draw_connection = None
+        for span_collection in self._span_collections.values():
+            span_collection.remove()
+        self._span_collections = {}
+        self._window_caches = {}
+        memory_budget().unregister_cache(self._cache_name)
+        self._background = None
+        if self._slider_widget:
+            self._slider_widget.close()
+            self._slider_widget = None
+        self.viewer.figure.canvas.draw_idle()
+
+    def close(self):
+        """Housekeeping when the parent viewer closes"""
+        if self._slider_widget:
+            self._slider_widget.close()
+            self._slider_widget = None
+        memory_budget().unregister_cache(self._cache_name)
+        super().close()
+
+    def cache_nbytes(self) -> int:
+        """Returns the bytes taken by every band's cached gaps"""
+        return sum(window_cache.nbytes for window_cache in self._window_caches.values())
+
+    def end_preview(self):
+        """Unchecks the tool, which ends the preview and drops its caches"""
+        if self.viewer.toolbar.active_tool is self:
+            self.viewer.toolbar.active_tool = None
+        else:
+            self.deactivate()
+
+    def position_to_threshold(self, position: int) -> float:
+        """Converts a slider position to a gap threshold
+
+        :param position: Slider position, between 0 and slider_steps
+        :returns: gap threshold in units of the lightcurve time axis
+        """
+        return 10 ** (self._log_range[0] + (self._log_range[1] - self._log_range[0]) * position / self.slider_steps)
+
+    def threshold_to_position(self, threshold: float) -> int:
+        """Converts a gap threshold to the nearest slider position
+
+        :param threshold: gap threshold in units of the lightcurve time axis
+        :returns: slider position, between 0 and slider_steps
+        """
+        return round((math.log10(threshold) - self._log_range[0]) / (self._log_range[1] - self._log_range[0]) * self.slider_steps)
+
+    def update_windows(self, threshold: float) -> int:
+        """Recomputes every band's windows for the given threshold and blits their spans
+
+        :param threshold: gap threshold in units of the lightcurve time axis
+        :returns: number of windows of the band with the most windows
+        """
+        band_windows = {band: window_cache.windows(threshold)[2:] for band, window_cache in self._window_caches.items()}
+        if self.band_mode:
+            band_windows = {None: combineObsWindows(list(band_windows.values()), self.band_mode)}
+        most_windows = 0
+        for band, span_collection in self._span_collections.items():
+            start_times, end_times = band_windows.get(band, (numpy.empty(0), numpy.empty(0)))
+            most_windows = max(most_windows, len(start_times))
+            # One (start, 0), (start, 1), (end, 1), (end, 0) rectangle per window, in blended coordinates
+            span_x = numpy.column_stack((start_times, start_times, end_times, end_times))
+            span_y = numpy.broadcast_to([0, 1, 1, 0], span_x.shape)
+            span_collection.set_verts(numpy.stack((span_x, span_y), axis=-1))
+            if band:
+                span_collection.set_visible(self.viewer.data_cache[band]['layer'].visible)
+        self._blit()
+        return most_windows
+
+    def apply_windows(self, threshold: float):
+        """Hands the current threshold to the Target Manager to create autochop subsets of the primary target
+
+        :param threshold: gap threshold in units of the lightcurve time axis
+        """
+        target_manager = getattr(self.viewer.session.application, 'target_manager', None)
+        if target_manager:
+            target_manager.autochopPrimaryLightcurves(threshold, self.band_mode)
+
+    def load_window_tables(self):
+        """Prompts for the directory ggui-autochop wrote its window tables to, and has the Target Manager turn the
+        primary target's tables into autochop subsets
+        """
+        target_manager = getattr(self.viewer.session.application, 'target_manager', None)
+        if not target_manager:
+            return
+        window_dir = QtWidgets.QFileDialog.getExistingDirectory(caption="Select ggui-autochop Output Directory")
+        if not window_dir:
+            return
+        try:
+            windows = target_manager.loadPrimaryWindowTables(window_dir)
+        except (OSError, ValueError) as e:
+            QtWidgets.QMessageBox.warning(self.viewer, "gGui Autochop", "Unable to read window tables:\n" + str(e))
+            return
+        if not windows:
+            QtWidgets.QMessageBox.information(self.viewer, "gGui Autochop", "No window tables of " + target_manager.getPrimaryName() + " in " + window_dir)
+
+    def _on_draw(self, _):
+        """Caches the freshly drawn (span-free) background, then blits the spans on top of it"""
+        canvas = self.viewer.figure.canvas
+        self._background = canvas.copy_from_bbox(self.viewer.axes.bbox)
+        self._blit()
+
+    def _blit(self):
+        """Redraws only the window spans over the cached background"""
+        if self._background is None:
+            return
+        canvas = self.viewer.figure.canvas
+        canvas.restore_region(self._background)
+        for span_collection in self._span_collections.values():
+            self.viewer.axes.draw_artist(span_collection)
+        canvas.blit(self.viewer.axes.bbox)
+
+@viewer_tool
+class RegionOverlayTool(CheckableTool):
+    """Glue data viewer tool that overlays a DS9 region file (e.g. from ggui-mast-search) on a ggui image viewer"""
+    # Set the boilerplate attributes
+    icon = icon_path('RegionOverlay_transparent.png')
+    tool_id = 'ggui_region_overlay'
+    action_text = 'Overlay DS9 regions'
+    tool_tip = 'Overlay the footprints of a DS9 region file'
+
+    def activate(self):
+        """Prompts for a region file and overlays its regions. The tool is unchecked again if none is loaded"""
+        region_fname, _ = QtWidgets.QFileDialog.getOpenFileName(caption="Select DS9 Region File", filter="DS9 Regions (*.reg *.reg.gz)")
+        if not region_fname:
+            self.uncheck()
+            return
+        try:
+            region_set, colors = read_ds9_regions(region_fname)
+        except (OSError, ValueError) as e:
+            QtWidgets.QMessageBox.warning(self.viewer, "DS9 Regions", "Unable to read " + region_fname + ":\n" + str(e))
+            self.uncheck()
+            return
+        # colors holds the color of every owner, including shapes that were skipped, as show_regions indexes them
+        if not self.viewer.show_regions(region_set, colors):
+            QtWidgets.QMessageBox.information(self.viewer, "DS9 Regions", "No circles or polygons in ICRS or FK5 degrees over this image in " + region_fname)
+
+    def uncheck(self):
+        """Unchecks the tool once the toolbar has finished activating it"""
+        def end():
+            if self.viewer.toolbar.active_tool is self:
+                self.viewer.toolbar.active_tool = None
+        QtCore.QTimer.singleShot(0, end)
+
+    def deactivate(self):
+        """Removes the region overlay"""
+        self.viewer.clear_regions()
+
+class autochop_slider_widget(QtWidgets.QGroupBox):
+    """Subwidget holding the gap threshold slider of the autochop tool"""
+
+    def __init__(self, tool: AutoChopTool):
+        """
+        Initializes the slider widget
+
+        :param tool: The autochop tool that spawned this widget
+        """
+        super().__init__(tool.viewer)
+        self.setWindowFlags(QtCore.Qt.Tool)
+        self.setWindowTitle("gGui Autochop")
+        self.setTitle("Gap Threshold")
+        self._tool = tool
+        # Initialize Widgets
+        self._slider = QtWidgets.QSlider(QtCore.Qt.Horizontal)
+        self._slider.setRange(0, tool.slider_steps)
+        self._slider.valueChanged.connect(self.slider_moved)
+        self._threshold_label = QtWidgets.QLabel()
+        self._band_mode_box = QtWidgets.QComboBox()
+        self._band_mode_box.addItem("Each band", None)
+        self._band_mode_box.addItem("Union of bands", 'union')
+        self._band_mode_box.addItem("Intersection of bands", 'intersection')
+        self._band_mode_box.currentIndexChanged.connect(self.band_mode_changed)
+        self._apply_button = QtWidgets.QPushButton("Create Autochop Subsets")
+        self._apply_button.clicked.connect(lambda: self._tool.apply_windows(self.threshold()))
+        self._load_button = QtWidgets.QPushButton("Load Window Tables...")
+        self._load_button.setToolTip("Create autochop subsets from the window tables ggui-autochop wrote")
+        self._load_button.clicked.connect(self._tool.load_window_tables)
+        # Declare Layout
+        self._layout = QtWidgets.QGridLayout()
+        self.setLayout(self._layout)
+        # Organize Widgets in Layout
+        self._layout.addWidget(self._slider, 0, 0, 1, 3)
+        self._layout.addWidget(self._threshold_label, 1, 0)
+        self._layout.addWidget(self._band_mode_box, 1, 1)
+        self._layout.addWidget(self._apply_button, 1, 2)
+        self._layout.addWidget(self._load_button, 2, 2)
+
+    def threshold(self) -> float:
+        """Returns the gap threshold currently selected on the slider"""
+        return self._tool.position_to_threshold(self._slider.value())
+
+    def set_threshold(self, threshold: float):
+        """Moves the slider to the given gap threshold
+
+        :param threshold: gap threshold in units of the lightcurve time axis
+        """
+        position = self._tool.threshold_to_position(threshold)
+        # Setting an unchanged value emits no signal, so refresh explicitly
+        if position == self._slider.value():
+            self.slider_moved(position)
+        else:
+            self._slider.setValue(position)
+
+    def slider_moved(self, position: int):
+        """Recomputes and redraws the windows for the new slider position
+
+        :param position: New slider position
+        """
+        threshold = self._tool.position_to_threshold(position)
+        windows = self._tool.update_windows(threshold)
+        self._threshold_label.setText("{0:.1f} s: {1:d} windows".format(threshold, windows))
+
+    def band_mode_changed(self, _):
+        """Switches the autochop tool between per-band and shared windows, and redraws them"""
+        self._tool.band_mode = self._band_mode_box.currentData()
+        self.slider_moved(self._slider.value())
+
 @qt_fixed_layout_tab
 class ggui_overview_tab(QtWidgets.QMdiArea):
     """Displays an overview of all gPhoton data products supplied to ggui"""
@@ -178,16 +627,18 @@ class ggui_overview_tab(QtWidgets.QMdiArea):
         if target_data:
             self.load_data(session, target_name, target_data)
        
-    def load_data(self, session: glue.core.session, target_name: str, target_data: dict):
+    def load_data(self, session: glue.core.session, target_name: str, target_data: dict, viewer_states: dict = None):
         """Constructs the appropriate data viewer for any gPhoton data products provided
 
         :param session: Corresponding Glue parent's 'session' object that stores 
             information about the current environment of glue.
         :param target_name: The name of the target we are "overviewing"
         :param target_data: The gPhoton data (lighcurves, coadds, cubes) we are "overviewing"
+        :param viewer_states: dict of data product type to viewer state captured by snapshot_state, applied to each
+            viewer as it is built, before it is first drawn
         """
-        config = ConfigParser()
-        config.read(resource_filename('ggui', 'ggui.conf'))
+        config = ggui_config()
+        timer = switch_timer()
 
         # Connect each gPhoton data product to its corresponding load method
         viewer_setters = {
@@ -213,7 +664,12 @@ class ggui_overview_tab(QtWidgets.QMdiArea):
         for dataType, data in target_data.items():
             try:
                 if data:
-                    self._initialized_viewers[dataType] = viewer_setters[dataType](session, target_name, data, config.get('Mandatory Fields', dataType + "_x", fallback=None), config.get('Mandatory Fields', dataType + "_y", fallback=None))
+                    with timer.span('viewer_construction', product=dataType):
+                        self._initialized_viewers[dataType] = viewer_setters[dataType](session, target_name, data, config.fields(dataType).x or None, config.fields(dataType).y or None)
+                        # Viewers only draw once control returns to the event loop, so a restored state is never drawn over
+                        if viewer_states and dataType in viewer_states:
+                            self._initialized_viewers[dataType].restore_state(viewer_states[dataType])
+                    timer.time_first_draw(self._initialized_viewers[dataType].figure.canvas, product=dataType)
             except ValueError as error:
                 print("WARNING: " + str(error))
                 continue
@@ -226,6 +682,22 @@ class ggui_overview_tab(QtWidgets.QMdiArea):
         session.application._update_focus_decoration()
         session.application._update_plot_dashboard()
         
+    def snapshot_state(self) -> dict:
+        """Captures the state of every overview viewer
+
+        :returns: dict of data product type to viewer state, see gGuiOverviewBaseViewer.snapshot_state
+        """
+        return {data_product: viewer.snapshot_state() for data_product, viewer in self._initialized_viewers.items()}
+
+    def restore_state(self, viewer_states: dict):
+        """Restores the state of every overview viewer captured by snapshot_state
+
+        :param viewer_states: dict of data product type to viewer state
+        """
+        for data_product, viewer_state in viewer_states.items():
+            if data_product in self._initialized_viewers:
+                self._initialized_viewers[data_product].restore_state(viewer_state)
+
     def loadLightcurve(self, session: glue.core.session, target_name: str, lightcurve_data: dict, x_att: str, y_att: str):
         """Constructs a lightcurve viewer for gPhoton Lightcurve data
 
@@ -271,7 +743,7 @@ class ggui_overview_tab(QtWidgets.QMdiArea):
             if isinstance(band_data, list):
                 raise ValueError(str(target_name) + " band " + str(band) + " has more than one (" + str(len(band_data)) + ") associated dataset. Cannot plot coadd data for this band due to ambiguity.")
         # Construct the data viewer class
-        coaddViewer = ggui_image_viewer(session, coadd_data, x_att, y_att)
+        coaddViewer = ggui_image_viewer(session, coadd_data, x_att, y_att, 'coadd')
         # Enable the band visibility toggle tools we have data for
         coaddViewer.toolbar.actions['fuv_toggle'].setEnabled('FUV' in list(coadd_data.keys()))
         coaddViewer.toolbar.actions['nuv_toggle'].setEnabled('NUV' in list(coadd_data.keys()))
@@ -298,7 +770,7 @@ class ggui_overview_tab(QtWidgets.QMdiArea):
             if isinstance(band_data, list):
                 raise ValueError(str(target_name) + " band " + str(band) + " has more than one (" + str(len(band_data)) + ") associated dataset. Cannot plot cube data for this band due to ambiguity.")
         # Construct the data viewer class
-        cubeViewer = ggui_image_viewer(session, cube_data, x_att, y_att)
+        cubeViewer = ggui_image_viewer(session, cube_data, x_att, y_att, 'cube')
         # Enable the band visibility toggle tools we have data for
         cubeViewer.toolbar.actions['fuv_toggle'].setEnabled('FUV' in list(cube_data.keys()))
         cubeViewer.toolbar.actions['nuv_toggle'].setEnabled('NUV' in list(cube_data.keys()))
@@ -0,0 +1,231 @@
+"""
+.. module:: regions
+    :synopsis: Vectorized parsing of MAST s_region (STC-S) strings, and reading and writing of DS9 region files
+.. moduleauthor:: Duy Nguyen <dnguyen@nrao.edu>
+"""
+
+import gzip
+import re
+
+import numpy
+
+# Shapes gGui understands. Any other shape in an s_region is skipped
+SUPPORTED_SHAPES = ('CIRCLE', 'POLYGON')
+
+# A supported shape, any frame or flavor names (e.g. ICRS, J2000, TOPOCENTER), then its numeric parameters
+S_REGION_PATTERN = re.compile(r'\b(CIRCLE|POLYGON)\b(?:\s+(?![-+.\d])\S+)*((?:\s+[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)+)', re.IGNORECASE)
+
+# A DS9 circle or polygon, with its optional properties (e.g. '# color=red')
+DS9_SHAPE_PATTERN = re.compile(r'^\s*(circle|polygon)\(([^)]*)\)\s*(?:#(.*))?$', re.IGNORECASE | re.MULTILINE)
+DS9_COLOR_PATTERN = re.compile(r'color=(\S+)')
+
+# DS9 coordinate systems whose coordinates are read as ICRS degrees. FK5 (J2000) differs from ICRS by far less than a
+# GALEX pixel. Shapes in any other system (image, physical, galactic, ...) are skipped
+DS9_SKY_SYSTEMS = ('icrs', 'fk5', 'j2000', 'wcs')
+DS9_OTHER_SYSTEMS = ('image', 'physical', 'detector', 'amplifier', 'linear', 'tile', 'fk4', 'b1950', 'galactic', 'ecliptic')
+DS9_WCS_PATTERN = re.compile(r'wcs[a-z]?$')
+
+# DS9 angle units, to degrees: degrees, arcminutes and arcseconds
+DS9_ANGLE_UNITS = {'d': 1.0, "'": 1 / 60, '"': 1 / 3600}
+
+# DS9 colors of observations, by mission (obs_collection). High level science products ('hlsp' projects) are yellow
+MISSION_COLORS = {'HST': 'red', 'HLA': 'red', 'KEPLER': 'green', 'K2': 'green', 'PS1': 'blue', 'SWIFT': 'cyan', 'GALEX': 'magenta'}
+HLSP_COLOR = 'yellow'
+DEFAULT_COLOR = 'green dash=1'
+
+class RegionSet:
+    """Circles and polygons stored in flat arrays, so thousands of regions are handled without per-region objects
+    Shape i has its parameters (ra, dec, radius for circles; ra1, dec1, ra2, dec2, ... for polygons, all in degrees)
+    in values[offsets[i]:offsets[i + 1]], and came from input owners[i]
+    """
+
+    def __init__(self, owners: numpy.ndarray, is_circle: numpy.ndarray, offsets: numpy.ndarray, values: numpy.ndarray):
+        self.owners = owners
+        self.is_circle = is_circle
+        self.offsets = offsets
+        self.values = values
+
+    def __len__(self) -> int:
+        return len(self.owners)
+
+    def shape(self, index: int) -> tuple:
+        """Returns a single shape
+
+        :param index: Index of the shape
+        :returns: tuple of ('CIRCLE' or 'POLYGON', parameter array)
+        """
+        return ('CIRCLE' if self.is_circle[index] else 'POLYGON'), self.values[self.offsets[index]:self.offsets[index + 1]]
+
+    def polygons(self, circle_vertices: int = 32) -> list:
+        """Returns every shape as polygon vertices. Circles are approximated in the plane of the sky
+
+        :param circle_vertices: Number of vertices circles are approximated with
+        :returns: list of (n, 2) arrays of (ra, dec) vertices, in degrees
+        """
+        angles = numpy.linspace(0, 2 * numpy.pi, circle_vertices, endpoint=False)
+        polygons = []
+        for index in range(len(self)):
+            shape, parameters = self.shape(index)
+            if shape == 'CIRCLE':
+                ra, dec, radius = parameters
+                polygons.append(numpy.column_stack((ra + radius * numpy.cos(angles) / max(numpy.cos(numpy.radians(dec)), 1e-6),
+                                                    dec + radius * numpy.sin(angles))))
+            else:
+                polygons.append(parameters.reshape(-1, 2))
+        return polygons
+
+def _shape_values(values: list) -> numpy.ndarray:
+    """Converts the parameters of one shape to float, or returns None if any of them is not a number (e.g. sexagesimal)"""
+    try:
+        return numpy.array(values, dtype=float)
+    except ValueError:
+        return None
+
+def _region_set(owners: list, shapes: list, value_strings: list) -> RegionSet:
+    """Builds a RegionSet, converting every numeric parameter of every shape to float in a single call
+    Should any parameter not be a number, shapes are converted one by one instead, and only the shapes at fault dropped
+    """
+    counts = numpy.array([len(values) for values in value_strings], dtype=numpy.int64)
+    try:
+        values = numpy.array([value for values in value_strings for value in values], dtype=float)
+        parsed = numpy.ones(len(shapes), dtype=bool)
+    except ValueError:
+        shape_values = [_shape_values(values) for values in value_strings]
+        parsed = numpy.array([values is not None for values in shape_values], dtype=bool)
+        values = numpy.concatenate([numpy.full(count, numpy.nan) if values is None else values
+                                    for values, count in zip(shape_values, counts.tolist())])
+    is_circle = numpy.array([shape.upper() == 'CIRCLE' for shape in shapes], dtype=bool)
+    # Discard malformed shapes
+    valid = numpy.where(is_circle, counts == 3, (counts >= 6) & (counts % 2 == 0)) & parsed
+    keep_values = numpy.repeat(valid, counts)
+    counts = counts[valid]
+    return RegionSet(numpy.array(owners, dtype=numpy.int64)[valid] if owners else numpy.empty(0, dtype=numpy.int64),
+                     is_circle[valid], numpy.concatenate(([0], numpy.cumsum(counts))), values[keep_values])
+
+def parse_s_regions(s_regions) -> RegionSet:
+    """Parses many s_region strings at once
+    An s_region may hold several shapes (e.g. 'POLYGON ICRS ... POLYGON ICRS ...'), so shapes are tagged with the
+    index of the s_region they came from
+
+    :param s_regions: Iterable of STC-S region strings, e.g. 'CIRCLE ICRS 10.0 20.0 0.1'. None entries are skipped
+    :returns: RegionSet of every CIRCLE and POLYGON found
+    """
+    owners, shapes, value_strings = [], [], []
+    for owner, s_region in enumerate(s_regions):
+        if not s_region:
+            continue
+        for match in S_REGION_PATTERN.finditer(s_region):
+            owners.append(owner)
+            shapes.append(match.group(1))
+            value_strings.append(match.group(2).split())
+    return _region_set(owners, shapes, value_strings)
+
+def parse_s_region(s_region: str) -> list:
+    """Parses an s_region string into its shapes
+
+    :param s_region: STC-S region string, e.g. 'CIRCLE ICRS 10.0 20.0 0.1'
+    :returns: list of (shape, parameters) tuples, shape being 'CIRCLE' (parameters ra, dec, radius) or 'POLYGON'
+        (parameters ra1, dec1, ra2, dec2, ...), all in degrees
+    """
+    region_set = parse_s_regions([s_region])
+    return [region_set.shape(index) for index in range(len(region_set))]
+
+def observation_colors(observations: list) -> list:
+    """Picks the DS9 color of every observation from its mission and project
+
+    :param observations: MAST observations, with 'obs_collection' and 'project' fields
+    :returns: list of DS9 color properties, e.g. 'red' or 'green dash=1'
+    """
+    return [HLSP_COLOR if (observation.get('project') or '')[:4] == 'hlsp'
+            else MISSION_COLORS.get(observation.get('obs_collection'), DEFAULT_COLOR)
+            for observation in observations]
+
+def write_ds9_regions(region_set: RegionSet, output_fname: str, colors: list = None, compress: bool = None,
+                      chunk_shapes: int = 50000) -> int:
+    """Writes regions to a DS9 region file in ICRS degrees, streaming chunk_shapes lines at a time
+
+    :param region_set: Regions to write
+    :param output_fname: Path of the region file to write
+    :param colors: DS9 color property of each region owner (see RegionSet.owners), e.g. from observation_colors
+    :param compress: If True, the file is gzip compressed. Defaults to True when output_fname ends in '.gz'
+    :param chunk_shapes: Number of regions formatted at once
+    :returns: number of regions written
+    """
+    if compress is None:
+        compress = str(output_fname).endswith('.gz')
+    # Default gzip level 9 is several times slower than level 6 for a few percent smaller files
+    region_file = gzip.open(output_fname, 'wt', compresslevel=6) if compress else open(output_fname, 'w')
+    with region_file:
+        region_file.write("# Region file format: DS9\nicrs\n")
+        for chunk_start in range(0, len(region_set), chunk_shapes):
+            chunk_end = min(chunk_start + chunk_shapes, len(region_set))
+            first_value, last_value = region_set.offsets[chunk_start], region_set.offsets[chunk_end]
+            # Format every number of the chunk in one go, then slice the strings back into shapes
+            formatted = ['%.7f' % value for value in region_set.values[first_value:last_value].tolist()]
+            offsets = (region_set.offsets[chunk_start:chunk_end + 1] - first_value).tolist()
+            shape_names = numpy.where(region_set.is_circle[chunk_start:chunk_end], 'circle(', 'polygon(').tolist()
+            if colors is None:
+                suffixes = [")\n"] * (chunk_end - chunk_start)
+            else:
+                suffixes = [") # color=" + colors[owner] + "\n" for owner in region_set.owners[chunk_start:chunk_end].tolist()]
+            region_file.write(''.join([shape_name + ','.join(formatted[start:end]) + suffix
+                                       for shape_name, start, end, suffix in zip(shape_names, offsets[:-1], offsets[1:], suffixes)]))
+    return len(region_set)
+
+def _ds9_degrees(value: str) -> str:
+    """Converts a DS9 angle with a unit suffix (e.g. '10"' or "2.5'") to degrees. Values it cannot convert, such as
+    sexagesimal coordinates, are returned as is, for _region_set to drop their shape
+    """
+    value = value.strip()
+    if value[-1:] in DS9_ANGLE_UNITS:
+        try:
+            return repr(float(value[:-1]) * DS9_ANGLE_UNITS[value[-1]])
+        except ValueError:
+            pass
+    return value
+
+def read_ds9_regions(region_fname: str) -> tuple:
+    """Reads the circles and polygons of a DS9 region file written in sky coordinates and decimal degrees (or angles
+    with a unit suffix), such as by write_ds9_regions. Gzip compressed files are detected by their '.gz' extension
+
+    :param region_fname: Path of the region file
+    :returns: tuple of (RegionSet, list of DS9 color properties). Every shape of the file is its own owner, numbered
+        in file order, and colors holds the color of every owner, as write_ds9_regions and show_regions index them.
+        Shapes that fail to parse (e.g. sexagesimal coordinates) or are not in ICRS or FK5 coordinates (e.g. image
+        pixels) are dropped from the RegionSet but keep their owner number, so colors stay aligned
+    :raises OSError: if the file cannot be read
+    :raises ValueError: if the file is not text
+    """
+    opener = gzip.open if str(region_fname).endswith('.gz') else open
+    with opener(region_fname, 'rt') as region_file:
+        text = region_file.read()
+    shapes, value_strings, colors = [], [], []
+    # DS9 reads coordinates as physical pixels until a coordinate system is given
+    sky_system, default_color = False, 'green'
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        # A coordinate system may also prefix a shape on the same line, e.g. 'fk5;circle(...)'
+        for segment in line.split(';'):
+            segment = segment.strip()
+            system = segment.lower()
+            if system in DS9_SKY_SYSTEMS or DS9_WCS_PATTERN.match(system):
+                sky_system = True
+                continue
+            if system in DS9_OTHER_SYSTEMS:
+                sky_system = False
+                continue
+            if system.startswith('global'):
+                color = DS9_COLOR_PATTERN.search(segment)
+                default_color = color.group(1) if color else default_color
+                continue
+            match = DS9_SHAPE_PATTERN.match(segment)
+            if match is None:
+                continue
+            shapes.append(match.group(1))
+            # Shapes in other coordinate systems get no parameters, which _region_set drops as malformed
+            value_strings.append([_ds9_degrees(value) for value in match.group(2).split(',')] if sky_system else [])
+            color = DS9_COLOR_PATTERN.search(match.group(3) or '')
+            colors.append(color.group(1) if color else default_color)
+    return _region_set(list(range(len(shapes))), shapes, value_strings), colors
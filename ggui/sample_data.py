@@ -0,0 +1,230 @@
+"""
+.. module:: sample_data
+    :synopsis: Local cache of gGui sample datasets: checksum verified archives, extracted incrementally
+.. moduleauthor:: Duy Nguyen <dnguyen@nrao.edu>
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+from typing import NamedTuple
+import urllib.request
+from zipfile import ZipFile
+
+from ggui.cache import cache_directory
+
+class SampleDataset(NamedTuple):
+    """A downloadable sample dataset"""
+    # Where the archive is downloaded from. Its file name is also the name the archive is cached under
+    url: str
+    # SHA-256 of the archive, in hex
+    sha256: str
+    # Path, within the archive, of the file to open, e.g. a gGui Target Catalog
+    entry: str
+
+# Every sample dataset gGui knows about
+SAMPLE_DATASETS = {
+    'tutorial': SampleDataset('https://github.com/gphoton-tools/ggui/raw/master/docs/ggui_tutorial_data2019-11-11.zip',
+                              'fc85c3841622dc5e18fbb3fcb11eeeba203acccacbc49f60d4a1bb5932bdfce0',
+                              'tutorial.yaml'),
+}
+
+# Name of the file, within an extracted dataset, that records which members were extracted from which archive
+MANIFEST_NAME = '.ggui_manifest.json'
+
+def file_sha256(filepath: str) -> str:
+    """Returns the SHA-256 of a file, in hex
+
+    :param filepath: Path of the file
+    :returns: hex digest
+    """
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as input_file:
+        for block in iter(lambda: input_file.read(2 ** 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+class SampleDataCache:
+    """Downloads, verifies and extracts sample datasets into the gGui cache directory
+    Archives are only trusted once their checksum matches, and a verified archive is not hashed again until it changes.
+    Extraction only writes the members that are missing or were modified since they were extracted
+    """
+
+    def __init__(self, cache_path: str = None, seed_directory: str = None):
+        """
+        :param cache_path: Directory of the cache. Defaults to sample_data in the gGui cache directory
+        :param seed_directory: Directory searched for dataset archives (by file name) before anything is downloaded.
+            Defaults to $GGUI_SAMPLE_DATA_DIR
+        """
+        self.cache_path = pathlib.Path(cache_path) if cache_path else cache_directory('sample_data')
+        self.seed_directory = seed_directory or os.environ.get('GGUI_SAMPLE_DATA_DIR')
+
+    @staticmethod
+    def dataset(dataset_name: str) -> SampleDataset:
+        """Looks up a sample dataset
+
+        :param dataset_name: Name of the dataset, e.g. 'tutorial'
+        :returns: the dataset
+        """
+        try:
+            return SAMPLE_DATASETS[dataset_name]
+        except KeyError:
+            raise KeyError("Unknown sample dataset '" + dataset_name + "'. Available: " + ", ".join(SAMPLE_DATASETS))
+
+    def archive_path(self, dataset_name: str) -> pathlib.Path:
+        """Returns where the archive of a dataset is cached
+
+        :param dataset_name: Name of the dataset
+        :returns: path of the cached archive, which may not exist yet
+        """
+        return self.cache_path / 'archives' / pathlib.PurePosixPath(self.dataset(dataset_name).url).name
+
+    def _verified_record_path(self, archive_path: pathlib.Path) -> pathlib.Path:
+        return archive_path.with_name(archive_path.name + '.verified')
+
+    def archive_verified(self, dataset_name: str) -> bool:
+        """Checks whether the cached archive of a dataset is complete and intact
+        The checksum is computed once; afterwards the archive is trusted for as long as its size and mtime are unchanged
+
+        :param dataset_name: Name of the dataset
+        :returns: True if the cached archive matches the dataset's checksum
+        """
+        archive_path = self.archive_path(dataset_name)
+        try:
+            stat = archive_path.stat()
+        except OSError:
+            return False
+        record_path = self._verified_record_path(archive_path)
+        fingerprint = [stat.st_size, stat.st_mtime_ns, self.dataset(dataset_name).sha256]
+        try:
+            if json.loads(record_path.read_text()) == fingerprint:
+                return True
+        except (OSError, ValueError):
+            pass
+        if file_sha256(str(archive_path)) != self.dataset(dataset_name).sha256:
+            return False
+        record_path.write_text(json.dumps(fingerprint))
+        return True
+
+    def seed(self, dataset_name: str, archive_path: str):
+        """Copies a local copy of a dataset's archive into the cache, so it is never downloaded
+
+        :param dataset_name: Name of the dataset
+        :param archive_path: Path of the local archive
+        :raises ValueError: if the archive does not match the dataset's checksum
+        """
+        expected = self.dataset(dataset_name).sha256
+        actual = file_sha256(archive_path)
+        if actual != expected:
+            raise ValueError("Checksum mismatch for " + str(archive_path) + ": expected " + expected + ", got " + actual)
+        self._install_archive(dataset_name, lambda part_path: shutil.copyfile(archive_path, str(part_path)))
+
+    def _install_archive(self, dataset_name: str, write_part):
+        """Writes an archive next to its cached path, verifies it, then moves it into place"""
+        archive_path = self.archive_path(dataset_name)
+        archive_path.parent.mkdir(parents=True, exist_ok=True)
+        part_path = archive_path.with_name(archive_path.name + '.part')
+        try:
+            write_part(part_path)
+            actual = file_sha256(str(part_path))
+            if actual != self.dataset(dataset_name).sha256:
+                raise ValueError("Checksum mismatch for the " + dataset_name + " sample data archive: expected "
+                                 + self.dataset(dataset_name).sha256 + ", got " + actual)
+            os.replace(str(part_path), str(archive_path))
+        finally:
+            if part_path.exists():
+                part_path.unlink()
+
+    def fetch(self, dataset_name: str, offline: bool = False) -> pathlib.Path:
+        """Makes sure the cached archive of a dataset is present and intact, seeding or downloading it if not
+
+        :param dataset_name: Name of the dataset
+        :param offline: If True, never download. Raise ConnectionError instead
+        :returns: path of the cached archive
+        """
+        archive_path = self.archive_path(dataset_name)
+        if self.archive_verified(dataset_name):
+            return archive_path
+        if self.seed_directory and (pathlib.Path(self.seed_directory) / archive_path.name).is_file():
+            self.seed(dataset_name, str(pathlib.Path(self.seed_directory) / archive_path.name))
+            return archive_path
+        if offline:
+            raise ConnectionError("The " + dataset_name + " sample data is not cached, and downloads are disabled. "
+                                  "Seed it from a local copy with: ggui-sample-data " + dataset_name + " --seed <archive>")
+        url = self.dataset(dataset_name).url
+        print("Downloading sample data to: " + str(archive_path) + " from: " + url)
+
+        def download(part_path):
+            with urllib.request.urlopen(url) as response, open(str(part_path), 'wb') as part_file:
+                shutil.copyfileobj(response, part_file, 2 ** 20)
+        self._install_archive(dataset_name, download)
+        return archive_path
+
+    def extract(self, dataset_name: str, offline: bool = False) -> pathlib.Path:
+        """Extracts a dataset into the cache, only writing members that are missing or modified since extraction
+
+        :param dataset_name: Name of the dataset
+        :param offline: If True, never download the archive
+        :returns: path of the dataset's entry file (e.g. its gGui Target Catalog)
+        """
+        dataset = self.dataset(dataset_name)
+        archive_path = self.fetch(dataset_name, offline)
+        data_path = self.cache_path / dataset_name
+        manifest_path = data_path / MANIFEST_NAME
+        try:
+            manifest = json.loads(manifest_path.read_text())
+        except (OSError, ValueError):
+            manifest = {}
+        # A different archive invalidates everything extracted from the previous one
+        extracted = manifest.get('members', {}) if manifest.get('sha256') == dataset.sha256 else {}
+
+        def up_to_date(member_name, member_size):
+            try:
+                stat = (data_path / member_name).stat()
+            except OSError:
+                return False
+            return stat.st_size == member_size and extracted.get(member_name) == [stat.st_size, stat.st_mtime_ns]
+
+        with ZipFile(str(archive_path)) as archive:
+            stale_members = [member for member in archive.infolist()
+                             if not member.is_dir() and not up_to_date(member.filename, member.file_size)]
+            for member in stale_members:
+                # Never write outside the dataset directory
+                member_path = pathlib.PurePosixPath(member.filename)
+                if member_path.is_absolute() or '..' in member_path.parts:
+                    raise ValueError("Refusing to extract " + member.filename + " from " + str(archive_path))
+                archive.extract(member, str(data_path))
+                stat = (data_path / member.filename).stat()
+                extracted[member.filename] = [stat.st_size, stat.st_mtime_ns]
+        if stale_members or not manifest_path.exists():
+            data_path.mkdir(parents=True, exist_ok=True)
+            manifest_path.write_text(json.dumps({'sha256': dataset.sha256, 'members': extracted}))
+        return data_path / dataset.entry
+
+def sample_data_path(dataset_name: str = 'tutorial', offline: bool = False) -> pathlib.Path:
+    """Returns the entry file of a sample dataset, downloading and extracting it as needed
+
+    :param dataset_name: Name of the dataset
+    :param offline: If True, never download the archive
+    :returns: path of the dataset's entry file
+    """
+    return SampleDataCache().extract(dataset_name, offline)
+
+def main(user_arguments: list = None):
+    """Command line entry point: fetches (or seeds) a sample dataset and prints the path of its entry file"""
+    parser = argparse.ArgumentParser(description="Download, verify and extract gGui sample data into the local cache")
+    parser.add_argument("dataset", nargs="?", default="tutorial", choices=sorted(SAMPLE_DATASETS),
+                        help="Sample dataset to prepare")
+    parser.add_argument("--seed", help="Local copy of the dataset's archive to install instead of downloading it")
+    parser.add_argument("--offline", action="store_true", help="Never download anything")
+    args = parser.parse_args(user_arguments)
+    cache = SampleDataCache()
+    if args.seed:
+        cache.seed(args.dataset, args.seed)
+    print(cache.extract(args.dataset, args.offline))
+
+if __name__ == "__main__":
+    main()
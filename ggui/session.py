@@ -0,0 +1,121 @@
+"""
+.. module:: session
+    :synopsis: Snapshots of the gGui workspace, and a cache of parsed gGui Target Catalogs to restore them from
+.. moduleauthor:: Duy Nguyen <dnguyen@nrao.edu>
+"""
+
+import hashlib
+import json
+import os
+import pathlib
+import time
+
+from ggui.cache import cache_directory
+from ggui.catalog import validate_target_catalog_file
+from ggui.sqlite_catalog import SQLiteTargetCatalog, is_sqlite_catalog
+
+# Bump whenever the snapshot layout changes. Older snapshots are then refused
+SESSION_VERSION = 1
+
+def last_session_path() -> pathlib.Path:
+    """Returns where gGui saves its workspace on exit, and resumes it from
+
+    :returns: path of the last session snapshot
+    """
+    return cache_directory('sessions') / 'last_session.json'
+
+def _fingerprint(filepath: str) -> list:
+    """Returns the size and modification time of a file, which change whenever it is rewritten"""
+    stat = os.stat(filepath)
+    return [stat.st_size, stat.st_mtime_ns]
+
+class ParsedCatalogCache:
+    """On-disk cache of validated YAML gGui Target Catalogs, stored as JSON, which parses an order of magnitude faster
+    An entry is used for as long as the catalog file's size and mtime are unchanged. SQLite catalogs open instantly
+    and are never cached
+    """
+
+    def __init__(self, cache_path: str = None):
+        """
+        :param cache_path: Directory of the cache, created if needed. Defaults to catalogs in the gGui cache directory
+        """
+        self.cache_path = pathlib.Path(cache_path) if cache_path else cache_directory('catalogs')
+        self.cache_path.mkdir(parents=True, exist_ok=True)
+
+    def _entry_path(self, filepath: str) -> pathlib.Path:
+        return self.cache_path / (hashlib.sha1(str(filepath).encode('utf-8')).hexdigest() + '.json')
+
+    def get(self, filepath: str) -> dict:
+        """Returns a cached parsed catalog
+
+        :param filepath: Path of the gGui Target Catalog
+        :returns: validated target dictionary of plain dicts, as validate_target_catalog_file returns, or None if not
+            cached or the catalog changed since
+        """
+        try:
+            with open(str(self._entry_path(filepath))) as entry_file:
+                entry = json.load(entry_file)
+            if entry['path'] == str(filepath) and entry['fingerprint'] == _fingerprint(filepath):
+                return entry['targets']
+        except (OSError, ValueError, KeyError):
+            pass
+        return None
+
+    def put(self, filepath: str, targets: dict):
+        """Caches a parsed catalog
+
+        :param filepath: Path of the gGui Target Catalog
+        :param targets: Validated target dictionary
+        """
+        entry_path = self._entry_path(filepath)
+        part_path = entry_path.with_name(entry_path.name + '.part')
+        with open(str(part_path), 'w') as entry_file:
+            json.dump({'path': str(filepath), 'fingerprint': _fingerprint(filepath), 'targets': targets}, entry_file)
+        os.replace(str(part_path), str(entry_path))
+
+    def load(self, filepath: str):
+        """Returns a gGui Target Catalog, parsing and validating it only if it is not cached
+
+        :param filepath: Path of the gGui Target Catalog
+        :returns: validated target dictionary, or SQLiteTargetCatalog
+        """
+        filepath = str(filepath)
+        if is_sqlite_catalog(filepath):
+            return SQLiteTargetCatalog(filepath)
+        targets = self.get(filepath)
+        if targets is None:
+            targets = validate_target_catalog_file(filepath)
+            self.put(filepath, targets)
+        return targets
+
+def write_session(session_path: str, target_catalogs: list, primary_target: dict = None, viewers: dict = None):
+    """Writes a gGui session snapshot
+
+    :param session_path: Path of the snapshot to write
+    :param target_catalogs: Paths of the loaded gGui Target Catalogs, in load order
+    :param primary_target: Primary target, as dict of 'target_catalog', 'target' and 'row' (its position in the target list)
+    :param viewers: Dict of data product type to overview viewer state, see gGuiOverviewBaseViewer.snapshot_state
+    """
+    snapshot = {'version': SESSION_VERSION,
+                'saved': time.time(),
+                'target_catalogs': [str(target_catalog) for target_catalog in target_catalogs],
+                'primary_target': primary_target,
+                'viewers': viewers or {}}
+    session_path = pathlib.Path(session_path)
+    part_path = session_path.with_name(session_path.name + '.part')
+    with open(str(part_path), 'w') as session_file:
+        json.dump(snapshot, session_file, indent=1)
+    os.replace(str(part_path), str(session_path))
+
+def read_session(session_path: str) -> dict:
+    """Reads a gGui session snapshot
+
+    :param session_path: Path of the snapshot
+    :returns: snapshot dict, see write_session
+    :raises ValueError: if the snapshot is not a gGui session, or was written by an incompatible version
+    """
+    with open(str(session_path)) as session_file:
+        snapshot = json.load(session_file)
+    if not isinstance(snapshot, dict) or snapshot.get('version') != SESSION_VERSION:
+        raise ValueError(str(session_path) + " is not a compatible gGui session snapshot")
+    return snapshot
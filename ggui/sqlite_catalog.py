@@ -0,0 +1,220 @@
+"""
+.. module:: sqlite_catalog
+    :synopsis: SQLite backed gGui Target Catalogs, queried lazily instead of parsed up front
+.. moduleauthor:: Duy Nguyen <dnguyen@nrao.edu>
+"""
+
+import argparse
+from collections import OrderedDict
+from collections.abc import Mapping
+import pathlib
+import sqlite3
+import yaml
+
+from ggui.catalog import catalog_writer, resolve_product_path
+
+# Every SQLite database file starts with this header
+SQLITE_HEADER = b'SQLite format 3\x00'
+
+# Bump whenever the catalog schema changes
+CATALOG_SCHEMA_VERSION = '1'
+
+CATALOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS catalog_info (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS targets (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE, notes TEXT);
+CREATE TABLE IF NOT EXISTS products (
+    target_id INTEGER NOT NULL REFERENCES targets(id),
+    product TEXT NOT NULL,
+    band TEXT NOT NULL,
+    path TEXT NOT NULL,
+    PRIMARY KEY (target_id, product, band)
+) WITHOUT ROWID;
+"""
+
+def is_sqlite_catalog(filepath: str) -> bool:
+    """Checks whether a gGui Target Catalog is a SQLite catalog, rather than YAML, by its file header
+
+    :param filepath: Path of the gGui Target Catalog
+    :returns: True if the file is a SQLite database
+    """
+    try:
+        with open(filepath, 'rb') as catalog_file:
+            return catalog_file.read(len(SQLITE_HEADER)) == SQLITE_HEADER
+    except OSError:
+        return False
+
+class SQLiteTargetCatalog(Mapping):
+    """Read-only mapping of target name to gGui target entry, backed by a SQLite catalog
+    Targets are only read from disk when asked for, by name or by position, so opening a catalog costs
+    the same no matter how many targets it holds. Notes are the only thing written back, one row at a time
+    """
+    # Number of consecutive target names fetched at once when looking targets up by position
+    name_page_size = 256
+    # Number of pages of target names kept in memory
+    cached_name_pages = 64
+
+    def __init__(self, filepath: str):
+        """Opens a SQLite catalog
+
+        :param filepath: Path of the SQLite catalog
+        """
+        self.filepath = str(filepath)
+        self._connection = sqlite3.connect(self.filepath)
+        version = self._connection.execute("SELECT value FROM catalog_info WHERE key = 'schema_version'").fetchone()
+        if not version or version[0] != CATALOG_SCHEMA_VERSION:
+            raise ValueError("Unsupported gGui SQLite catalog schema in " + self.filepath)
+        self._length, max_id = self._connection.execute("SELECT COUNT(*), MAX(id) FROM targets").fetchone()
+        # Catalogs written by gGui number targets 1..n, so a position maps straight onto an id.
+        # Otherwise (rows deleted by hand), fall back to slower positional queries
+        self._dense_ids = (max_id or 0) == self._length
+        self._name_pages = OrderedDict()
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self):
+        for (name,) in self._connection.execute("SELECT name FROM targets ORDER BY id"):
+            yield name
+
+    def __contains__(self, target_name) -> bool:
+        return self._connection.execute("SELECT 1 FROM targets WHERE name = ?", (target_name,)).fetchone() is not None
+
+    def __getitem__(self, target_name: str) -> dict:
+        """Returns the gGui target entry (data product type to band to path, plus any '_notes') of a target"""
+        row = self._connection.execute("SELECT id, notes FROM targets WHERE name = ?", (target_name,)).fetchone()
+        if row is None:
+            raise KeyError(target_name)
+        target_entry = {}
+        for product, band, path in self._connection.execute("SELECT product, band, path FROM products WHERE target_id = ?", (row[0],)):
+            target_entry.setdefault(product, {})[band] = path
+        if row[1] is not None:
+            target_entry['_notes'] = row[1]
+        return target_entry
+
+    def name_at(self, position: int) -> str:
+        """Returns the name of the target at a given position in catalog order
+
+        :param position: Zero based position of the target
+        :returns: target name
+        """
+        if not self._dense_ids:
+            return self._connection.execute("SELECT name FROM targets ORDER BY id LIMIT 1 OFFSET ?", (position,)).fetchone()[0]
+        page = position // self.name_page_size
+        if page not in self._name_pages:
+            first_id = page * self.name_page_size + 1
+            self._name_pages[page] = [name for (name,) in self._connection.execute(
+                "SELECT name FROM targets WHERE id BETWEEN ? AND ? ORDER BY id", (first_id, first_id + self.name_page_size - 1))]
+            if len(self._name_pages) > self.cached_name_pages:
+                self._name_pages.popitem(last=False)
+        else:
+            self._name_pages.move_to_end(page)
+        return self._name_pages[page][position % self.name_page_size]
+
+    def set_notes(self, target_name: str, notes: str):
+        """Saves the notes of a single target to disk
+
+        :param target_name: Name of the target
+        :param notes: New notes of the target
+        """
+        with self._connection:
+            self._connection.execute("UPDATE targets SET notes = ? WHERE name = ?", (notes, target_name))
+
+    def iter_product_paths(self):
+        """Yields the path of every data product in the catalog
+        Uses a connection of its own, so it may be consumed from any thread
+
+        :returns: generator of data product paths
+        """
+        connection = sqlite3.connect(self.filepath)
+        try:
+            for (path,) in connection.execute("SELECT path FROM products ORDER BY target_id"):
+                yield resolve_product_path(path, self.filepath)
+        finally:
+            connection.close()
+
+    def close(self):
+        """Closes the underlying database connection"""
+        self._connection.close()
+
+def write_sqlite_catalog(target_catalog: Mapping, sqlite_path: str, list_source: str = None) -> int:
+    """Writes gGui targets to a new SQLite catalog
+
+    :param target_catalog: Mapping of target name to gGui target entry
+    :param sqlite_path: Path of the SQLite catalog to create. Must not exist yet
+    :param list_source: Path of the catalog target_catalog came from. If given, relative product paths are resolved against it
+    :returns: number of targets written
+    """
+    if pathlib.Path(sqlite_path).exists():
+        raise FileExistsError("Refusing to overwrite existing file: " + str(sqlite_path))
+    connection = sqlite3.connect(str(sqlite_path))
+    try:
+        with connection:
+            connection.executescript(CATALOG_SCHEMA)
+            connection.execute("INSERT INTO catalog_info VALUES ('schema_version', ?)", (CATALOG_SCHEMA_VERSION,))
+            def product_rows():
+                for target_id, (target_name, target_data) in enumerate(target_catalog.items(), start=1):
+                    for data_type, band_data in target_data.items():
+                        if data_type == '_notes':
+                            continue
+                        for band, filepathString in band_data.items():
+                            if filepathString:
+                                if list_source:
+                                    filepathString = resolve_product_path(filepathString, list_source)
+                                yield target_id, data_type, band, filepathString
+            connection.executemany("INSERT INTO targets VALUES (?, ?, ?)",
+                                   ((target_id, target_name, target_data.get('_notes'))
+                                    for target_id, (target_name, target_data) in enumerate(target_catalog.items(), start=1)))
+            connection.executemany("INSERT INTO products VALUES (?, ?, ?, ?)", product_rows())
+        return connection.execute("SELECT COUNT(*) FROM targets").fetchone()[0]
+    finally:
+        connection.close()
+
+def yaml_to_sqlite(yaml_path: str, sqlite_path: str) -> int:
+    """Converts a YAML gGui Target Catalog to a SQLite catalog. Relative product paths are made absolute
+
+    :param yaml_path: Path of the YAML catalog
+    :param sqlite_path: Path of the SQLite catalog to create
+    :returns: number of targets written
+    """
+    with open(yaml_path, 'r') as yaml_file:
+        # Use libyaml's parser when PyYAML was built with it. Large catalogs parse an order of magnitude faster
+        target_catalog = yaml.load(yaml_file, Loader=getattr(yaml, 'CBaseLoader', yaml.BaseLoader)) or {}
+    return write_sqlite_catalog(target_catalog, sqlite_path, str(pathlib.Path(yaml_path).resolve()))
+
+def sqlite_to_yaml(sqlite_path: str, yaml_path: str) -> int:
+    """Converts a SQLite catalog to a YAML gGui Target Catalog, one target at a time
+
+    :param sqlite_path: Path of the SQLite catalog
+    :param yaml_path: Path of the YAML catalog to write
+    :returns: number of targets written
+    """
+    target_catalog = SQLiteTargetCatalog(sqlite_path)
+    try:
+        with catalog_writer(yaml_path) as writer:
+            for target_name in target_catalog:
+                writer.write(target_name, target_catalog[target_name])
+        return len(target_catalog)
+    finally:
+        target_catalog.close()
+
+def main(user_arguments: list = None):
+    """Entry point to convert gGui Target Catalogs between YAML and SQLite
+
+    :param user_arguments: list of arguments, should simulate command line args. Use ['-h'] or ['--help'] for help documentation
+    """
+    parser = argparse.ArgumentParser(
+        description="Converts a gGui Target Catalog from YAML to SQLite, or from SQLite to YAML. "
+                    "The direction is detected from the input file"
+    )
+    parser.add_argument("input_catalog", help="Path of the catalog to convert")
+    parser.add_argument("output_catalog", help="Path of the converted catalog to write")
+    args = parser.parse_args(user_arguments)
+
+    if is_sqlite_catalog(args.input_catalog):
+        target_count = sqlite_to_yaml(args.input_catalog, args.output_catalog)
+    else:
+        target_count = yaml_to_sqlite(args.input_catalog, args.output_catalog)
+    print(str(target_count) + " targets written to " + args.output_catalog)
+
+if __name__ == "__main__":
+    main()
@@ -5,8 +5,9 @@
 """
 
 from collections import OrderedDict
-from configparser import ConfigParser
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 import itertools
+import os
 from typing import Callable
 from copy import copy
 import pathlib
@@ -15,9 +16,25 @@ import yaml
 from PyQt5 import QtWidgets, QtGui, QtCore
 from glue.app.qt.application import GlueApplication
 from glue.core.link_helpers import LinkSame
-from glue.core.data_factories import load_data
 
-from pkg_resources import resource_filename
+from ggui.autochop import lightcurveChopSubsets, lightcurveChopSubsetsMultiband, lightcurveWindowTableSubsets, windowTablePath
+from ggui.catalog import resolve_product_path
+from ggui.config import GguiConfig, ggui_config, icon_path
+from ggui.lightcurve_cache import LightcurveCache
+from ggui.loader_pool import SHARED_MEMORY_SUPPORTED, LoaderPool, ProductLoadError, convert_lightcurve, fits_from_shared, read_fits_product
+from ggui.memory import MemoryUsage, data_memory, estimate_product_memory, format_bytes, memory_budget
+from ggui.product_index import ProductMetadataIndex, describe_product
+from ggui.sqlite_catalog import SQLiteTargetCatalog
+from ggui.timing import switch_timer
+
+
+def _plain_data(value):
+    """Converts nested mappings (e.g. OrderedDicts) to plain dicts, so they dump as plain YAML without python tags"""
+    if isinstance(value, dict):
+        return {str(key): _plain_data(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain_data(item) for item in value]
+    return value
 
 
 class TargetManager(QtWidgets.QToolBar):
@@ -36,38 +53,75 @@ class TargetManager(QtWidgets.QToolBar):
         self._glue_parent = glue_parent
         self._target_catalog = OrderedDict()
         self._primary_data = {}
+        self._primary_files = {}
+        self._primary_chops = []
         self._target_change_callbacks = []
         self._target_notes = None
         self._note_display_widget = target_note_display(self)
+        # Header metadata of every catalog product, so basic facts never require loading a product
+        self._product_index = ProductMetadataIndex()
+        # Binary copies of lightcurve CSVs, so they are only parsed as text once
+        self._lightcurve_cache = LightcurveCache()
+        # Products are parsed in separate processes, so neither heavy nor malformed files can stall or crash the GUI
+        self._loader_pool = LoaderPool() if SHARED_MEMORY_SUPPORTED else None
 
         # Initialize GUI Elements
-        config = ConfigParser()
-        config.read(resource_filename('ggui', 'ggui.conf'))   
+        config = ggui_config()
         self.addWidget(QtWidgets.QLabel("gGui Target Manager: "))
         # Add Back Button
-        self.addAction(QtGui.QIcon(resource_filename('ggui.icons', 'ArrowBack_transparent.png')), "Previous Target", self.previous_target)
-        QtWidgets.QShortcut(QtGui.QKeySequence(config.get('Target Manager Shortcuts', 'previous_target', fallback='PgUp')), self).activated.connect(self.previous_target)
+        self.addAction(QtGui.QIcon(icon_path('ArrowBack_transparent.png')), "Previous Target", self.previous_target)
+        # Target Manager action name to its keyboard shortcut, rebound whenever ggui.conf changes
+        self._shortcuts = {}
+        self._shortcuts['previous_target'] = QtWidgets.QShortcut(QtGui.QKeySequence(config.shortcut('previous_target')), self)
+        self._shortcuts['previous_target'].activated.connect(self.previous_target)
         # Add Combo Box
+        # Targets are listed through a lazy model, so catalogs of any size are added instantly.
+        # Uniform item sizes and a fixed width keep Qt from measuring every target name
         self.QComboBox = QtWidgets.QComboBox(self)
+        self._target_list_model = target_list_model(self.QComboBox)
+        self.QComboBox.setModel(self._target_list_model)
+        self.QComboBox.view().setUniformItemSizes(True)
+        self.QComboBox.setSizeAdjustPolicy(QtWidgets.QComboBox.AdjustToMinimumContentsLengthWithIcon)
+        self.QComboBox.setMinimumContentsLength(30)
+        # Styles that pop the list up over the combo box measure every item first. Use a plain drop down list instead
+        self.QComboBox.setStyleSheet("combobox-popup: 0;")
         self.QComboBox.currentIndexChanged.connect(self.setPrimaryTarget)
         self.addWidget(self.QComboBox)
         # Add Forward Button
-        self.addAction(QtGui.QIcon(resource_filename('ggui.icons', 'ArrowForward_transparent.png')), "Next Target", self.next_target)
-        QtWidgets.QShortcut(QtGui.QKeySequence(config.get('Target Manager Shortcuts', 'next_target', fallback='PgDown')), self).activated.connect(self.next_target)
+        self.addAction(QtGui.QIcon(icon_path('ArrowForward_transparent.png')), "Next Target", self.next_target)
+        self._shortcuts['next_target'] = QtWidgets.QShortcut(QtGui.QKeySequence(config.shortcut('next_target')), self)
+        self._shortcuts['next_target'].activated.connect(self.next_target)
+        self._shortcuts_version = (config.filepath, config.mtime_ns)
         # Add Info button
-        self.addAction(QtGui.QIcon(resource_filename('ggui.icons', 'Information.svg')), "Target Information", self.show_targ_info)
+        self.addAction(QtGui.QIcon(icon_path('Information.svg')), "Target Information", self.show_targ_info)
         # Add Notes Button
-        self.addAction(QtGui.QIcon(resource_filename('ggui.icons', 'Notepad.png')), "Target Notes", self._note_display_widget.show)
+        self.addAction(QtGui.QIcon(icon_path('Notepad.png')), "Target Notes", self._note_display_widget.show)
 
         # If the initializer wants to know about target changes, register its provided callback
         if target_change_callback:
             self.register_target_change_callback(target_change_callback)
 
+    def updateShortcuts(self, config: GguiConfig):
+        """Rebinds the keyboard shortcuts to those of the given configuration, if it changed since they were bound
+
+        :param config: gGui configuration, as returned by ggui_config
+        """
+        if (config.filepath, config.mtime_ns) == self._shortcuts_version:
+            return
+        for action, shortcut in self._shortcuts.items():
+            shortcut.setKey(QtGui.QKeySequence(config.shortcut(action)))
+        self._shortcuts_version = (config.filepath, config.mtime_ns)
+
     def close(self):
         """Handles graceful exit housekeeping"""
 
         # Close note display widget if open
         self._note_display_widget.close()
+        # Stop indexing catalog products
+        self._product_index.close()
+        # Stop the loader processes
+        if self._loader_pool:
+            self._loader_pool.close()
 
     def register_target_change_callback(self, callback):
         """Registers a callback function to call when primary target changes
@@ -78,8 +132,9 @@ class TargetManager(QtWidgets.QToolBar):
 
     def loadTargetDict(self, target_catalog: str, target_files: dict):
         """Loads a single dictionary of targets and associated data product paths into internal cache
+        SQLite catalogs are kept as is, and only queried for the targets gGui actually visits
 
-        :param target_files: gGui compliant yaml dictionary of targets and paths to associated gPhoton data products
+        :param target_files: gGui compliant yaml dictionary of targets and paths to associated gPhoton data products, or SQLiteTargetCatalog
         :param target_catalog: Name/identifier of this dictionary of targets. Can be used to return data
         """
         # Verify the catalog exists
@@ -88,24 +143,78 @@ class TargetManager(QtWidgets.QToolBar):
         if target_catalog in self._target_catalog:
             raise ValueError("Duplicate gGui catalog. Catalog already imported into gGui: " + target_catalog)
         # Add catalog targets to internal cache
-        self._target_catalog[target_catalog] = OrderedDict(target_files)
+        if isinstance(target_files, SQLiteTargetCatalog):
+            self._target_catalog[target_catalog] = target_files
+        else:
+            self._target_catalog[target_catalog] = OrderedDict(target_files)
         # Add new items to GUI
-        for item in target_files.keys():
-            self.QComboBox.addItem(item, {'target_catalog': target_catalog})
+        self._target_list_model.add_catalog(target_catalog, self._target_catalog[target_catalog])
+        # Read the headers of every product of this catalog in the background
+        self._product_index.index_catalog(target_catalog, self._target_catalog[target_catalog])
+
+    def restoreTargets(self, target_catalogs: dict, primary_target: dict = None):
+        """Loads gGui Target Catalogs and makes a given target primary, loading that target's data only
+        Used to restore session snapshots: the first target of the first catalog is not loaded along the way.
+        The primary target is loaded from cached data: lightcurves from the lightcurve cache, product facts from the
+        product index, and FITS files memory mapped rather than read in the loader processes
+
+        :param target_catalogs: Dict of gGui Target Catalog path to validated target dictionary or SQLiteTargetCatalog.
+            Catalogs already loaded are skipped
+        :param primary_target: Target to make primary, as dict of 'target_catalog', 'target' and 'row' (its position in
+            the target list when saved). Defaults to the first target
+        """
+        self.QComboBox.blockSignals(True)
+        try:
+            for target_catalog, target_files in target_catalogs.items():
+                if str(pathlib.Path(target_catalog).resolve()) not in self._target_catalog:
+                    self.loadTargetDict(target_catalog, target_files)
+            self.QComboBox.setCurrentIndex(max(self.findTargetRow(primary_target), 0) if primary_target else 0)
+        finally:
+            self.QComboBox.blockSignals(False)
+        if self.QComboBox.count():
+            self.setPrimaryTarget(self.QComboBox.currentIndex(), memory_map=True)
+
+    def findTargetRow(self, target: dict) -> int:
+        """Finds the position of a target in the target list
+
+        :param target: dict of 'target_catalog' and 'target', and optionally 'row', the position to try first
+        :returns: position of the target, or -1 if not found
+        """
+        row = target.get('row', -1)
+        if not (0 <= row < self.QComboBox.count() and self.QComboBox.itemText(row) == target['target']
+                and self.QComboBox.itemData(row)['target_catalog'] == target['target_catalog']):
+            # The catalogs changed since the position was saved. Search by name
+            row = self.QComboBox.findText(target['target'], QtCore.Qt.MatchExactly)
+        return row
+
+    def getTargetCatalogPaths(self) -> list:
+        """Returns the paths of all loaded gGui Target Catalogs, in load order
+
+        :returns: list of gGui Target Catalog paths
+        """
+        return list(self._target_catalog)
 
-    def setPrimaryTarget(self, targIndex: int):
+    def setPrimaryTarget(self, targIndex: int, memory_map: bool = False):
         """Changes primary target to target specified
         Unloads existing primary target's data (internal cache and parent Glue session),
         loads the new primary target's data, links their corresponding attributes together,
         and notifies all stakeholders of the new changed primary target
 
         :param targIndex: Index of desired new primary target
+        :param memory_map: Whether to memory map the target's FITS files rather than read them in the loader processes,
+            as when restoring a session. FITS files are memory mapped anyway if the target does not fit the memory budget
         """
         targName = self.QComboBox.currentText()
         targ_catalog = self.QComboBox.currentData()['target_catalog']
         # If requested target is not in current cache, throw exception
-        if targName not in self.getTargetNames():
+        if targName not in self._target_catalog.get(targ_catalog, {}):
             raise KeyError("Target Manager does not recognize requested target: " + str(targName))
+        # Time every phase of the switch, if switch timing is on
+        timer = switch_timer()
+        timer.begin_switch(targName)
+
+        # Release any autochop windows of the outgoing target before its data goes away
+        self.releasePrimaryChops()
 
         # If we have data loaded, remove it from the Glue Data
         if self._primary_data:
@@ -117,44 +226,79 @@ class TargetManager(QtWidgets.QToolBar):
                                 self._glue_parent.data_collection.remove(data)   
                         else:
                             self._glue_parent.data_collection.remove(band_data)                
-            unload_primary_data()
+            with timer.span('unload'):
+                unload_primary_data()
 
         # Save target notes
         self._note_display_widget.save_notes()
 
         # Clear internal target cache
         self._primary_data.clear()
+        self._primary_files = {}
         self._target_notes = None
 
         target_files = copy(self.getTargetFiles(targ_catalog, targName))
         self._target_notes = target_files.pop('_notes', None)
 
-        # For each gGui Data Type...
+        # Find every product of the target first, so that its memory can be budgeted, and all of its products are
+        # parsed at once by the loader processes
+        target_products = {}
         for data_product_type in target_files:
+            target_products[data_product_type] = OrderedDict()
+            for band, band_file in target_files[data_product_type].items():
+                if band_file:
+                    # If a relative path to the data product is given, join it with respect to the parent Target Catalog path
+                    band_file = resolve_product_path(band_file, targ_catalog)
+                    # Lazily queried catalogs are not verified up front, so verify the file here.
+                    # The product index already knows whether its header is readable
+                    metadata = self._product_index.get(band_file)
+                    if metadata is None:
+                        print("WARNING: Cannot find " + band_file + " on disk. Ignoring...")
+                        continue
+                    if metadata['kind'] == 'unreadable':
+                        print("WARNING: Cannot read " + band_file + " (" + metadata['error'] + "). Ignoring...")
+                        continue
+                    target_products[data_product_type][band] = (band_file, metadata)
+
+        # Drop caches to make room for the target's data. If it still does not fit, memory map its FITS files
+        # rather than read them into memory. Without loader processes, FITS files are memory mapped anyway
+        budget = memory_budget()
+        needed = sum(estimate_product_memory(data_product_type, metadata, memory_mapped=memory_map or self._loader_pool is None)
+                     for data_product_type, products in target_products.items() for _, metadata in products.values())
+        if not budget.make_room(needed):
+            memory_map = True
+            print("WARNING: " + targName + " needs " + format_bytes(needed) + " of memory, over the budget of " +
+                  format_bytes(budget.limit) + " set in ggui.conf. Memory mapping its FITS files rather than loading them")
+        for data_product_type, products in target_products.items():
+            for band, (band_file, metadata) in products.items():
+                products[band] = (band_file, metadata, self.startLoadingProduct(band_file, data_product_type, metadata, memory_map))
+
+        config = ggui_config()
+        self.updateShortcuts(config)
+        # For each gGui Data Type...
+        for data_product_type in target_products:
             # Initialize dictionary for this data product
             self._primary_data[data_product_type] = {}
+            self._primary_files[data_product_type] = {}
 
             # Retrieve the x and y attributes for this data product from the conf file
-            config = ConfigParser()
-            config.read(resource_filename('ggui', 'ggui.conf'))                
-            x_att = config.get('Mandatory Fields', data_product_type + "_x", fallback='')
-            y_att = config.get('Mandatory Fields', data_product_type + "_y", fallback='')
+            product_fields = config.fields(data_product_type)
+            x_att = product_fields.x
+            y_att = product_fields.y
 
             # Load every band's data into internal cache
-            for band, band_file in target_files[data_product_type].items():
-                if band_file:
-                    # If a relative path to the data product is given, join it with respect to the parent Target Catalog path
-                    if not pathlib.PurePath(band_file).is_absolute():
-                        # If there are path delimiters, detect which OS it came from to interpret the path directly
-                        if "\\" in band_file:
-                            band_file = str(pathlib.PurePath(targ_catalog).parent.joinpath(pathlib.PureWindowsPath(band_file)))
-                        elif "/" in band_file:
-                            band_file = str(pathlib.PurePath(targ_catalog).parent.joinpath(pathlib.PurePosixPath(band_file)))
-                        else:
-                            band_file = str(pathlib.PurePath(targ_catalog).parent.joinpath(pathlib.PurePath(band_file)))
-                    self._primary_data[data_product_type][band] = load_data(band_file)
-
-                    # If x_att, y_att provided in conf, test they exist
+            for band, (band_file, metadata, pending_load) in target_products[data_product_type].items():
+                try:
+                    with timer.span('load_data', product=data_product_type, band=band):
+                        band_data = self.loadProduct(band_file, data_product_type, metadata, pending_load)
+                except ProductLoadError as e:
+                    print("WARNING: " + str(e).splitlines()[0] + ". Ignoring...")
+                    continue
+                self._primary_files[data_product_type][band] = band_file
+                self._primary_data[data_product_type][band] = band_data
+
+                # If x_att, y_att provided in conf, test they exist
+                with timer.span('validate_attributes', product=data_product_type, band=band):
                     try:
                         if x_att:
                             self._primary_data[data_product_type][band].id[x_att]
@@ -175,28 +319,149 @@ class TargetManager(QtWidgets.QToolBar):
                             print("WARNING: " + str(len(self._primary_data[data_product_type][band])) + " datasets imported from " + targName + " " + data_product_type + " band " + band + ". gGui shall import this data, but will be unable to perform automatic actions on it (i.e. gluing, displaying overview, etc.)")
                         else:
                             raise
-                        
-                    # Register this data product with Glue's Data Collection
+
+                # Register this data product with Glue's Data Collection
+                with timer.span('data_collection_append', product=data_product_type, band=band):
                     self._glue_parent.data_collection.append(self._primary_data[data_product_type][band])
             # If we have multiple bands, glue them together
             try: 
-                if len(self._primary_data[data_product_type].keys()) > 1:
-                    attributes_to_glue = {'lightcurve': ['t_mean', 'flux_bgsub'], 
-                                        'coadd': ['Right Ascension', 'Declination'], 
-                                        'cube': ['Right Ascension', 'Declination', 'World 0']}
-                    #for glue_attribute in attributes_to_glue[data_product_type]:
-                    for glue_attribute in list(filter(lambda x: x is not '', [x_att, y_att] + config.get('Additional Fields To Glue', data_product_type, fallback='').split(','))):
-                        #Can only link two fields at a time. Need to go through all combinations
-                        from itertools import permutations
-                        for linking_pair in (set(frozenset(t) for t in permutations(self._primary_data[data_product_type].values(),2))):
-                            accessor = tuple(linking_pair)
-                            self._glue_parent.data_collection.add_link(LinkSame(accessor[0].id[glue_attribute],accessor[1].id[glue_attribute]))
-            except TypeError as e:
+                with timer.span('link_same', product=data_product_type):
+                    if len(self._primary_data[data_product_type].keys()) > 1:
+                        band_data_sets = list(self._primary_data[data_product_type].values())
+                        band_fields = [{component.label for component in band_data.components} for band_data in band_data_sets]
+                        for glue_attribute in product_fields.glue:
+                            # Skip fields some band lacks, rather than fail the whole target
+                            if not all(glue_attribute in fields for fields in band_fields):
+                                print("WARNING: '" + glue_attribute + "' field specified in ggui.conf missing from " + targName + " " + data_product_type + ". Not gluing it")
+                                continue
+                            #Can only link two fields at a time. Need to go through all combinations
+                            for first_data, second_data in itertools.combinations(band_data_sets, 2):
+                                self._glue_parent.data_collection.add_link(LinkSame(first_data.id[glue_attribute], second_data.id[glue_attribute]))
+            except (TypeError, AttributeError) as e:
                 print("Unable to glue " + str(targName) + " " + str(data_product_type) + ": " + str(e))
 
         # Notify all stakeholders of target change
         for callback in self._target_change_callbacks:
             callback(self.getPrimaryName())
+        timer.end_switch()
+
+    def startLoadingProduct(self, band_file: str, data_product_type: str, metadata: dict, memory_map: bool = False) -> Future:
+        """Starts parsing a data product in the loader processes, if it needs parsing
+
+        :param band_file: Path of the data product
+        :param data_product_type: gGui data product type, e.g. 'lightcurve'
+        :param metadata: Product metadata from the product index
+        :param memory_map: Whether to memory map FITS files that allow it, in this process, rather than have them read
+        :returns: future to pass to loadProduct, or None if the product is loaded in this process
+        """
+        if self._loader_pool is None:
+            return None
+        if data_product_type == 'lightcurve' and metadata['kind'] == 'csv':
+            # Cached lightcurves are memory mapped, which is instant. Others are converted into the cache
+            columns = list(ggui_config().required_fields('lightcurve'))
+            if self._lightcurve_cache.is_cached(band_file, columns):
+                return None
+            return self._loader_pool.submit(convert_lightcurve, str(self._lightcurve_cache.cache_path), band_file, columns,
+                                            description=band_file)
+        if metadata['kind'] == 'fits':
+            if memory_map and metadata.get('memmap'):
+                return None
+            return self._loader_pool.submit(read_fits_product, band_file)
+        return None
+
+    @staticmethod
+    def waitForLoad(pending_load: Future):
+        """Waits for a loader process to parse a product, keeping the GUI painted meanwhile
+        User input is held back until the product is loaded, so the primary target cannot change halfway
+
+        :param pending_load: Future returned by startLoadingProduct
+        :returns: result of the loader process
+        """
+        while True:
+            try:
+                return pending_load.result(timeout=0.05)
+            except FutureTimeoutError:
+                QtWidgets.QApplication.processEvents(QtCore.QEventLoop.ExcludeUserInputEvents)
+
+    def loadProduct(self, band_file: str, data_product_type: str, metadata: dict, pending_load: Future = None):
+        """Loads a data product into a Glue Data object
+        Lightcurve CSVs are loaded from the lightcurve cache, FITS files from what the loader processes read, and
+        anything else through Glue's data factories, which memory map FITS files.
+        Only the lightcurve fields gGui uses are read up front; the others are read once something uses them
+
+        :param band_file: Path of the data product
+        :param data_product_type: gGui data product type, e.g. 'lightcurve'
+        :param metadata: Product metadata from the product index
+        :param pending_load: Future returned by startLoadingProduct, if the product is being parsed in the loader processes
+        :returns: Glue Data, or list of Glue Data if the file holds several datasets
+        :raises ProductLoadError: if the loader process failed, crashed or hung on the product
+        """
+        if data_product_type == 'lightcurve' and metadata['kind'] == 'csv':
+            try:
+                if pending_load is not None:
+                    conversion_error = self.waitForLoad(pending_load)
+                    if conversion_error:
+                        raise ValueError(conversion_error)
+                return self._lightcurve_cache.load_data(band_file, columns=list(ggui_config().required_fields('lightcurve')))
+            except (OSError, ValueError) as e:
+                print("WARNING: Unable to cache " + band_file + " (" + str(e) + "). Loading it directly")
+        elif pending_load is not None:
+            from glue.core.data_factories.fits import fits_reader
+            # Label the data as Glue's FITS reader does when given the file itself
+            label = os.path.basename(band_file).rpartition('.')[0] or os.path.basename(band_file)
+            datasets = fits_reader(fits_from_shared(self.waitForLoad(pending_load)), label=label)
+            return datasets[0] if len(datasets) == 1 else datasets
+        # Glue's data factories pull in astropy and every reader plugin. Import them only once data is loaded
+        from glue.core.data_factories import load_data
+        return load_data(band_file)
+
+    def autochopPrimaryLightcurves(self, time_interval: float, band_mode: str = None) -> list:
+        """Segments the primary target's lightcurves into observation windows
+        Every window is a Glue subset group over the already loaded lightcurve data, so no data is copied.
+        Any previous autochop windows are released first
+
+        :param time_interval: Minimum gap between two observation windows, in units of the lightcurve time axis
+        :param band_mode: None to chop every band on its own. 'union' or 'intersection' to chop all bands
+            with one shared set of windows, combined across bands
+        :returns: list of subset groups representing the observation windows
+        """
+        self.releasePrimaryChops()
+        time_att = ggui_config().fields('lightcurve').x or 't_mean'
+        # Multiple datasets per band break the 1-1 correspondence gGui assumes. Skip them
+        band_lightcurves = {band: band_data for band, band_data in self._primary_data.get('lightcurve', {}).items() if not isinstance(band_data, list)}
+        if band_mode:
+            # Bands are linked along the time axis upon load, so one set of subset groups applies to every band
+            self._primary_chops.extend(lightcurveChopSubsetsMultiband(self._glue_parent.data_collection, list(band_lightcurves.values()), time_att, time_interval, band_mode, "AutoChop " + "+".join(band_lightcurves)))
+        else:
+            for band, band_data in band_lightcurves.items():
+                self._primary_chops.extend(lightcurveChopSubsets(self._glue_parent.data_collection, band_data, time_att, time_interval, "AutoChop " + band))
+        return self._primary_chops
+
+    def loadPrimaryWindowTables(self, window_dir: str) -> list:
+        """Turns the window tables ggui-autochop precomputed for the primary target's lightcurves into autochop windows
+        Any previous autochop windows are released first. Bands without a window table are skipped
+
+        :param window_dir: Directory ggui-autochop wrote its window tables to (its --output_dir)
+        :returns: list of subset groups representing the observation windows
+        :raises OSError: if a window table cannot be read
+        :raises ValueError: if a window table is malformed
+        """
+        self.releasePrimaryChops()
+        time_att = ggui_config().fields('lightcurve').x or 't_mean'
+        for band, band_data in self._primary_data.get('lightcurve', {}).items():
+            # Multiple datasets per band break the 1-1 correspondence gGui assumes. Skip them
+            if isinstance(band_data, list):
+                continue
+            table_path = windowTablePath(window_dir, self.getPrimaryTargetCatalog(), self.getPrimaryName(), band)
+            if table_path.is_file():
+                self._primary_chops.extend(lightcurveWindowTableSubsets(self._glue_parent.data_collection, band_data, time_att, str(table_path), "AutoChop " + band))
+        return self._primary_chops
+
+    def releasePrimaryChops(self):
+        """Removes all autochop windows of the primary target from the Glue session"""
+        for subset_group in self._primary_chops:
+            self._glue_parent.data_collection.remove_subset_group(subset_group)
+        self._primary_chops = []
 
     def setPrimaryNotes(self, new_notes: str):
         """"
@@ -205,7 +470,12 @@ class TargetManager(QtWidgets.QToolBar):
         :param new_notes: New notes for the primary target
         """
         self._target_notes = new_notes
-        self.getTargetFiles(self.getPrimaryTargetCatalog(), self.getPrimaryName())['_notes'] = new_notes
+        target_catalog = self._target_catalog[self.getPrimaryTargetCatalog()]
+        # SQLite catalogs write a single target's notes straight to disk
+        if isinstance(target_catalog, SQLiteTargetCatalog):
+            target_catalog.set_notes(self.getPrimaryName(), new_notes)
+        else:
+            self.getTargetFiles(self.getPrimaryTargetCatalog(), self.getPrimaryName())['_notes'] = new_notes
 
     def getTargetNames(self) -> list:
         """Returns the names of all registered targets, in their registered order
@@ -264,6 +534,38 @@ class TargetManager(QtWidgets.QToolBar):
         except TypeError:
             return ""
 
+    def getPrimaryProductMetadata(self) -> dict:
+        """Returns the header metadata of the primary target's loaded data products, without touching their data
+        See ggui.product_index.read_product_metadata for the contents of each entry
+
+        :returns: dictionary of data product type to band to metadata dict
+        """
+        return {data_product_type: {band: self._product_index.get(band_file) for band, band_file in band_files.items()}
+                for data_product_type, band_files in self._primary_files.items()}
+
+    def getPrimaryProductFiles(self, data_product_type: str) -> dict:
+        """Returns the files of the primary target's loaded data products of a type
+
+        :param data_product_type: gGui data product type, e.g. 'coadd'
+        :returns: dictionary of band to resolved file path
+        """
+        return dict(self._primary_files.get(data_product_type, {}))
+
+    def getPrimaryMemoryUsage(self) -> dict:
+        """Returns the memory taken by the primary target's loaded data products
+
+        :returns: dictionary of data product type to band to MemoryUsage
+        """
+        return {data_product_type: {band: data_memory(band_data) for band, band_data in band_data_set.items()}
+                for data_product_type, band_data_set in self._primary_data.items()}
+
+    def getProductIndex(self) -> ProductMetadataIndex:
+        """Returns the metadata index of every catalog product, for cheap queries of shapes, WCS, bands and exposures
+
+        :returns: the Target Manager's product metadata index
+        """
+        return self._product_index
+
     def getPrimaryNotes(self) -> str:
         """Returns any notes associated with the current target. Returns empty string if no notes found.
 
@@ -280,7 +582,7 @@ class TargetManager(QtWidgets.QToolBar):
         if next_target_index > self.QComboBox.count() - 1:
             next_target_index = 0
         # Command Target Manager to switch primary targets
-        self.QComboBox.setCurrentText(self.QComboBox.itemText(next_target_index)) # QComboBox signal will initiate primary target switching
+        self.QComboBox.setCurrentIndex(next_target_index) # QComboBox signal will initiate primary target switching
 
     def previous_target(self):
         """Advances to previous primary target"""
@@ -291,17 +593,34 @@ class TargetManager(QtWidgets.QToolBar):
         if next_target_index < 0:
             next_target_index = self.QComboBox.count() - 1
         # Command Target Manager to switch primary targets
-        self.QComboBox.setCurrentText(self.QComboBox.itemText(next_target_index)) # QComboBox signal will initiate primary target switching
+        self.QComboBox.setCurrentIndex(next_target_index) # QComboBox signal will initiate primary target switching
 
     def show_targ_info(self):
-        """Displays name and target catalog for the primary target"""
+        """Displays name and target catalog for the primary target, along with the memory its data and gGui's caches take"""
+        memory_usage = self.getPrimaryMemoryUsage()
+        total_usage = sum((usage for band_usage in memory_usage.values() for usage in band_usage.values()), MemoryUsage())
+        budget = memory_budget()
+        cache_usage = budget.cache_usage()
         QtWidgets.QMessageBox(
             QtWidgets.QMessageBox.Information, 
             "About Target", 
             "Target name: " + str(self.getPrimaryName()) + 
-            "\ngGui Target Catalog: " + str(self.getPrimaryTargetCatalog()), 
+            "\ngGui Target Catalog: " + str(self.getPrimaryTargetCatalog()) +
+            "".join("\n" + data_product_type + " " + band + ": " + describe_product(metadata) + self._describe_memory(memory_usage[data_product_type][band])
+                    for data_product_type, band_metadata in self.getPrimaryProductMetadata().items()
+                    for band, metadata in band_metadata.items()) +
+            "\nMemory: " + format_bytes(total_usage.resident + sum(cache_usage.values())) + " of " +
+            (format_bytes(budget.limit) if budget.limit else "unlimited") + " budget, and " + format_bytes(total_usage.mapped) + " memory mapped" +
+            "\nAutochop windows: " + str(len(self._primary_chops)) +
+            "".join("\n" + name + ": " + format_bytes(nbytes) for name, nbytes in cache_usage.items()),
             QtWidgets.QMessageBox.Ok
         ).exec()
+
+    @staticmethod
+    def _describe_memory(usage: MemoryUsage) -> str:
+        if usage.mapped:
+            return ", " + format_bytes(usage.resident) + " in memory + " + format_bytes(usage.mapped) + " mapped"
+        return ", " + format_bytes(usage.resident) + " in memory"
     
     def flushSourceFile(self, source_filename: str):
         """Force saves (flushes) the given source file
@@ -309,8 +628,59 @@ class TargetManager(QtWidgets.QToolBar):
 
         :param source_filename: Filename of source file to be flushed
         """
+        # SQLite catalogs have already written any change to disk
+        if isinstance(self._target_catalog[source_filename], SQLiteTargetCatalog):
+            return
         with open(source_filename, "w") as source_file:
-            source_file.write(yaml.dump(dict(self._target_catalog[source_filename])))
+            source_file.write(yaml.safe_dump(_plain_data(self._target_catalog[source_filename])))
+
+class target_list_model(QtCore.QAbstractListModel):
+    """List model of the targets of every loaded gGui Target Catalog, in load order
+    Target names are looked up only when Qt displays them, so adding a catalog takes constant time
+    """
+
+    def __init__(self, parent=None):
+        """Initializes an empty target list
+
+        :param parent: Qt parent of this model
+        """
+        super().__init__(parent)
+        # Per catalog: (path of the catalog, position -> target name lookup, first row, number of targets)
+        self._catalogs = []
+        self._row_count = 0
+
+    def add_catalog(self, target_catalog: str, targets):
+        """Appends the targets of a catalog to the list
+
+        :param target_catalog: Path of the gGui Target Catalog
+        :param targets: Dict of target name to target entry, or SQLiteTargetCatalog
+        """
+        if isinstance(targets, SQLiteTargetCatalog):
+            name_at = targets.name_at
+        else:
+            name_at = list(targets.keys()).__getitem__
+        if not len(targets):
+            return
+        self.beginInsertRows(QtCore.QModelIndex(), self._row_count, self._row_count + len(targets) - 1)
+        self._catalogs.append((target_catalog, name_at, self._row_count, len(targets)))
+        self._row_count += len(targets)
+        self.endInsertRows()
+
+    def rowCount(self, parent=QtCore.QModelIndex()) -> int:
+        return 0 if parent.isValid() else self._row_count
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        """Returns the target name (display role) or the target's catalog (user role) of a row"""
+        if not index.isValid() or role not in (QtCore.Qt.DisplayRole, QtCore.Qt.UserRole):
+            return None
+        row = index.row()
+        # Catalogs are few, so a linear search over them is cheaper than anything cleverer
+        for target_catalog, name_at, first_row, target_count in self._catalogs:
+            if first_row <= row < first_row + target_count:
+                if role == QtCore.Qt.UserRole:
+                    return {'target_catalog': target_catalog}
+                return name_at(row - first_row)
+        return None
 
 class target_note_display(QtWidgets.QGroupBox):
     """Subwidget to display notes of current target"""
@@ -409,3 +779,42 @@ class target_note_display(QtWidgets.QGroupBox):
         else:
             self.setTitle("Notes: Saved")
             self.setStyleSheet('QGroupBox:title {color: rgb(0, 150, 0);}')
+
+class switch_timing_panel(QtWidgets.QDockWidget):
+    """Dockable breakdown of how long the latest target switches took, phase by phase
+    Target switches are timed while the panel is shown (or a switch trace file is being written)
+    """
+
+    # Number of switches listed. Older ones are dropped
+    max_switches = 50
+
+    def __init__(self, parent=None):
+        super().__init__("Target Switch Timing", parent)
+        self.setObjectName("ggui_switch_timing_panel")
+        self._tree = QtWidgets.QTreeWidget(self)
+        self._tree.setHeaderLabels(["Switch / Phase", "Time (s)"])
+        self._tree.setRootIsDecorated(True)
+        self.setWidget(self._tree)
+        self._timer = switch_timer()
+        self._timer.add_listener(self.add_switch)
+        self.visibilityChanged.connect(self.panel_visibility_changed)
+
+    def panel_visibility_changed(self, visible: bool):
+        """Times switches while the panel is shown. A trace file keeps them timed regardless"""
+        if visible:
+            self._timer.enable()
+        elif not self._timer.trace_path:
+            self._timer.disable()
+
+    def add_switch(self, switch):
+        """Lists a finished switch at the top, with its phases underneath
+
+        :param switch: ggui.timing.TargetSwitch
+        """
+        switch_item = QtWidgets.QTreeWidgetItem(["#{0:d} {1}".format(switch.number, switch.target), "{0:.3f}".format(switch.total)])
+        for phase, total in switch.phase_totals().items():
+            switch_item.addChild(QtWidgets.QTreeWidgetItem([phase, "{0:.3f}".format(total)]))
+        self._tree.insertTopLevelItem(0, switch_item)
+        switch_item.setExpanded(self._tree.topLevelItemCount() == 1 or self._tree.topLevelItem(1).isExpanded())
+        while self._tree.topLevelItemCount() > self.max_switches:
+            self._tree.takeTopLevelItem(self._tree.topLevelItemCount() - 1)
@@ -0,0 +1,220 @@
+"""
+.. module:: timing
+    :synopsis: Timing spans of target switches, summarized per switch and optionally traced to a JSON-lines file
+.. moduleauthor:: Duy Nguyen <dnguyen@nrao.edu>
+"""
+
+import json
+import os
+import time
+from typing import Callable
+
+# Phases of a target switch, in the order they happen
+SWITCH_PHASES = ('unload', 'load_data', 'validate_attributes', 'data_collection_append', 'link_same', 'viewer_construction', 'draw')
+
+class _NoSpan:
+    """Stands in for a span while timing is off, so instrumented code costs one method call and nothing else"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        return False
+
+_NO_SPAN = _NoSpan()
+
+class _Span:
+    """Times one phase of the current target switch"""
+
+    def __init__(self, timer, phase: str, detail: dict):
+        self._timer = timer
+        self._phase = phase
+        self._detail = detail
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        self._timer.record(self._phase, self._start, time.perf_counter() - self._start, self._detail)
+        return False
+
+class TargetSwitch:
+    """Spans recorded during one target switch"""
+
+    def __init__(self, number: int, target: str):
+        self.number = number
+        self.target = target
+        self.start = time.perf_counter()
+        self.end = None
+        # (phase, seconds since the switch started, duration, detail)
+        self.spans = []
+        # Canvases whose first draw is still to come, and whether the switch itself is over
+        self.pending_draws = 0
+        self.switched = False
+
+    def phase_totals(self) -> dict:
+        """Returns the total time of every phase recorded, in SWITCH_PHASES order, then any others
+
+        :returns: dict of phase to seconds
+        """
+        totals = {}
+        for phase, _, duration, _ in self.spans:
+            totals[phase] = totals.get(phase, 0.0) + duration
+        return {phase: totals[phase] for phase in sorted(
+            totals, key=lambda phase: SWITCH_PHASES.index(phase) if phase in SWITCH_PHASES else len(SWITCH_PHASES))}
+
+    @property
+    def total(self) -> float:
+        """Wall time from the start of the switch to the last span"""
+        return (self.end or time.perf_counter()) - self.start
+
+    def summary(self) -> str:
+        """Returns a one line summary, e.g. for the status bar"""
+        return "Switched to {0} in {1:.2f} s: ".format(self.target, self.total) + ", ".join(
+            "{0} {1:.2f} s".format(phase, total) for phase, total in self.phase_totals().items())
+
+class SwitchTimer:
+    """Times the phases of target switches
+    Timing is off until enabled. While it is off, or outside of a switch, span() returns a shared no-op span.
+    A switch is reported to listeners once it is over and every viewer it built has been drawn once
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.trace_path = None
+        self._trace_file = None
+        self._switch = None
+        self._switch_count = 0
+        self._listeners = []
+
+    def enable(self, trace_path: str = None):
+        """Starts timing target switches
+
+        :param trace_path: JSON-lines file to append every span and switch summary to. None to keep the current one
+        """
+        if trace_path and trace_path != self.trace_path:
+            self.close_trace()
+            self._trace_file = open(trace_path, 'a', buffering=1)
+            self.trace_path = trace_path
+        self.enabled = True
+
+    def disable(self):
+        """Stops timing target switches. The trace file stays open, should timing be enabled again"""
+        self.enabled = False
+        self._switch = None
+
+    def close_trace(self):
+        """Closes the trace file"""
+        if self._trace_file is not None:
+            self._trace_file.close()
+        self._trace_file = None
+        self.trace_path = None
+
+    def add_listener(self, callback: Callable[[TargetSwitch], None]):
+        """Registers a function to call with every finished switch
+
+        :param callback: Function taking the TargetSwitch
+        """
+        self._listeners.append(callback)
+
+    def begin_switch(self, target: str):
+        """Starts timing a switch to a new primary target. A switch still waiting for draws is reported as is
+
+        :param target: Name of the new primary target
+        """
+        if not self.enabled:
+            return
+        if self._switch is not None:
+            self._finish(self._switch)
+        self._switch_count += 1
+        self._switch = TargetSwitch(self._switch_count, target)
+
+    def end_switch(self):
+        """Marks the switch as done, apart from the draws it is waiting for"""
+        if self._switch is None:
+            return
+        self._switch.switched = True
+        if not self._switch.pending_draws:
+            self._finish(self._switch)
+
+    def span(self, phase: str, **detail):
+        """Times a phase of the current switch, as a context manager
+
+        :param phase: Name of the phase, e.g. one of SWITCH_PHASES
+        :param detail: Further fields to trace with the span, e.g. the band
+        :returns: context manager
+        """
+        if self._switch is None:
+            return _NO_SPAN
+        return _Span(self, phase, detail)
+
+    def time_first_draw(self, canvas, **detail):
+        """Times the next draw of a matplotlib canvas as the 'draw' phase of the current switch
+
+        :param canvas: Canvas of a viewer the switch built
+        :param detail: Further fields to trace with the span, e.g. the data product type
+        """
+        switch = self._switch
+        if switch is None:
+            return
+        switch.pending_draws += 1
+        draw = canvas.draw
+
+        def timed_draw(*args, **kwargs):
+            # Back to the canvas's own draw for every later draw
+            del canvas.draw
+            start = time.perf_counter()
+            try:
+                return draw(*args, **kwargs)
+            finally:
+                if switch is self._switch:
+                    self.record('draw', start, time.perf_counter() - start, detail)
+                    switch.pending_draws -= 1
+                    if switch.switched and not switch.pending_draws:
+                        self._finish(switch)
+        canvas.draw = timed_draw
+
+    def record(self, phase: str, start: float, duration: float, detail: dict = None):
+        """Adds a span to the current switch
+
+        :param phase: Name of the phase
+        :param start: perf_counter time the span started at
+        :param duration: Length of the span, in seconds
+        :param detail: Further fields to trace with the span
+        """
+        switch = self._switch
+        if switch is None:
+            return
+        switch.spans.append((phase, start - switch.start, duration, detail or {}))
+        switch.end = start + duration
+        self._trace(dict(detail or {}, switch=switch.number, target=switch.target, phase=phase,
+                         start=round(start - switch.start, 6), duration=round(duration, 6)))
+
+    def _finish(self, switch: TargetSwitch):
+        if switch is self._switch:
+            self._switch = None
+        self._trace({'switch': switch.number, 'target': switch.target, 'time': time.time(), 'total': round(switch.total, 6),
+                     'phases': {phase: round(total, 6) for phase, total in switch.phase_totals().items()}})
+        for callback in self._listeners:
+            callback(switch)
+
+    def _trace(self, record: dict):
+        if self._trace_file is not None:
+            self._trace_file.write(json.dumps(record, default=str) + '\n')
+
+_switch_timer = None
+
+def switch_timer() -> SwitchTimer:
+    """Returns the target switch timer shared by gGui
+    Timing starts enabled, tracing to $GGUI_SWITCH_TRACE, if that is set
+
+    :returns: the SwitchTimer
+    """
+    global _switch_timer
+    if _switch_timer is None:
+        _switch_timer = SwitchTimer()
+        if os.environ.get('GGUI_SWITCH_TRACE'):
+            _switch_timer.enable(os.environ['GGUI_SWITCH_TRACE'])
+    return _switch_timer
@@ -0,0 +1,192 @@
+"""
+.. module:: watchdog
+    :synopsis: Detects stalls of the Qt event loop, and reports where gGui's main thread spent them
+.. moduleauthor:: Duy Nguyen <dnguyen@nrao.edu>
+"""
+
+from collections import Counter
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+
+from ggui.config import PACKAGE_DIRECTORY
+
+# Milliseconds between two heartbeats of the event loop
+HEARTBEAT_INTERVAL = 50
+
+# Seconds the event loop may lag behind its heartbeat before it counts as stalled
+STALL_THRESHOLD = 0.5
+
+# Seconds between two samples of the main thread's stack during a stall
+SAMPLE_INTERVAL = 0.01
+
+# Number of distinct stacks kept in a stall report
+REPORTED_STACKS = 20
+
+# gGui frames under which the event loop itself runs. They are on every stack, so they say nothing about a stall
+EVENT_LOOP_FRAMES = {'main.main'}
+
+def is_ggui_frame(filename: str) -> bool:
+    """Checks whether a stack frame runs gGui's own code"""
+    return filename.startswith(PACKAGE_DIRECTORY + os.sep)
+
+def frame_label(filename: str, function_name: str) -> str:
+    """Names a stack frame: 'module.function' for gGui frames, or its file's last two path parts and function otherwise"""
+    if is_ggui_frame(filename):
+        return os.path.splitext(os.path.relpath(filename, PACKAGE_DIRECTORY))[0].replace(os.sep, '.') + '.' + function_name
+    return '/'.join(filename.replace(os.sep, '/').split('/')[-2:]) + ':' + function_name
+
+def ggui_call_site(stack: tuple) -> str:
+    """Summarizes a sampled stack by the gGui functions on it, and where the time went past the innermost one
+
+    :param stack: Frames, outermost first, as (filename, function name) pairs
+    :returns: e.g. 'targetManager.setPrimaryTarget > targetManager.loadProduct > [readers.py:read_csv]'
+    """
+    ggui_frames = [index for index, (filename, function_name) in enumerate(stack)
+                   if is_ggui_frame(filename) and frame_label(filename, function_name) not in EVENT_LOOP_FRAMES]
+    if not ggui_frames:
+        return '[' + frame_label(*stack[-1]) + ']' if stack else '[idle]'
+    site = ' > '.join(frame_label(*stack[index]) for index in ggui_frames)
+    if ggui_frames[-1] != len(stack) - 1:
+        site += ' > [' + frame_label(*stack[-1]) + ']'
+    return site
+
+class StallWatchdog:
+    """Measures how late the Qt event loop runs a heartbeat timer, and samples the main thread's Python stack from a
+    side thread whenever the heartbeat is late by more than the threshold.
+    Every stall is reported (printed, and appended to the report file as a JSON line) with the gGui call sites it was
+    spent in. Call sites are also totalled over the whole run, and reported by stop()
+    """
+
+    def __init__(self, threshold: float = STALL_THRESHOLD, report_path: str = None, heartbeat_interval: int = HEARTBEAT_INTERVAL,
+                 sample_interval: float = SAMPLE_INTERVAL):
+        """
+        :param threshold: Seconds the event loop may lag before it counts as stalled
+        :param report_path: JSON-lines file to append stall reports to. None to only print them
+        :param heartbeat_interval: Milliseconds between two heartbeats
+        :param sample_interval: Seconds between two stack samples during a stall
+        """
+        self.threshold = threshold
+        self.report_path = report_path
+        self.heartbeat_interval = heartbeat_interval
+        self.sample_interval = sample_interval
+        # Latest heartbeat, and how late the event loop was for it
+        self.last_beat = None
+        self.beats = 0
+        self.max_latency = 0.0
+        self.total_latency = 0.0
+        # Stalls so far, their total length, and seconds spent per call site over all of them
+        self.stalls = 0
+        self.stalled_time = 0.0
+        self.call_site_time = Counter()
+        self._main_thread_id = threading.main_thread().ident
+        self._timer = None
+        self._stopping = threading.Event()
+        self._sampler = None
+        self._report_lock = threading.Lock()
+
+    def start(self):
+        """Starts the heartbeat, on the calling thread's Qt event loop, and the sampling thread"""
+        from PyQt5 import QtCore
+
+        self.last_beat = time.monotonic()
+        self._timer = QtCore.QTimer()
+        self._timer.setTimerType(QtCore.Qt.PreciseTimer)
+        self._timer.timeout.connect(self.beat)
+        self._timer.start(self.heartbeat_interval)
+        self._stopping.clear()
+        self._sampler = threading.Thread(target=self._watch, name='ggui-stall-watchdog', daemon=True)
+        self._sampler.start()
+
+    def stop(self) -> str:
+        """Stops watching, and reports the call sites of all stalls
+
+        :returns: the summary, also printed and appended to the report file
+        """
+        if self._timer is not None:
+            self._timer.stop()
+            self._timer = None
+        self._stopping.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+        summary = self.summary()
+        print(summary)
+        self._write_report({'type': 'summary', 'time': time.time(), 'beats': self.beats, 'stalls': self.stalls,
+                            'stalled_time': round(self.stalled_time, 3), 'max_latency': round(self.max_latency, 3),
+                            'mean_latency': round(self.total_latency / self.beats, 4) if self.beats else 0.0,
+                            'call_sites': {site: round(seconds, 3) for site, seconds in self.call_site_time.most_common()}})
+        return summary
+
+    def beat(self):
+        """Heartbeat. Runs on the event loop, every heartbeat_interval milliseconds if the loop keeps up"""
+        now = time.monotonic()
+        latency = max(0.0, now - self.last_beat - self.heartbeat_interval / 1000)
+        self.beats += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+        self.last_beat = now
+
+    def sample_main_thread(self) -> tuple:
+        """Returns the main thread's current Python stack
+
+        :returns: frames, outermost first, as (filename, function name) pairs
+        """
+        frame = sys._current_frames().get(self._main_thread_id)
+        if frame is None:
+            return ()
+        return tuple((frame.f_code.co_filename, frame.f_code.co_name) for frame, _ in traceback.walk_stack(frame))[::-1]
+
+    def _watch(self):
+        """Sampling thread: waits for the heartbeat to fall behind, then samples the main thread until it catches up"""
+        stall_beat = None
+        samples = Counter()
+        while not self._stopping.wait(self.sample_interval):
+            last_beat = self.last_beat
+            if stall_beat is not None and last_beat != stall_beat:
+                # The event loop is back
+                self._report_stall(last_beat - stall_beat - self.heartbeat_interval / 1000, samples)
+                stall_beat = None
+                samples = Counter()
+            if time.monotonic() - last_beat - self.heartbeat_interval / 1000 > self.threshold:
+                stall_beat = last_beat
+                samples[self.sample_main_thread()] += 1
+
+    def _report_stall(self, duration: float, samples: Counter):
+        """Prints a finished stall with its most sampled call sites, and appends it to the report file"""
+        sample_count = sum(samples.values())
+        call_sites = Counter()
+        for stack, count in samples.items():
+            call_sites[ggui_call_site(stack)] += count
+        self.stalls += 1
+        self.stalled_time += duration
+        for site, count in call_sites.items():
+            self.call_site_time[site] += duration * count / sample_count
+        print("WARNING: gGui was unresponsive for {0:.2f} s, in: ".format(duration) + "; ".join(
+            "{0} ({1:.0%})".format(site, count / sample_count) for site, count in call_sites.most_common(3)))
+        self._write_report({'type': 'stall', 'time': time.time(), 'duration': round(duration, 3), 'samples': sample_count,
+                            'call_sites': dict(call_sites.most_common()),
+                            # Collapsed stacks, as flame graph tools take them
+                            'stacks': {';'.join(frame_label(*frame) for frame in stack): count
+                                       for stack, count in samples.most_common(REPORTED_STACKS)}})
+
+    def _write_report(self, record: dict):
+        if not self.report_path:
+            return
+        with self._report_lock:
+            try:
+                with open(self.report_path, 'a') as report_file:
+                    report_file.write(json.dumps(record) + '\n')
+            except OSError as e:
+                print("WARNING: Unable to write the stall report to " + self.report_path + ": " + str(e))
+
+    def summary(self) -> str:
+        """Returns the totals of all stalls so far, by call site"""
+        if not self.stalls:
+            return "gGui stall watchdog: no stalls over {0:.2f} s in {1:d} heartbeats".format(self.threshold, self.beats)
+        return "gGui stall watchdog: {0:d} stalls, {1:.2f} s in total. Longest heartbeat delay {2:.2f} s. Time by call site:\n".format(
+            self.stalls, self.stalled_time, self.max_latency) + "\n".join(
+            "  {0:8.2f} s  {1}".format(seconds, site) for site, seconds in self.call_site_time.most_common(10))
@@ -108,7 +108,10 @@ setup(
     # py_modules=['mypackage'],
 
     entry_points={
-        'console_scripts': ['ggui=ggui.main:main'],
+        'console_scripts': ['ggui=ggui.main:main', 'ggui-autochop=ggui.autochop:main', 'ggui-make-catalog=ggui.catalog:main',
+                            'ggui-scan-catalog=ggui.catalog_scanner:main', 'ggui-convert-catalog=ggui.sqlite_catalog:main',
+                            'ggui-mast-search=ggui.mastCrossSearch:main', 'ggui-cross-search=ggui.cross_search:main',
+                            'ggui-sample-data=ggui.sample_data:main'],
     },
     install_requires=REQUIRED,
     extras_require=EXTRAS,